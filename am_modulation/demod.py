@@ -1,5 +1,7 @@
 import numpy as np
 
+from precision import Precision, cast
+
 
 def am_sync_demodulate(
     modulated_signal: np.ndarray, carrier_oscillator: np.ndarray
@@ -22,7 +24,9 @@ def am_sync_demodulate(
     return modulated_signal * carrier_oscillator
 
 
-def am_rectified_async_demodulate(modulated_signal: np.ndarray) -> np.ndarray:
+def am_rectified_async_demodulate(
+    modulated_signal: np.ndarray, precision: Precision = Precision.SINGLE
+) -> np.ndarray:
     """
     Asynchronous/NonCoherent Rectified/Full-Wave Envelope Detection
 
@@ -30,11 +34,12 @@ def am_rectified_async_demodulate(modulated_signal: np.ndarray) -> np.ndarray:
 
     The rectified signal also needs to be low-pass filtered to remove the high-frequency carrier and leave only the envelope.
     :param modulated_signal: the am modulated signal
+    :param precision: float32 or float64 output, the input is cast to it before rectifying
     :return: am demodulated signal
     """
 
     # Rectify the signal by taking the absolute value
-    return np.abs(modulated_signal)
+    return np.abs(cast(modulated_signal, precision))
 
 
 def am_squared_async_demodulate(modulated_signal: np.ndarray) -> np.ndarray:
@@ -0,0 +1,464 @@
+"""
+Throughput benchmarks of every stage of the decode chain and of the chain end to end.
+
+Inputs are deterministic synthetic captures at the sample rates the decoder is used at. Results can be saved as a JSON
+baseline and later runs compared against it, a stage whose throughput drops by more than the tolerance, or an end to
+end run that decodes fewer messages, fails the comparison.
+
+The cold import of every worker entry point is timed in a fresh interpreter too. Worker processes are started by the
+hundred, so each import has to stay within a budget and leave matplotlib and the heavy scipy subpackages unloaded.
+
+Usage:
+    python -m benchmarks --save baseline.json
+    python -m benchmarks --compare baseline.json --tolerance 0.2
+    python -m benchmarks --filter import --import-budget 0.5
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import scipy
+
+import resampling
+from am_modulation.demod import am_rectified_async_demodulate
+from benchmarks.signals import AUDIO_FS, BD, CARRIER_AMPLITUDE, SNR_DB, acars_capture, acars_messages
+from decimation import decimate
+from filters.fir_filter import filter_taps, low_pass_filter
+from normalization import normalize_burst, normalize_signal
+from resampling.multistage import resample_to
+from src.acars import DemodPlan, ToneDetector, demod, message_region_detection, parse_acars_message
+from src.batch import decode_samples
+from src.synthesis import burst_lengths, encode_frames, synthesize_bursts
+
+# The sample rates the decoder is run at, audio, the GNU Radio captures and the wideband captures
+SAMPLE_RATES = (48000, 1152000, 2400000)
+
+# Messages in each synthetic capture
+NUM_MESSAGES = 4
+
+# Bursts per synthesizer run
+NUM_BURSTS = 16
+
+# Timed runs per benchmark, the fastest is kept
+REPEAT = 5
+
+# Fractional throughput drop that fails a comparison
+TOLERANCE = 0.2
+
+BASELINE_VERSION = 1
+
+# Modules a worker process imports before its first decode
+IMPORT_MODULES = ("src.batch", "src.stream")
+
+# Most seconds a cold import of each of them may take
+IMPORT_BUDGET_SECONDS = 0.5
+
+# Modules the decode path only loads once a stage needs them
+DEFERRED_MODULES = ("matplotlib", "scipy.signal", "scipy.fft", "scipy.io")
+
+
+@dataclass
+class Benchmark:
+    name: str
+    fs: int
+    run: Callable[[], object]
+    num_samples: int = 0
+    num_messages: int = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@{self.fs}"
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    fs: int
+    seconds: float
+    samples_per_second: float
+    messages_per_second: float
+    # Messages the run produced, only counted for the end to end benchmarks
+    num_messages: int = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@{self.fs}"
+
+    @property
+    def throughput(self) -> float:
+        """
+        The figure compared against the baseline, samples per second where the stage takes samples
+        """
+        return self.samples_per_second or self.messages_per_second
+
+
+def build_benchmarks(sample_rates: tuple[int, ...] = SAMPLE_RATES, num_messages: int = NUM_MESSAGES) -> list[Benchmark]:
+    """
+    Build the inputs of every benchmark. The input of each stage is the output of the stage before it, computed
+    here so only the stage itself is timed
+    :param sample_rates: Sample rates of the captures, multiples of 48000
+    :param num_messages: Messages in each capture
+    :return: The benchmarks, per sample rate stages first then the stages that run on 48 kHz audio
+    """
+    samples_per_symbol = AUDIO_FS // BD
+    benchmarks = []
+
+    burst_messages = acars_messages(NUM_BURSTS)
+    _, frame_lengths = encode_frames(burst_messages)
+
+    for fs in sample_rates:
+        benchmarks.append(
+            Benchmark(
+                "synthesize_bursts",
+                fs,
+                lambda fs=fs: synthesize_bursts(
+                    burst_messages, fs, amplitude=CARRIER_AMPLITUDE, snr_db=SNR_DB, rng=0
+                ),
+                int(burst_lengths(frame_lengths, fs).sum()),
+                NUM_BURSTS,
+            )
+        )
+
+        capture = acars_capture(fs, num_messages)
+        rectified = am_rectified_async_demodulate(capture)
+        filtered = low_pass_filter(rectified, cutoff=5.5e3, fs=fs)
+
+        benchmarks.append(
+            Benchmark(
+                "am_rectified_async_demodulate", fs, lambda x=capture: am_rectified_async_demodulate(x), len(capture)
+            )
+        )
+        benchmarks.append(
+            Benchmark(
+                "low_pass_filter",
+                fs,
+                lambda x=rectified, fs=fs: low_pass_filter(x, cutoff=5.5e3, fs=fs),
+                len(rectified),
+            )
+        )
+
+        if fs != AUDIO_FS:
+            factor = fs // AUDIO_FS
+            taps = filter_taps(cutoff=5.5e3, fs=fs)
+            benchmarks.append(
+                Benchmark(
+                    "decimate",
+                    fs,
+                    lambda x=rectified, fs=fs, factor=factor, taps=taps: decimate(
+                        x, decimation_factor=factor, fs=fs, samples_per_symbol=samples_per_symbol * factor, taps=taps
+                    ),
+                    len(rectified),
+                )
+            )
+
+            divisor = math.gcd(AUDIO_FS, fs)
+            benchmarks.append(
+                Benchmark(
+                    "resample",
+                    fs,
+                    lambda x=filtered, up=AUDIO_FS // divisor, down=fs // divisor: resampling.resample(
+                        x, up=up, down=down, samples_per_symbol=samples_per_symbol
+                    ),
+                    len(filtered),
+                )
+            )
+
+            # The planned cascade filters and resamples in one go, so it starts from the rectified signal
+            benchmarks.append(
+                Benchmark(
+                    "resample_multistage",
+                    fs,
+                    lambda x=rectified, fs=fs: resample_to(x, fs, AUDIO_FS, passband=5.5e3),
+                    len(rectified),
+                )
+            )
+
+        benchmarks.append(
+            Benchmark(
+                "end_to_end",
+                fs,
+                lambda x=capture, fs=fs: len(decode_samples(x, fs)[0]),
+                len(capture),
+                num_messages,
+            )
+        )
+
+    # Everything after resampling runs at the audio rate whatever the capture rate
+    capture = acars_capture(AUDIO_FS, num_messages)
+    audio = low_pass_filter(am_rectified_async_demodulate(capture), cutoff=5.5e3, fs=AUDIO_FS)
+    bursts = [audio[start:end] for start, end in message_region_detection(audio)]
+    segments = [normalize_signal(burst) for burst in bursts]
+    demod_messages = [demod(segment, fs=AUDIO_FS, samples_per_symbol=samples_per_symbol) for segment in segments]
+
+    benchmarks.append(
+        Benchmark("message_region_detection", AUDIO_FS, lambda: message_region_detection(audio), len(audio))
+    )
+    benchmarks.append(
+        Benchmark(
+            "normalize_signal",
+            AUDIO_FS,
+            lambda: [normalize_signal(burst) for burst in bursts],
+            sum(len(burst) for burst in bursts),
+            len(bursts),
+        )
+    )
+    benchmarks.append(
+        Benchmark(
+            "normalize_burst",
+            AUDIO_FS,
+            lambda: [normalize_burst(burst, fs=AUDIO_FS) for burst in bursts],
+            sum(len(burst) for burst in bursts),
+            len(bursts),
+        )
+    )
+    benchmarks.append(
+        Benchmark(
+            "demod",
+            AUDIO_FS,
+            lambda: [demod(segment, fs=AUDIO_FS, samples_per_symbol=samples_per_symbol) for segment in segments],
+            sum(len(segment) for segment in segments),
+            len(segments),
+        )
+    )
+    benchmarks.append(
+        Benchmark(
+            "demod_sliding_dft",
+            AUDIO_FS,
+            lambda: [
+                demod(
+                    segment,
+                    fs=AUDIO_FS,
+                    samples_per_symbol=samples_per_symbol,
+                    tone_detector=ToneDetector.SLIDING_DFT,
+                )
+                for segment in segments
+            ],
+            sum(len(segment) for segment in segments),
+            len(segments),
+        )
+    )
+    demod_plan = DemodPlan(fs=AUDIO_FS, samples_per_symbol=samples_per_symbol)
+    benchmarks.append(
+        Benchmark(
+            "demod_plan",
+            AUDIO_FS,
+            lambda: [demod_plan.demod(segment) for segment in segments],
+            sum(len(segment) for segment in segments),
+            len(segments),
+        )
+    )
+    benchmarks.append(
+        Benchmark(
+            "demod_batch",
+            AUDIO_FS,
+            lambda: demod_plan.demod_batch(segments),
+            sum(len(segment) for segment in segments),
+            len(segments),
+        )
+    )
+    benchmarks.append(
+        Benchmark(
+            "parse_acars_message",
+            AUDIO_FS,
+            lambda: [parse_acars_message(message) for message in demod_messages],
+            num_messages=len(demod_messages),
+        )
+    )
+
+    return benchmarks
+
+
+def time_benchmark(benchmark: Benchmark, repeat: int = REPEAT) -> BenchmarkResult:
+    """
+    Time a benchmark after one warm up run
+    :param benchmark: The benchmark
+    :param repeat: Timed runs, the fastest is kept
+    :return: The result
+    """
+    output = benchmark.run()
+
+    seconds = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        benchmark.run()
+        seconds = min(seconds, time.perf_counter() - started)
+
+    return BenchmarkResult(
+        benchmark.name,
+        benchmark.fs,
+        seconds,
+        benchmark.num_samples / seconds,
+        benchmark.num_messages / seconds,
+        # End to end runs return the number of messages they decoded
+        output if isinstance(output, int) else 0,
+    )
+
+
+def time_import(module: str, repeat: int = REPEAT) -> tuple[float, list[str]]:
+    """
+    Time the import of a module in fresh interpreters
+    :param module: The module
+    :param repeat: Interpreters started, the fastest import is kept
+    :return: The import time in seconds and the deferred modules the import loaded
+    """
+    script = (
+        "import sys, time\n"
+        "started = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(time.perf_counter() - started)\n"
+        f"print(*[name for name in {DEFERRED_MODULES!r} if name in sys.modules])\n"
+    )
+
+    seconds = math.inf
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.splitlines()
+        seconds = min(seconds, float(output[0]))
+
+    return seconds, output[1].split()
+
+
+def check_imports(
+    modules: tuple[str, ...] = IMPORT_MODULES, budget: float = IMPORT_BUDGET_SECONDS, repeat: int = REPEAT
+) -> list[str]:
+    """
+    Time the imports of modules and check them against the budget
+    :param modules: The modules
+    :param budget: Most seconds an import may take
+    :param repeat: Interpreters started per module
+    :return: A description of every import over budget or loading a deferred module, empty if there are none
+    """
+    regressions = []
+    for module in modules:
+        seconds, loaded = time_import(module, repeat)
+        print(f"{'import ' + module:<40} {seconds * 1e3:9.2f} ms")
+
+        if seconds > budget:
+            regressions.append(f"import {module} took {seconds * 1e3:.0f} ms, the budget is {budget * 1e3:.0f} ms")
+        if loaded:
+            regressions.append(f"import {module} loaded {', '.join(loaded)}")
+
+    return regressions
+
+
+def save_baseline(results: list[BenchmarkResult], file_path: str) -> None:
+    """
+    Save results as a JSON baseline
+    :param results: The results
+    :param file_path: Path of the baseline
+    """
+    baseline = {
+        "version": BASELINE_VERSION,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "results": {result.key: asdict(result) for result in results},
+    }
+    with open(file_path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2)
+
+
+def load_baseline(file_path: str) -> dict[str, BenchmarkResult]:
+    """
+    Load a JSON baseline
+    :param file_path: Path of the baseline
+    :return: The baseline results by key
+    """
+    with open(file_path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    if baseline.get("version") != BASELINE_VERSION:
+        raise ValueError(f"{file_path} is baseline version {baseline.get('version')}, expected {BASELINE_VERSION}")
+
+    results = (BenchmarkResult(**result) for result in baseline["results"].values())
+    return {result.key: result for result in results}
+
+
+def compare(
+    results: list[BenchmarkResult], baseline: dict[str, BenchmarkResult], tolerance: float = TOLERANCE
+) -> list[str]:
+    """
+    Compare results against a baseline
+    :param results: The results
+    :param baseline: The baseline results by key
+    :param tolerance: Fractional throughput drop allowed
+    :return: A description of every regression, empty if there are none
+    """
+    regressions = []
+    for result in results:
+        reference = baseline.get(result.key)
+        if reference is None:
+            continue
+
+        if result.throughput < reference.throughput * (1 - tolerance):
+            regressions.append(
+                f"{result.key} throughput dropped {1 - result.throughput / reference.throughput:.0%} "
+                f"({reference.throughput:.4g}/s to {result.throughput:.4g}/s)"
+            )
+        if result.num_messages < reference.num_messages:
+            regressions.append(
+                f"{result.key} decoded {result.num_messages} messages, the baseline decoded {reference.num_messages}"
+            )
+
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the ACARS decode chain")
+    parser.add_argument("--fs", type=int, nargs="+", default=SAMPLE_RATES, help="Capture sample rates")
+    parser.add_argument("--messages", type=int, default=NUM_MESSAGES, help="Messages per capture")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Timed runs per benchmark")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--save", help="Save the results as a JSON baseline")
+    parser.add_argument("--compare", help="Compare against a JSON baseline, exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Fractional throughput drop allowed")
+    parser.add_argument(
+        "--import-budget", type=float, default=IMPORT_BUDGET_SECONDS, help="Most seconds a cold import may take"
+    )
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.compare) if args.compare else {}
+
+    results = []
+    for benchmark in build_benchmarks(tuple(args.fs), args.messages):
+        if args.filter and args.filter not in benchmark.name:
+            continue
+
+        result = time_benchmark(benchmark, args.repeat)
+        results.append(result)
+
+        reference = baseline.get(result.key)
+        change = f" {result.throughput / reference.throughput - 1:+.0%}" if reference else ""
+        print(
+            f"{result.key:<40} {result.seconds * 1e3:9.2f} ms "
+            f"{result.samples_per_second / 1e6:9.2f} MS/s {result.messages_per_second:10.1f} msg/s{change}"
+        )
+
+    if args.save:
+        save_baseline(results, args.save)
+
+    regressions = compare(results, baseline, args.tolerance)
+    # Import checks print as "import <module>" and are picked by the filter like the benchmarks
+    import_modules = tuple(module for module in IMPORT_MODULES if not args.filter or args.filter in f"import {module}")
+    if import_modules:
+        regressions.extend(check_imports(import_modules, budget=args.import_budget, repeat=args.repeat))
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
@@ -0,0 +1,58 @@
+"""
+Deterministic synthetic ACARS captures for the benchmarks.
+
+Every input is built from a fixed seed so runs on the same machine time the same work. Captures are AM modulated IQ
+in raw int16 counts, the scale the STD region detection threshold is tuned to.
+"""
+import numpy as np
+
+from src.acars import AcarsMessage
+from src.synthesis import synthesize_capture
+
+# Symbol rate is always 2400 for ACARS
+BD = 2400
+
+# Sample rate the audio is resampled to before demodulation
+AUDIO_FS = 48000
+
+# Carrier amplitude in int16 counts
+CARRIER_AMPLITUDE = 3000.0
+
+# About 0.3 counts of noise, quiet enough for the STD region detection threshold of 1 count
+SNR_DB = 77.0
+
+
+def acars_messages(num_messages: int) -> list[AcarsMessage]:
+    """
+    Downlink messages with varying registrations, sequences and texts
+    :param num_messages: Number of messages
+    :return: The messages
+    """
+    return [
+        AcarsMessage(
+            mode="2",
+            registration=f".N{index % 100000:05d}",
+            ack="\x15",
+            label="H1",
+            block_id="1",
+            stx=True,
+            sequence=f"M{index % 100:02d}A",
+            flight=f"AB{index % 10000:04d}",
+            text=f"BENCHMARK MESSAGE {index} THE QUICK BROWN FOX",
+        )
+        for index in range(num_messages)
+    ]
+
+
+def acars_capture(fs: int, num_messages: int, seed: int = 0) -> np.ndarray[np.complex64]:
+    """
+    AM modulated IQ with messages separated by silence
+    :param fs: Sample rate
+    :param num_messages: Number of messages
+    :param seed: Seed of the carrier phases and the noise
+    :return: The capture
+    """
+    capture, _ = synthesize_capture(
+        acars_messages(num_messages), fs, amplitude=CARRIER_AMPLITUDE, snr_db=SNR_DB, rng=seed
+    )
+    return capture
@@ -0,0 +1,169 @@
+import numpy as np
+
+from filters.fir_filter import filter_taps
+
+# VHF frequencies ACARS is commonly heard on
+ACARS_CHANNELS = (
+    129.125e6,
+    130.025e6,
+    130.425e6,
+    130.450e6,
+    131.125e6,
+    131.450e6,
+    131.475e6,
+    131.525e6,
+    131.550e6,
+    131.725e6,
+    136.700e6,
+    136.750e6,
+    136.800e6,
+    136.850e6,
+    136.900e6,
+    136.925e6,
+    136.975e6,
+)
+
+
+class PolyphaseChannelizer:
+    """
+    Polyphase FFT filter bank that splits a wideband IQ stream into narrowband channels in a single pass.
+
+    The band is divided into fs / channel_spacing branches. Every output sample folds the prototype low pass filter
+    over the branches and a single FFT then yields all channels at once, so the cost is shared by every channel
+    instead of running a mix, filter and decimate chain per channel. Channels are oversampled by `oversample` so the
+    transition band of the prototype filter does not alias into the channel.
+
+    Blocks of any size can be pushed with `process`, the filter history is carried between blocks.
+    """
+
+    def __init__(
+        self,
+        fs: float,
+        center_frequency: float,
+        channels: list[float] | tuple[float, ...] = ACARS_CHANNELS,
+        channel_spacing: float = 25e3,
+        oversample: int = 2,
+        taps_per_branch: int = 12,
+        cutoff: float | None = None,
+    ):
+        """
+        :param fs: Sample rate of the wideband signal. Must be a multiple of the channel spacing
+        :param center_frequency: Center frequency the wideband signal was tuned to
+        :param channels: Channel frequencies to extract. Channels outside the captured band are skipped
+        :param channel_spacing: Spacing of the filter bank branches
+        :param oversample: Channel sample rate as a multiple of the channel spacing
+        :param taps_per_branch: Number of prototype filter taps per branch
+        :param cutoff: Cutoff frequency of the prototype filter, defaults to half the channel spacing
+        """
+        num_branches = fs / channel_spacing
+        if num_branches != int(num_branches):
+            raise ValueError("Sample rate must be a multiple of the channel spacing.")
+        num_branches = int(num_branches)
+        if num_branches % oversample != 0:
+            raise ValueError("Number of branches must be a multiple of the oversample factor.")
+
+        self.fs = fs
+        self.num_branches = num_branches
+        self.decimation_factor = num_branches // oversample
+        self.fs_out = fs / self.decimation_factor
+
+        # Map every channel to its branch and the offset left over from the branch center
+        self.channels = []
+        self._bins = []
+        self._residuals = []
+        for channel in channels:
+            offset = channel - center_frequency
+            if abs(offset) > (fs - channel_spacing) / 2:
+                continue
+            branch = int(round(offset / channel_spacing))
+            self.channels.append(channel)
+            self._bins.append(branch % num_branches)
+            self._residuals.append(offset - branch * channel_spacing)
+        self._bins = np.array(self._bins, dtype=int)
+        self._residuals = np.array(self._residuals)
+
+        # Prototype filter, zero padded to a whole number of branches
+        num_taps = num_branches * taps_per_branch
+        cutoff = channel_spacing / 2 if cutoff is None else cutoff
+        self._taps = filter_taps(cutoff=cutoff, fs=fs, num_taps=num_taps - 1)
+        self._taps = np.append(self._taps, np.float32(0)).reshape(taps_per_branch, num_branches)
+
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Drop the filter history and restart the stream at sample 0
+        """
+        # Zero history so the first output only sees the first sample, like lfilter
+        self._history = np.zeros(self._taps.size - 1, dtype=np.complex64)
+        self._history_start = -len(self._history)
+        self._next_output = 0
+
+    def process(self, block: np.ndarray[np.complex64]) -> dict[float, np.ndarray[np.complex64]]:
+        """
+        Channelize the next block of the wideband stream
+        :param block: The next IQ samples of the stream
+        :return: A mapping of channel frequency to the channel samples produced by this block
+        """
+        num_branches = self.num_branches
+        decimation_factor = self.decimation_factor
+
+        signal = np.concatenate((self._history, np.asarray(block, dtype=np.complex64)))
+        last_sample = self._history_start + len(signal) - 1
+
+        # Outputs are produced every decimation_factor input samples, output n ends on sample n * decimation_factor
+        num_outputs = max(last_sample // decimation_factor - self._next_output + 1, 0)
+        last_output_sample = self._next_output * decimation_factor - self._history_start
+
+        # Fold the prototype filter over the branches, one branch wide window per filter segment
+        folded = np.zeros((num_outputs, num_branches), dtype=np.complex64)
+        windows = np.lib.stride_tricks.sliding_window_view(signal, num_branches)
+        for segment, taps in enumerate(self._taps):
+            start = last_output_sample - segment * num_branches - num_branches + 1
+            rows = windows[start : start + num_outputs * decimation_factor : decimation_factor]
+            folded += rows * taps[::-1]
+
+        # Windows run forwards in time and the filter backwards so flip back before the FFT
+        spectrum = np.fft.ifft(folded[:, ::-1], axis=1)[:, self._bins] * num_branches
+
+        # Undo the phase rotation of each output and remove what is left of the channel offset
+        sample_times = (self._next_output + np.arange(num_outputs))[:, None] * decimation_factor
+        spectrum *= np.exp(-2j * np.pi * sample_times * (self._bins / num_branches + self._residuals / self.fs))
+
+        # Keep just enough samples for the next block
+        self._next_output += num_outputs
+        keep_from = self._next_output * decimation_factor - (self._taps.size - 1)
+        self._history = signal[keep_from - self._history_start :]
+        self._history_start = keep_from
+
+        spectrum = spectrum.astype(np.complex64)
+        return {channel: spectrum[:, index] for index, channel in enumerate(self.channels)}
+
+
+def channelize(
+    signal: np.ndarray[np.complex64],
+    fs: float,
+    center_frequency: float,
+    channels: list[float] | tuple[float, ...] = ACARS_CHANNELS,
+    channel_spacing: float = 25e3,
+    oversample: int = 2,
+) -> tuple[dict[float, np.ndarray[np.complex64]], float]:
+    """
+    Split a wideband IQ signal into narrowband channels
+    :param signal: The wideband IQ signal
+    :param fs: Sample rate of the wideband signal
+    :param center_frequency: Center frequency the wideband signal was tuned to
+    :param channels: Channel frequencies to extract
+    :param channel_spacing: Spacing of the filter bank branches
+    :param oversample: Channel sample rate as a multiple of the channel spacing
+    :return: A mapping of channel frequency to channel samples and the channel sample rate
+    """
+    channelizer = PolyphaseChannelizer(
+        fs=fs,
+        center_frequency=center_frequency,
+        channels=channels,
+        channel_spacing=channel_spacing,
+        oversample=oversample,
+    )
+
+    return channelizer.process(signal), channelizer.fs_out
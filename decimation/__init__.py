@@ -1,8 +1,10 @@
 import numpy as np
 
+import metrics
+
 
 def decimate(
-    signal, decimation_factor: int, fs: float, samples_per_symbol: int
+    signal, decimation_factor: int, fs: float, samples_per_symbol: int, taps: np.ndarray | None = None
 ) -> tuple[np.ndarray, float, int]:
     """
     Decimate a signal by a factor
@@ -10,11 +12,180 @@ def decimate(
     :param decimation_factor: The factor to decimate by
     :param fs: The sample rate of the signal. Ideally this should be divisible by the decimation factor
     :param samples_per_symbol: Number of samples per symbol. Ideally this should be divisible by the decimation factor
+    :param taps: Optional anti-aliasing filter taps. When given the signal is filtered and decimated in one polyphase
+        pass that only computes the kept samples, the same as a 'same' convolution followed by decimation
     :return: The decimated signal
     """
 
+    if taps is not None:
+        decimated_signal = decimating_fir(signal, taps, decimation_factor)
+    else:
+        decimated_signal = signal[::decimation_factor]
+
     return (
-        signal[::decimation_factor],
+        decimated_signal,
         fs // decimation_factor,
         samples_per_symbol // decimation_factor,
     )
+
+
+def _filter_delay(num_taps: int, convolution_mode: str) -> int:
+    """
+    Index of the full convolution that lines up with the first output sample of a convolution mode
+    :param num_taps: Number of taps
+    :param convolution_mode: Convolution Mode 'valid' 'same' or 'full'
+    :return: The delay in samples
+    """
+    if convolution_mode == "full":
+        return 0
+    if convolution_mode == "same":
+        return (num_taps - 1) // 2
+    if convolution_mode == "valid":
+        return num_taps - 1
+    raise ValueError("Invalid convolution mode")
+
+
+def _decimated_convolution(signal: np.ndarray, taps: np.ndarray, factor: int, start: int, num_outputs: int) -> np.ndarray:
+    """
+    Samples start, start + factor, ... of the full convolution of a signal with taps, computed with a polyphase filter
+    :param signal: The signal to filter
+    :param taps: Filter taps
+    :param factor: The decimation factor
+    :param start: Index of the full convolution of the first output sample
+    :param num_outputs: Number of output samples
+    :return: The filtered and decimated signal
+    """
+    from scipy.signal import upfirdn
+
+    # upfirdn computes full convolution samples 0, factor, ... so delay the signal until start lands on one of them
+    lead = -start % factor
+    signal = np.concatenate((np.zeros(lead, dtype=signal.dtype), signal))
+    first_output = (start + lead) // factor
+
+    return upfirdn(taps, signal, up=1, down=factor)[first_output : first_output + num_outputs]
+
+
+def decimating_fir(
+    signal: np.ndarray, taps: np.ndarray, factor: int, convolution_mode: str = "same"
+) -> np.ndarray:
+    """
+    Filter and decimate a signal in one pass.
+
+    The polyphase structure only evaluates the output samples that are kept, so it costs 1/factor of filtering
+    followed by decimation. The result is the same as np.convolve(signal, taps, convolution_mode)[::factor].
+    :param signal: The signal to filter and decimate
+    :param taps: Filter taps
+    :param factor: The decimation factor
+    :param convolution_mode: Convolution Mode 'valid' 'same' or 'full'
+    :return: The filtered and decimated signal
+    """
+    signal = np.asarray(signal)
+
+    # Filter in the precision of the signal
+    dtype = np.result_type(signal.dtype, np.float32)
+    taps = np.asarray(taps, dtype=np.finfo(dtype).dtype)
+
+    # Length of the convolution in the requested mode, like np.convolve
+    if convolution_mode == "full":
+        num_samples = len(signal) + len(taps) - 1
+    elif convolution_mode == "same":
+        num_samples = max(len(signal), len(taps))
+    else:
+        num_samples = max(len(signal), len(taps)) - min(len(signal), len(taps)) + 1
+
+    with metrics.stage("decimating_fir", samples_in=len(signal)) as timer:
+        output = _decimated_convolution(
+            signal.astype(dtype, copy=False),
+            taps,
+            factor,
+            # np.convolve centers on the shorter of the two inputs
+            start=_filter_delay(min(len(signal), len(taps)), convolution_mode),
+            num_outputs=-(-num_samples // factor),
+        )
+        timer.samples_out = len(output)
+
+    return output
+
+
+class DecimatingFir:
+    """
+    Streaming version of decimating_fir.
+
+    Blocks of any size can be pushed with `process`, the filter history and the decimation phase are carried between
+    blocks so the concatenated output is the same as decimating_fir over the whole signal once `flush` is called.
+    """
+
+    def __init__(self, taps: np.ndarray, factor: int, convolution_mode: str = "same"):
+        """
+        :param taps: Filter taps
+        :param factor: The decimation factor
+        :param convolution_mode: 'full' or 'same' alignment of the output samples
+        """
+        if convolution_mode not in ("full", "same"):
+            raise ValueError("Invalid convolution mode")
+
+        self.taps = np.asarray(taps)
+        self.factor = factor
+        self.convolution_mode = convolution_mode
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Drop the filter history and restart the stream at sample 0
+        """
+        self._history = np.zeros(len(self.taps) - 1, dtype=np.float32)
+        self._num_samples = 0
+        self._next_output = _filter_delay(len(self.taps), self.convolution_mode)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Filter and decimate the next block of the stream
+        :param block: The next samples of the stream
+        :return: The output samples that became available with this block
+        """
+        block = np.asarray(block)
+        dtype = np.result_type(block.dtype, self._history.dtype, np.float32)
+
+        # Absolute index of the first buffered sample
+        signal = np.concatenate((self._history.astype(dtype, copy=False), block.astype(dtype, copy=False)))
+        signal_start = self._num_samples - len(self._history)
+        self._num_samples += len(block)
+
+        # An output sample needs the input sample it lines up with
+        num_outputs = max(-(-(self._num_samples - self._next_output) // self.factor), 0)
+
+        # Start the slice a filter length before the first output sample, the filter only needs that far back
+        slice_start = self._next_output - (len(self.taps) - 1) - signal_start
+        with metrics.stage("decimating_fir", samples_in=len(block)) as timer:
+            output = _decimated_convolution(
+                signal[slice_start:],
+                np.asarray(self.taps, dtype=np.finfo(dtype).dtype),
+                self.factor,
+                start=len(self.taps) - 1,
+                num_outputs=num_outputs,
+            )
+            timer.samples_out = len(output)
+
+        self._next_output += num_outputs * self.factor
+        keep_from = self._next_output - (len(self.taps) - 1) - signal_start
+        self._history = signal[max(keep_from, 0) :]
+
+        return output
+
+    def flush(self) -> np.ndarray:
+        """
+        Push zeros through the filter so the tail of the convolution comes out, then reset.
+        Matches decimating_fir for streams at least as long as the filter.
+        :return: The remaining output samples
+        """
+        num_samples = self._num_samples
+
+        # Zeros to the end of the convolution in the chosen mode
+        if self.convolution_mode == "full":
+            end = num_samples + len(self.taps) - 1
+        else:
+            end = num_samples + _filter_delay(len(self.taps), "same")
+
+        output = self.process(np.zeros(max(end - num_samples, 0), dtype=self._history.dtype))
+        self.reset()
+        return output
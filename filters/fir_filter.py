@@ -1,23 +1,130 @@
+from functools import lru_cache
+
 import numpy as np
-from scipy.signal import firwin
+
+import metrics
+from precision import Precision, cast
+
+# Number of filter designs kept by filter_taps, least recently used designs are evicted first
+TAP_CACHE_SIZE = 64
+
+# Below this many samples the FFT setup costs more than direct convolution saves
+FFT_MIN_SIGNAL_LENGTH = 8192
+
+# Direct convolution cost per sample in real multiplies, complex signals count 4 per tap
+FFT_MIN_TAP_COST = 80
 
 
 def filter_taps(
-    cutoff: float | np.ndarray, fs: float, num_taps: int = 101, **kwargs
+    cutoff: float | np.ndarray, fs: float, num_taps: int = 101, precision: Precision = Precision.SINGLE, **kwargs
 ) -> np.ndarray:
     """
     Create filter taps for a filter.
+
+    Designs are cached on (cutoff, fs, num_taps, kwargs, precision) so repeated calls with the same parameters skip
+    firwin. Every call returns its own copy of the cached taps.
     :param cutoff: Cutoff frequency
     :param fs: Sample rate of signal to filter
     :param num_taps: Number of taps
+    :param precision: Precision of the taps, they are designed in float64 either way
     :param kwargs:
     :return: Filter taps
     """
+    return _shared_taps(cutoff, fs, num_taps, precision, **kwargs).copy()
+
+
+def _shared_taps(
+    cutoff: float | np.ndarray, fs: float, num_taps: int = 101, precision: Precision = Precision.SINGLE, **kwargs
+) -> np.ndarray:
+    """
+    filter_taps without the copy, the read only cached taps themselves
+    """
+    # Arrays and lists are not hashable so key on tuples
+    cutoff_key = tuple(np.atleast_1d(cutoff).tolist()) if np.ndim(cutoff) else float(cutoff)
+    kwargs_key = tuple(sorted((key, _hashable(value)) for key, value in kwargs.items()))
+    key = (cutoff_key, fs, num_taps, kwargs_key, Precision(precision))
+
+    try:
+        hash(key)
+    except TypeError:
+        # Some argument still isn't hashable, design without the cache
+        return _design_taps.__wrapped__(*key)
+    return _design_taps(*key)
+
+
+@lru_cache(maxsize=TAP_CACHE_SIZE)
+def _design_taps(
+    cutoff: float | tuple[float, ...],
+    fs: float,
+    num_taps: int,
+    kwargs: tuple[tuple[str, object], ...],
+    precision: Precision,
+) -> np.ndarray:
+    """
+    Design filter taps, see filter_taps
+    :param cutoff: Cutoff frequency or frequencies
+    :param fs: Sample rate of signal to filter
+    :param num_taps: Number of taps
+    :param kwargs: firwin keyword arguments as (key, value) pairs
+    :param precision: Precision the taps are rounded to once designed
+    :return: Read only filter taps
+    """
+    # scipy.signal is most of the import time of the package, it is only loaded once a filter is designed
+    from scipy.signal import firwin
+
     # Use Firwin function to generate taps
-    taps = firwin(numtaps=num_taps, cutoff=cutoff, fs=fs, **kwargs).astype(np.float32)
+    taps = firwin(numtaps=num_taps, cutoff=cutoff, fs=fs, **dict(kwargs))
+
+    # Normalize the filter taps to avoid unity gain, in float64 so DOUBLE doesn't inherit float32 rounding
+    taps = (taps / np.sum(taps)).astype(precision.real_dtype)
+
+    # Every caller shares the cached array
+    taps.setflags(write=False)
+    return taps
 
-    # Normalize the filter taps to avoid unity gain
-    return taps / np.sum(taps)
+
+def _hashable(value):
+    """
+    Turn lists and arrays in filter arguments into tuples so they can be part of a cache key
+    :param value: Argument value
+    :return: Hashable argument value
+    """
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
+def convolve(
+    signal: np.ndarray, taps: np.ndarray, convolution_mode: str = "same", method: str = "auto"
+) -> np.ndarray:
+    """
+    Convolve a signal with filter taps, keeping the precision of the signal.
+    :param signal: The Signal to filter
+    :param taps: Filter taps
+    :param convolution_mode: Convolution Mode 'valid' 'same' or 'full'
+    :param method: 'direct', 'fft' (overlap-add) or 'auto' to choose from the signal length and number of taps.
+        'same' with fewer samples than taps returns len(signal) samples with 'fft' and len(taps) with 'direct'.
+    :return: The Filtered Signal
+    """
+    signal = np.asarray(signal)
+
+    # Filter in the precision of the signal, float32 taps must not promote complex64 and vice versa
+    dtype = np.result_type(signal.dtype, np.float32)
+    taps = np.asarray(taps, dtype=np.finfo(dtype).dtype)
+
+    if method == "auto":
+        tap_cost = len(taps) * (4 if np.iscomplexobj(signal) else 1)
+        use_fft = len(signal) >= FFT_MIN_SIGNAL_LENGTH and tap_cost >= FFT_MIN_TAP_COST
+    elif method in ("direct", "fft"):
+        use_fft = method == "fft"
+    else:
+        raise ValueError("Invalid convolution method")
+
+    if use_fft:
+        from scipy.signal import oaconvolve
+
+        return oaconvolve(signal.astype(dtype, copy=False), taps, mode=convolution_mode).astype(dtype, copy=False)
+    return np.convolve(signal.astype(dtype, copy=False), taps, mode=convolution_mode)
 
 
 def low_pass_filter(
@@ -26,6 +133,8 @@ def low_pass_filter(
     fs: float,
     convolution_mode: str = "same",
     num_taps: int = 101,
+    method: str = "auto",
+    precision: Precision | None = None,
     **kwargs,
 ) -> np.ndarray:
     """
@@ -35,12 +144,25 @@ def low_pass_filter(
     :param fs: Sample Rate of Signal to filter
     :param convolution_mode: Convolution Mode 'valid' 'same' or 'full'
     :param num_taps: Number of taps
+    :param method: Convolution method 'direct', 'fft' or 'auto'
+    :param precision: Precision the signal is filtered in, real signals stay real and complex stay complex. Defaults
+        to the precision of the signal, integer samples are filtered in the precision numpy promotes them to with
+        float32
     :param kwargs:
     :return: The Filtered Signal
     """
+    signal = np.asarray(signal)
+    if precision is None:
+        real_dtype = np.finfo(np.result_type(signal.dtype, np.float32)).dtype
+        precision = Precision.DOUBLE if real_dtype == np.float64 else Precision.SINGLE
+    signal = cast(signal, precision)
 
-    # Generate Taps
-    taps = filter_taps(cutoff=cutoff, fs=fs, num_taps=num_taps, **kwargs)
+    # Generate Taps, the cached ones are only read
+    taps = _shared_taps(cutoff, fs, num_taps, precision, **kwargs)
 
     # Convolve the Sin
-    return np.convolve(signal, taps, mode=convolution_mode)
+    with metrics.stage("low_pass_filter", samples_in=len(signal)) as timer:
+        filtered = convolve(signal, taps, convolution_mode=convolution_mode, method=method)
+        timer.samples_out = len(filtered)
+
+    return filtered
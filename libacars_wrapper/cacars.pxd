@@ -10,7 +10,7 @@ cdef extern from "<sys/time.h>":
     ctypedef struct timeval:
         pass
 
-cdef extern from "libacars/acars.h":
+cdef extern from "libacars/acars.h" nogil:
     cdef clibacars.la_type_descriptor la_DEF_acars_message
 
     ctypedef struct la_acars_msg:
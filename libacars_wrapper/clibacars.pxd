@@ -3,7 +3,7 @@ cimport cvstring
 cdef extern from "libacars/version.h":
     pass
 
-cdef extern from "libacars/libacars.h":
+cdef extern from "libacars/libacars.h" nogil:
     ctypedef enum la_msg_dir:
         LA_MSG_DIR_UNKNOWN
         LA_MSG_DIR_GND2AIR
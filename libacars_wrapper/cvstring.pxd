@@ -1,4 +1,4 @@
-cdef extern from "libacars/vstring.h":
+cdef extern from "libacars/vstring.h" nogil:
     ctypedef struct la_vstring:
         char *str;
 
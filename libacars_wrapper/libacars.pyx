@@ -14,7 +14,7 @@ cimport ccpdlc
 # from Cython.Includes.libc.stdlib import malloc
 from libc.stdint cimport uint8_t
 # TODO Need to Figure out how to import malloc and free
-from cython.cimports.libc.stdlib import malloc, free
+from cython.cimports.libc.stdlib import malloc, calloc, free
 
 from cpython cimport bool
 # from libc.stdlib import malloc, free
@@ -57,12 +57,13 @@ cdef class PyList:
     # Define as la_list since list is a type and might be confusing
     cdef clist.la_list *_c_la_list
     cdef bint _c_la_list_owner
+    # Wrapper owning the memory a borrowed pointer points into, kept alive as long as this wrapper
+    cdef object _parent
 
     def __cinit__(self):
+        # from_ptr and new_struct set the pointer, allocating one here would leak it
         self._c_la_list_owner = False
-        self._c_la_list = clist.la_list_append(NULL, NULL)
-        if self._c_la_list is NULL:
-            raise MemoryError()
+        self._c_la_list = NULL
 
 
     def __dealloc__(self):
@@ -77,14 +78,14 @@ cdef class PyList:
     @property
     def data(self):
         # TODO data isn't always adsc_tag_t so need to find out what to cast to
-        return PyAdscTagT.from_ptr(<cadsc.la_adsc_tag_t *>self._c_la_list.data) if self._c_la_list is not NULL else None
+        return PyAdscTagT.from_ptr(<cadsc.la_adsc_tag_t *>self._c_la_list.data, False, self) if self._c_la_list is not NULL else None
 
     @property
     def next(self):
-        return PyList.from_ptr(self._c_la_list.next) if self._c_la_list is not NULL else None
+        return PyList.from_ptr(self._c_la_list.next, False, self) if self._c_la_list is not NULL else None
 
     @staticmethod
-    cdef PyList from_ptr(clist.la_list *_c_la_list, bint owner=False):
+    cdef PyList from_ptr(clist.la_list *_c_la_list, bint owner=False, object parent=None):
         """
         Factory function to create PyList objects from
         given _c_la_list pointer.
@@ -93,6 +94,7 @@ cdef class PyList:
         cdef PyList wrapper = PyList.__new__(PyList)
         wrapper._c_la_list = _c_la_list
         wrapper._c_la_list_owner = owner
+        wrapper._parent = parent
         return wrapper
 
     @staticmethod
@@ -121,10 +123,9 @@ cdef class PyVString:
     cdef bint _c_vstring_owner
 
     def __cinit__(self):
+        # from_ptr and new_struct set the pointer, allocating one here would leak it
         self._c_vstring_owner = False
-        self._c_vstring = cvstring.la_vstring_new()
-        if self._c_vstring is NULL:
-            raise MemoryError()
+        self._c_vstring = NULL
 
     def __dealloc__(self):
         if self._c_vstring is not NULL and self._c_vstring_owner is True:
@@ -175,6 +176,8 @@ cdef class PyTypeDescriptor:
 
     cdef clibacars.la_type_descriptor *_c_type_descriptor
     cdef bint _c_type_descriptor_owner
+    # Wrapper owning the memory a borrowed pointer points into, kept alive as long as this wrapper
+    cdef object _parent
 
     def __cinit__(self):
         self._c_type_descriptor_owner = False
@@ -194,7 +197,7 @@ cdef class PyTypeDescriptor:
         return self._c_type_descriptor.json_key if self._c_type_descriptor is not NULL else None
 
     @staticmethod
-    cdef PyTypeDescriptor from_ptr(clibacars.la_type_descriptor *_c_type_descriptor, bint owner=False):
+    cdef PyTypeDescriptor from_ptr(clibacars.la_type_descriptor *_c_type_descriptor, bint owner=False, object parent=None):
         """
         Factory function to create PyTypeDescriptor objects from
         given _c_type_descriptor pointer.
@@ -203,6 +206,7 @@ cdef class PyTypeDescriptor:
         cdef PyTypeDescriptor wrapper = PyTypeDescriptor.__new__(PyTypeDescriptor)
         wrapper._c_type_descriptor = _c_type_descriptor
         wrapper._c_type_descriptor_owner = owner
+        wrapper._parent = parent
         return wrapper
 
     @staticmethod
@@ -225,6 +229,8 @@ cdef class PyAcarsMessage:
 
     cdef cacars.la_acars_msg *_c_acars_msg
     cdef bint _c_acars_msg_owner
+    # Wrapper owning the memory a borrowed pointer points into, kept alive as long as this wrapper
+    cdef object _parent
 
     def __cinit__(self):
         self._c_acars_msg_owner = False
@@ -300,7 +306,7 @@ cdef class PyAcarsMessage:
         return self._c_acars_msg.txt if self._c_acars_msg is not NULL else None
 
     @staticmethod
-    cdef PyAcarsMessage from_ptr(cacars.la_acars_msg *_c_acars_msg, bint owner=False):
+    cdef PyAcarsMessage from_ptr(cacars.la_acars_msg *_c_acars_msg, bint owner=False, object parent=None):
         """
         Factory function to create PyAcarsMessage objects from
         given _c_acars_msg pointer.
@@ -309,6 +315,7 @@ cdef class PyAcarsMessage:
         cdef PyAcarsMessage wrapper = PyAcarsMessage.__new__(PyAcarsMessage)
         wrapper._c_acars_msg = _c_acars_msg
         wrapper._c_acars_msg_owner = owner
+        wrapper._parent = parent
         return wrapper
 
     @staticmethod
@@ -348,6 +355,8 @@ cdef class PyArincMessage:
 
     cdef carinc.la_arinc_msg *_c_arinc_msg
     cdef bint _c_arinc_msg_owner
+    # Wrapper owning the memory a borrowed pointer points into, kept alive as long as this wrapper
+    cdef object _parent
 
     def __cinit__(self):
         self._c_arinc_msg_owner = False
@@ -379,7 +388,7 @@ cdef class PyArincMessage:
         return self._c_arinc_msg.crc_ok if self._c_arinc_msg is not NULL else False
 
     @staticmethod
-    cdef PyArincMessage from_ptr(carinc.la_arinc_msg *_c_arinc_msg, bint owner=False):
+    cdef PyArincMessage from_ptr(carinc.la_arinc_msg *_c_arinc_msg, bint owner=False, object parent=None):
         """
         Factory function to create PyArincMessage objects from
         given _c_arinc_msg pointer.
@@ -388,6 +397,7 @@ cdef class PyArincMessage:
         cdef PyArincMessage wrapper = PyArincMessage.__new__(PyArincMessage)
         wrapper._c_arinc_msg = _c_arinc_msg
         wrapper._c_arinc_msg_owner = owner
+        wrapper._parent = parent
         return wrapper
 
     @staticmethod
@@ -412,6 +422,8 @@ cdef class PyAdscTagT:
     """
     cdef cadsc.la_adsc_tag_t *_c_adsc_tag_t
     cdef bint _c_adsc_tag_t_owner
+    # Wrapper owning the memory a borrowed pointer points into, kept alive as long as this wrapper
+    cdef object _parent
 
     def __cinit__(self):
         self._c_adsc_tag_t_owner = False
@@ -427,7 +439,7 @@ cdef class PyAdscTagT:
         raise TypeError("This class cannot be instantiated directly.")
 
     @staticmethod
-    cdef PyAdscTagT from_ptr(cadsc.la_adsc_tag_t *_c_adsc_tag_t, bint owner=False):
+    cdef PyAdscTagT from_ptr(cadsc.la_adsc_tag_t *_c_adsc_tag_t, bint owner=False, object parent=None):
         """
         Factory function to create PyAdscTagT objects from
         given _c_adsc_tag_t pointer.
@@ -436,6 +448,7 @@ cdef class PyAdscTagT:
         cdef PyAdscTagT wrapper = PyAdscTagT.__new__(PyAdscTagT)
         wrapper._c_adsc_tag_t = _c_adsc_tag_t
         wrapper._c_adsc_tag_t_owner = owner
+        wrapper._parent = parent
         return wrapper
 
     @staticmethod
@@ -458,6 +471,8 @@ cdef class PyAdscMessageT:
     """
     cdef cadsc.la_adsc_msg_t *_c_adsc_msg_t
     cdef bint _c_adsc_msg_t_owner
+    # Wrapper owning the memory a borrowed pointer points into, kept alive as long as this wrapper
+    cdef object _parent
 
     def __cinit__(self):
         self._c_adsc_msg_t_owner = False
@@ -478,10 +493,10 @@ cdef class PyAdscMessageT:
 
     @property
     def tag_list(self):
-        return PyList.from_ptr(self._c_adsc_msg_t.tag_list) if self._c_adsc_msg_t is not NULL else None
+        return PyList.from_ptr(self._c_adsc_msg_t.tag_list, False, self) if self._c_adsc_msg_t is not NULL else None
 
     @staticmethod
-    cdef PyAdscMessageT from_ptr(cadsc.la_adsc_msg_t *_c_adsc_msg_t, bint owner=False):
+    cdef PyAdscMessageT from_ptr(cadsc.la_adsc_msg_t *_c_adsc_msg_t, bint owner=False, object parent=None):
         """
         Factory function to create PyAdscMessageT objects from
         given _c_adsc_msg_t pointer.
@@ -490,6 +505,7 @@ cdef class PyAdscMessageT:
         cdef PyAdscMessageT wrapper = PyAdscMessageT.__new__(PyAdscMessageT)
         wrapper._c_adsc_msg_t = _c_adsc_msg_t
         wrapper._c_adsc_msg_t_owner = owner
+        wrapper._parent = parent
         return wrapper
 
     @staticmethod
@@ -513,6 +529,8 @@ cdef class PyCpdlcMessage:
 
     cdef ccpdlc.la_cpdlc_msg *_c_cpdlc_msg
     cdef bint _c_cpdlc_msg_owner
+    # Wrapper owning the memory a borrowed pointer points into, kept alive as long as this wrapper
+    cdef object _parent
 
     def __cinit__(self):
         self._c_cpdlc_msg_owner = False
@@ -532,7 +550,7 @@ cdef class PyCpdlcMessage:
         return self._c_cpdlc_msg.err if self._c_cpdlc_msg is not NULL else True
 
     @staticmethod
-    cdef PyCpdlcMessage from_ptr(ccpdlc.la_cpdlc_msg *_c_cpdlc_msg, bint owner=False):
+    cdef PyCpdlcMessage from_ptr(ccpdlc.la_cpdlc_msg *_c_cpdlc_msg, bint owner=False, object parent=None):
         """
         Factory function to create PyCpdlcMessage objects from
         given _c_cpdlc_msg pointer.
@@ -541,6 +559,7 @@ cdef class PyCpdlcMessage:
         cdef PyCpdlcMessage wrapper = PyCpdlcMessage.__new__(PyCpdlcMessage)
         wrapper._c_cpdlc_msg = _c_cpdlc_msg
         wrapper._c_cpdlc_msg_owner = owner
+        wrapper._parent = parent
         return wrapper
 
     @staticmethod
@@ -564,12 +583,13 @@ cdef class PyProtoNode:
 
     cdef clibacars.la_proto_node *_c_proto_node
     cdef bint _c_proto_node_owner
+    # Wrapper owning the memory a borrowed pointer points into, kept alive as long as this wrapper
+    cdef object _parent
 
     def __cinit__(self):
+        # from_ptr and new_struct set the pointer, allocating one here would leak it
         self._c_proto_node_owner = False
-        self._c_proto_node = clibacars.la_proto_node_new()
-        if self._c_proto_node is NULL:
-            raise MemoryError()
+        self._c_proto_node = NULL
 
     def __dealloc__(self):
         if self._c_proto_node is not NULL and self._c_proto_node_owner is True:
@@ -583,7 +603,7 @@ cdef class PyProtoNode:
     # Extension class properties
     @property
     def td(self):
-        return PyTypeDescriptor.from_ptr(self._c_proto_node.td) if self._c_proto_node is not NULL else None
+        return PyTypeDescriptor.from_ptr(self._c_proto_node.td, False, self) if self._c_proto_node is not NULL else None
 
     @property
     def is_valid_acars(self):
@@ -608,15 +628,15 @@ cdef class PyProtoNode:
             if self._c_proto_node.td == &cacars.la_DEF_acars_message:
                 # Need to cast data to the right pointer
                 # Then Use Extension class wrapper to return the object from a pointer
-                return PyAcarsMessage.from_ptr(<cacars.la_acars_msg *>self._c_proto_node.data)
+                return PyAcarsMessage.from_ptr(<cacars.la_acars_msg *>self._c_proto_node.data, False, self)
             elif self._c_proto_node.td == &carinc.la_DEF_arinc_message:
-                return PyArincMessage.from_ptr(<carinc.la_arinc_msg *>self._c_proto_node.data)
+                return PyArincMessage.from_ptr(<carinc.la_arinc_msg *>self._c_proto_node.data, False, self)
             elif self._c_proto_node.td == &cadsc.la_DEF_adsc_message:
                 # TODO Need to keep exposing bindings down the line
-                return PyAdscMessageT.from_ptr(<cadsc.la_adsc_msg_t*>self._c_proto_node.data)
+                return PyAdscMessageT.from_ptr(<cadsc.la_adsc_msg_t*>self._c_proto_node.data, False, self)
             elif self._c_proto_node.td == &ccpdlc.la_DEF_cpdlc_message:
                 # TODO Need to keep exposing bindings down the line
-                return PyCpdlcMessage.from_ptr(<ccpdlc.la_cpdlc_msg*>self._c_proto_node.data)
+                return PyCpdlcMessage.from_ptr(<ccpdlc.la_cpdlc_msg*>self._c_proto_node.data, False, self)
             else:
                 return None
         else:
@@ -625,10 +645,10 @@ cdef class PyProtoNode:
 
     @property
     def next(self):
-        return PyProtoNode.from_ptr(self._c_proto_node.next) if self._c_proto_node is not NULL else None
+        return PyProtoNode.from_ptr(self._c_proto_node.next, False, self) if self._c_proto_node is not NULL else None
 
     @staticmethod
-    cdef PyProtoNode from_ptr(clibacars.la_proto_node *_c_proto_node, bint owner=False):
+    cdef PyProtoNode from_ptr(clibacars.la_proto_node *_c_proto_node, bint owner=False, object parent=None):
         """
         Factory function to create PyProtoNode objects from
         given _c_proto_node pointer.
@@ -637,6 +657,7 @@ cdef class PyProtoNode:
         cdef PyProtoNode wrapper = PyProtoNode.__new__(PyProtoNode)
         wrapper._c_proto_node = _c_proto_node
         wrapper._c_proto_node_owner = owner
+        wrapper._parent = parent
         return wrapper
 
     @staticmethod
@@ -689,7 +710,8 @@ def parse_acars_message(uint8_t *buf, msg_dir: object = PyMsgDir.LA_MSG_DIR_UNKN
     # Parse always returns a proto_node so shouldn't need to check for NULL
     c_node = cacars.la_acars_parse(buf + 1, len(buf) - 1, <clibacars.la_msg_dir>msg_dir.value)
     # Use Extension class wrapper to return the object from a pointer
-    return PyProtoNode.from_ptr(c_node)
+    # The wrapper owns the tree and destroys it when it is garbage collected
+    return PyProtoNode.from_ptr(c_node, owner=True)
 
 def parse_adsc_message(uint8_t *buf, msg_dir: object = PyMsgDir.LA_MSG_DIR_UNKNOWN, imi: object = PyArincImi.ARINC_MSG_UNKNOWN) -> PyProtoNode:
     """
@@ -703,7 +725,8 @@ def parse_adsc_message(uint8_t *buf, msg_dir: object = PyMsgDir.LA_MSG_DIR_UNKNO
     # Parse always returns a proto_node so shouldn't need to check for NULL
     c_node = cadsc.la_adsc_parse(buf, len(buf), <clibacars.la_msg_dir>msg_dir.value, <carinc.la_arinc_imi>imi.value)
     # Use Extension class wrapper to return the object from a pointer
-    return PyProtoNode.from_ptr(c_node)
+    # The wrapper owns the tree and destroys it when it is garbage collected
+    return PyProtoNode.from_ptr(c_node, owner=True)
 
 def format_proto_tree(node: PyProtoNode, mode: object) -> str:
     """
@@ -714,6 +737,8 @@ def format_proto_tree(node: PyProtoNode, mode: object) -> str:
     :return: Formatted ProtoNode tree as str.
     """
 
+    cdef cvstring.la_vstring *c_serial = NULL
+
     if node._c_proto_node is NULL:
         return ""
     if mode == FormatMode.JSON:
@@ -728,7 +753,8 @@ def format_proto_tree(node: PyProtoNode, mode: object) -> str:
     if c_serial is NULL:
         return ""
     # Use Extension class wrapper to return the object from a pointer
-    py_serial = PyVString.from_ptr(c_serial)
+    # The wrapper owns the VString and its buffer, the str is copied out before it is destroyed
+    py_serial = PyVString.from_ptr(c_serial, owner=True)
     if py_serial.str_ :
         return py_serial.str_.decode()
     else:
@@ -757,4 +783,73 @@ def parse_acars_apps(char *label, char *txt, msg_dir: object = PyMsgDir.LA_MSG_D
     # Parse always returns a proto_node so shouldn't need to check for NULL
     c_node = cacars.la_acars_decode_apps(label, txt, <clibacars.la_msg_dir>msg_dir.value)
     # Use Extension class wrapper to return the object from a pointer
-    return PyProtoNode.from_ptr(c_node)
\ No newline at end of file
+    # The wrapper owns the tree and destroys it when it is garbage collected
+    return PyProtoNode.from_ptr(c_node, owner=True)
+
+def decode_acars_batch(frames: list, msg_dir: object = PyMsgDir.LA_MSG_DIR_UNKNOWN) -> list:
+    """
+    Parse a batch of ACARS frames and format them as JSON.
+
+    The frames are read through the buffer protocol without copies, and parsing and formatting run without the GIL so
+    batches decoded from a thread pool run in parallel. No wrapper objects are created, every proto tree and VString
+    is freed before returning.
+
+    :param frames: ACARS frames starting at SOH, with their parity bits, as bytes, bytearray, memoryview or uint8 arrays
+    :param msg_dir: The direction of the ACARS messages. It is a python enum. Default to Unknown
+    :return: The JSON of every frame, an empty string for frames too short to parse or that didn't format
+    """
+    cdef Py_ssize_t num_frames = len(frames)
+    cdef Py_ssize_t index
+    cdef const uint8_t[::1] frame_view
+    cdef clibacars.la_msg_dir c_msg_dir = <clibacars.la_msg_dir>msg_dir.value
+    cdef clibacars.la_proto_node *c_node
+
+    cdef const uint8_t **c_buffers = <const uint8_t **> malloc(num_frames * sizeof(uint8_t *))
+    cdef int *c_lengths = <int *> malloc(num_frames * sizeof(int))
+    # Zeroed so the cleanup only destroys the VStrings that were made
+    cdef cvstring.la_vstring **c_serials = <cvstring.la_vstring **> calloc(num_frames, sizeof(cvstring.la_vstring *))
+
+    # Views keep the frame buffers alive and pinned while the pointers to them are used without the GIL
+    views = []
+
+    try:
+        if num_frames and (c_buffers is NULL or c_lengths is NULL or c_serials is NULL):
+            raise MemoryError()
+
+        for index in range(num_frames):
+            c_lengths[index] = 0
+            c_buffers[index] = NULL
+
+            frame_view = frames[index]
+            views.append(frame_view)
+            # Skip the SOH, a frame needs at least one byte after it
+            if frame_view.shape[0] > 1:
+                c_buffers[index] = &frame_view[1]
+                c_lengths[index] = <int>frame_view.shape[0] - 1
+
+        with nogil:
+            for index in range(num_frames):
+                if c_buffers[index] is NULL:
+                    continue
+                # libacars copies the frame before stripping the parity bits, the buffer isn't written to
+                c_node = cacars.la_acars_parse(<uint8_t *>c_buffers[index], c_lengths[index], c_msg_dir)
+                if c_node is NULL:
+                    continue
+                c_serials[index] = clibacars.la_proto_tree_format_json(NULL, c_node)
+                clibacars.la_proto_tree_destroy(c_node)
+
+        results = []
+        for index in range(num_frames):
+            if c_serials[index] is not NULL and c_serials[index].str is not NULL:
+                results.append(c_serials[index].str.decode())
+            else:
+                results.append("")
+        return results
+    finally:
+        if c_serials is not NULL:
+            for index in range(num_frames):
+                if c_serials[index] is not NULL:
+                    cvstring.la_vstring_destroy(c_serials[index], True)
+        free(c_serials)
+        free(c_lengths)
+        free(c_buffers)
@@ -0,0 +1,215 @@
+"""
+Per-stage instrumentation of the decode chain.
+
+Stages are timed with `stage` and events are counted with `count`. Both do nothing until `enable` is called, `stage`
+then hands back a shared no-op timer so the cost of a disabled stage is one global lookup. Once enabled every stage
+adds its wall time and samples in and out to a registry, callbacks see each stage as it finishes, and the registry
+dumps in the Prometheus text format.
+
+Usage:
+    metrics.enable()
+    with metrics.stage("low_pass_filter", samples_in=len(signal)) as timer:
+        filtered = ...
+        timer.samples_out = len(filtered)
+    print(metrics.REGISTRY.prometheus())
+"""
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+# Prefix of every Prometheus metric name
+NAMESPACE = "pypoacars"
+
+
+@dataclass(frozen=True, slots=True)
+class StageRecord:
+    stage: str
+    seconds: float
+    samples_in: int
+    samples_out: int
+
+
+@dataclass(slots=True)
+class StageMetrics:
+    calls: int = 0
+    seconds: float = 0.0
+    samples_in: int = 0
+    samples_out: int = 0
+
+
+class MetricsRegistry:
+    """
+    Totals of every stage and counter, safe to update from several threads
+    """
+
+    def __init__(self):
+        self.stages: dict[str, StageMetrics] = {}
+        self.counters: dict[str, int] = {}
+        self._callbacks: list[Callable[[StageRecord], None]] = []
+        self._lock = threading.Lock()
+
+    def record(self, record: StageRecord) -> None:
+        """
+        Add a finished stage to the totals and pass it to the callbacks
+        :param record: The stage
+        """
+        with self._lock:
+            totals = self.stages.get(record.stage)
+            if totals is None:
+                totals = self.stages[record.stage] = StageMetrics()
+            totals.calls += 1
+            totals.seconds += record.seconds
+            totals.samples_in += record.samples_in
+            totals.samples_out += record.samples_out
+
+        for callback in self._callbacks:
+            callback(record)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Add to a counter
+        :param name: Name of the counter
+        :param value: Amount to add
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_callback(self, callback: Callable[[StageRecord], None]) -> None:
+        """
+        Call a function with every stage as it finishes, on the thread that ran the stage
+        :param callback: The function
+        """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[StageRecord], None]) -> None:
+        self._callbacks.remove(callback)
+
+    def reset(self) -> None:
+        """
+        Zero every total, callbacks are kept
+        """
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
+    def prometheus(self) -> str:
+        """
+        Dump the totals in the Prometheus text exposition format
+        :return: The metrics text
+        """
+        with self._lock:
+            stages = {name: StageMetrics(**_fields(totals)) for name, totals in sorted(self.stages.items())}
+            counters = dict(sorted(self.counters.items()))
+
+        lines = []
+        for field, help_text in (
+            ("calls", "Times the stage ran"),
+            ("seconds", "Wall time spent in the stage"),
+            ("samples_in", "Samples passed into the stage"),
+            ("samples_out", "Samples the stage produced"),
+        ):
+            metric = f"{NAMESPACE}_stage_{field}_total"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f'{metric}{{stage="{name}"}} {getattr(totals, field)}' for name, totals in stages.items())
+
+        for name, value in counters.items():
+            metric = f"{NAMESPACE}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _fields(totals: StageMetrics) -> dict[str, int | float]:
+    return {name: getattr(totals, name) for name in StageMetrics.__slots__}
+
+
+class _StageTimer:
+    """
+    Times a stage and records it when the block exits. Set samples_out inside the block
+    """
+
+    __slots__ = ("registry", "stage", "samples_in", "samples_out", "_started")
+
+    def __init__(self, registry: MetricsRegistry, stage: str, samples_in: int):
+        self.registry = registry
+        self.stage = stage
+        self.samples_in = samples_in
+        self.samples_out = 0
+
+    def __enter__(self) -> "_StageTimer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        seconds = time.perf_counter() - self._started
+        self.registry.record(StageRecord(self.stage, seconds, self.samples_in, self.samples_out))
+
+
+class _NullTimer:
+    """
+    Stands in for a _StageTimer while metrics are disabled, shared by every stage
+    """
+
+    __slots__ = ("samples_out",)
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+REGISTRY = MetricsRegistry()
+
+_NULL_TIMER = _NullTimer()
+_registry: MetricsRegistry | None = None
+
+
+def enable(registry: MetricsRegistry = REGISTRY) -> MetricsRegistry:
+    """
+    Start recording
+    :param registry: Registry to record to
+    :return: The registry
+    """
+    global _registry
+    _registry = registry
+    return registry
+
+
+def disable() -> None:
+    """
+    Stop recording, the totals recorded so far are kept
+    """
+    global _registry
+    _registry = None
+
+
+def enabled() -> bool:
+    return _registry is not None
+
+
+def stage(name: str, samples_in: int = 0) -> _StageTimer | _NullTimer:
+    """
+    Time a stage, use as a context manager
+    :param name: Name of the stage
+    :param samples_in: Samples passed into the stage
+    :return: The timer, set its samples_out before the block exits
+    """
+    registry = _registry
+    if registry is None:
+        return _NULL_TIMER
+    return _StageTimer(registry, name, samples_in)
+
+
+def count(name: str, value: int = 1) -> None:
+    """
+    Add to a counter
+    :param name: Name of the counter
+    :param value: Amount to add
+    """
+    registry = _registry
+    if registry is not None:
+        registry.count(name, value)
@@ -1,5 +1,18 @@
 import numpy as np
 
+# Time constant of the DC tracker in seconds, long enough that the tones pass and the step where a burst keys up
+# doesn't ring into the prekey
+DC_TIME_CONSTANT = 50e-3
+
+# Time constant the envelope decays with after a peak in seconds
+DECAY_TIME_CONSTANT = 20e-3
+
+# Largest log of the factor the decaying peak grows its running maximum by, far from the float64 limit of about 709
+MAX_LOG_GROWTH = 300
+
+# Envelope below which the gain stops rising, keeps silence from being blown up to full scale
+ENVELOPE_FLOOR = 1e-12
+
 
 def normalize_signal(signal: np.ndarray) -> np.ndarray:
     """
@@ -11,3 +24,128 @@ def normalize_signal(signal: np.ndarray) -> np.ndarray:
     signal = signal / np.max(np.abs(signal))
 
     return signal
+
+
+def _one_pole(time_constant: float, fs: float) -> float:
+    """
+    Coefficient of a one pole filter with a time constant, 0 for no filtering
+    """
+    return float(np.exp(-1 / (time_constant * fs))) if time_constant > 0 else 0.0
+
+
+class StreamingNormalizer:
+    """
+    Online version of normalize_signal, an AGC for continuous sample streams.
+
+    Blocks of any size are pushed with `process`. The DC is tracked by a one pole low pass filter and subtracted, and
+    the result is divided by its envelope. The envelope follows peaks of the magnitude at once and decays exponentially
+    after them, optionally smoothed by a one pole attack filter. Every recursion is evaluated a block at a time, the
+    filters with lfilter and the decaying peak as a running maximum in the log domain, with their state carried between
+    blocks. Each output sample only depends on the samples before it, so an impulse only shrinks the gain for as long
+    as it takes to decay.
+    """
+
+    def __init__(
+        self,
+        fs: float = 48000.0,
+        attack: float = 0.0,
+        decay: float = DECAY_TIME_CONSTANT,
+        dc_time_constant: float = DC_TIME_CONSTANT,
+    ):
+        """
+        :param fs: The sample rate of the signal
+        :param attack: Time constant the envelope rises with in seconds, 0 to follow peaks at once and keep the output
+            within +/- 1
+        :param decay: Time constant the envelope decays with after a peak in seconds
+        :param dc_time_constant: Time constant of the DC tracker in seconds
+        """
+        if decay <= 0 or dc_time_constant <= 0 or attack < 0:
+            raise ValueError("Time constants must be positive")
+
+        self.fs = fs
+        self._attack = _one_pole(attack, fs)
+        self._decay = _one_pole(decay, fs)
+        self._dc_pole = _one_pole(dc_time_constant, fs)
+
+        # 1 / decay^k for k up to the chunk size, grown as longer blocks arrive
+        self._chunk_size = max(int(MAX_LOG_GROWTH * decay * fs), 1)
+        self._growth = self._shrink = np.ones(0)
+        self.reset()
+
+    def reset(self, dc: float = 0.0) -> None:
+        """
+        Drop the carried state
+        :param dc: DC estimate to start from
+        """
+        self._dc_state = np.array([self._dc_pole * dc])
+        self._peak = 0.0
+        self._attack_state = None
+
+    def _ramps(self, num_samples: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        1 / decay^k and decay^k for k from 0 to num_samples - 1
+        """
+        if len(self._growth) < num_samples:
+            self._growth = np.exp(-np.log(self._decay) * np.arange(num_samples))
+            self._shrink = 1 / self._growth
+        return self._growth[:num_samples], self._shrink[:num_samples]
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Normalize the next block of the stream
+        :param block: The next samples of the stream
+        :return: The normalized samples, as many as were pushed
+        """
+        block = np.asarray(block)
+        dtype = np.result_type(block.dtype, np.float32)
+        if not len(block):
+            return np.zeros(0, dtype=dtype)
+
+        from scipy.signal import lfilter
+
+        # DC tracker, dc[n] = pole * dc[n - 1] + (1 - pole) * x[n]
+        dc, self._dc_state = lfilter([1 - self._dc_pole], [1, -self._dc_pole], block, zi=self._dc_state)
+        signal = block - dc
+
+        # Decaying peak, peak[n] = max(|x[n]|, decay * peak[n - 1]), is decay^n times the running maximum of
+        # |x[k]| / decay^k and decay * peak[-1]. Chunks are short enough that 1 / decay^k stays in range of a float64
+        envelope = np.empty(len(signal))
+        for start in range(0, len(signal), self._chunk_size):
+            magnitude = np.abs(signal[start : start + self._chunk_size])
+            growth, shrink = self._ramps(len(magnitude))
+            peak = np.maximum.accumulate(magnitude * growth)
+            np.maximum(peak, self._decay * self._peak, out=peak)
+            np.multiply(peak, shrink, out=envelope[start : start + len(magnitude)])
+            self._peak = envelope[start + len(magnitude) - 1]
+
+        if self._attack:
+            # Start the attack filter from the first peak rather than from silence
+            if self._attack_state is None:
+                self._attack_state = np.array([self._attack * envelope[0]])
+            envelope, self._attack_state = lfilter(
+                [1 - self._attack], [1, -self._attack], envelope, zi=self._attack_state
+            )
+
+        return (signal / np.maximum(envelope, ENVELOPE_FLOOR)).astype(dtype, copy=False)
+
+
+def normalize_burst(
+    signal: np.ndarray,
+    fs: float = 48000.0,
+    attack: float = 0.0,
+    decay: float = DECAY_TIME_CONSTANT,
+    dc_time_constant: float = DC_TIME_CONSTANT,
+) -> np.ndarray:
+    """
+    Normalize one burst with a StreamingNormalizer that only sees the burst. The DC tracker starts from the mean of the
+    first time constant of the burst so the start of the burst isn't spent settling
+    :param signal: The burst
+    :param fs: The sample rate of the burst
+    :param attack: Time constant the envelope rises with in seconds
+    :param decay: Time constant the envelope decays with after a peak in seconds
+    :param dc_time_constant: Time constant of the DC tracker in seconds
+    :return: The normalized burst
+    """
+    normalizer = StreamingNormalizer(fs, attack=attack, decay=decay, dc_time_constant=dc_time_constant)
+    normalizer.reset(dc=float(np.mean(signal[: max(int(dc_time_constant * fs), 1)])) if len(signal) else 0.0)
+    return normalizer.process(signal)
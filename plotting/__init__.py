@@ -1,6 +1,30 @@
-from matplotlib import pyplot as plt
+import importlib
+
 import numpy as np
 
+# Submodules loaded on first attribute access
+_SUBMODULES = ("spectrum_characteristics",)
+
+
+class _LazyPyplot:
+    """
+    Stands in for matplotlib.pyplot until something is plotted, decoding never pays for importing matplotlib
+    """
+
+    def __getattr__(self, name: str):
+        from matplotlib import pyplot
+
+        return getattr(pyplot, name)
+
+
+plt = _LazyPyplot()
+
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def plot_signal_samples(signal, title, samples_per_symbol):
     plt.figure(figsize=(10, 4))
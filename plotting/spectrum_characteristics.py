@@ -1,5 +1,6 @@
 import numpy as np
-from matplotlib import pyplot as plt
+
+from plotting import plt
 
 
 def plot_fft(signal: np.ndarray, fs: float, order_mag: float = 1e3, title="") -> None:
@@ -0,0 +1,34 @@
+"""
+Floating point precision of the decode chain.
+
+The chain runs in float32 and complex64 by default, half the memory traffic of float64 with room to spare for 8 and 16
+bit receiver samples. float64 is kept as an opt-in to check single precision results against.
+"""
+from enum import Enum
+
+import numpy as np
+
+
+class Precision(str, Enum):
+    SINGLE = "single"
+    DOUBLE = "double"
+
+    @property
+    def real_dtype(self) -> np.dtype:
+        return np.dtype(np.float32 if self == Precision.SINGLE else np.float64)
+
+    @property
+    def complex_dtype(self) -> np.dtype:
+        return np.dtype(np.complex64 if self == Precision.SINGLE else np.complex128)
+
+
+def cast(signal: np.ndarray, precision: Precision) -> np.ndarray:
+    """
+    Bring a signal to a precision, real signals stay real and complex signals stay complex
+    :param signal: The signal
+    :param precision: The precision
+    :return: The signal, not copied if it is already in the precision
+    """
+    signal = np.asarray(signal)
+    dtype = precision.complex_dtype if np.iscomplexobj(signal) else precision.real_dtype
+    return signal.astype(dtype, copy=False)
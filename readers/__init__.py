@@ -0,0 +1,176 @@
+import importlib
+import os
+from collections.abc import Iterator
+from enum import Enum
+
+import numpy as np
+
+from precision import Precision
+
+# Submodules loaded on first attribute access
+_SUBMODULES = ("rtl_tcp",)
+
+
+class IQFormat(str, Enum):
+    COMPLEX64 = "cf32"
+    INT16 = "cs16"
+    UINT8 = "cu8"
+    WAV = "wav"
+
+
+# File extensions the format is guessed from when the header doesn't say
+EXTENSION_FORMATS = {
+    ".cf32": IQFormat.COMPLEX64,
+    ".fc32": IQFormat.COMPLEX64,
+    ".cfile": IQFormat.COMPLEX64,
+    ".bin": IQFormat.COMPLEX64,
+    ".cs16": IQFormat.INT16,
+    ".sc16": IQFormat.INT16,
+    ".cu8": IQFormat.UINT8,
+    ".u8": IQFormat.UINT8,
+    ".wav": IQFormat.WAV,
+}
+
+# Offset and scale that bring integer samples to +/- 1
+INTEGER_SCALING = {
+    np.dtype(np.uint8): (127.5, 1 / 127.5),
+    np.dtype(np.int16): (0.0, 1 / 2**15),
+    np.dtype(np.int32): (0.0, 1 / 2**31),
+}
+
+
+def sniff_format(file_path: str) -> IQFormat:
+    """
+    Work out the format of an IQ file from its header, falling back to its extension
+    :param file_path: Path to the IQ file
+    :return: The format of the file
+    """
+    with open(file_path, "rb") as iq_file:
+        header = iq_file.read(12)
+
+    # RIFF chunk with a WAVE form type
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return IQFormat.WAV
+
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in EXTENSION_FORMATS:
+        raise ValueError(f"Unable to work out the IQ format of {file_path}")
+    return EXTENSION_FORMATS[extension]
+
+
+class IQReader:
+    """
+    Memory mapped reader for IQ captures.
+
+    Raw complex64, interleaved int16 and uint8 files and 2 channel WAV files are mapped rather than loaded, so only the
+    samples being read are ever in memory. Complex64 data is handed out as views of the mapping, integer data is
+    converted one block at a time. Samples are complex64 unless double precision is asked for.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        fs: float | None = None,
+        iq_format: IQFormat | None = None,
+        scale: bool = True,
+        precision: Precision = Precision.SINGLE,
+    ):
+        """
+        :param file_path: Path to the IQ file
+        :param fs: Sample rate of the file. WAV files carry their own
+        :param iq_format: Format of the file, sniffed from the header or extension if not given
+        :param scale: Scale integer samples to +/- 1, otherwise keep the raw counts (uint8 is still centred on 0)
+        :param precision: Precision of the samples read, complex64 or complex128
+        """
+        self.file_path = file_path
+        self.iq_format = sniff_format(file_path) if iq_format is None else IQFormat(iq_format)
+        self.fs = fs
+        self.scale = scale
+        self.precision = Precision(precision)
+
+        if self.iq_format == IQFormat.WAV:
+            # Only WAV files need scipy.io, raw captures don't pay for importing it
+            from scipy.io import wavfile
+
+            self.fs, samples = wavfile.read(file_path, mmap=True)
+            if samples.ndim != 2 or samples.shape[1] != 2:
+                raise ValueError("WAV IQ files need exactly 2 channels, I and Q")
+        elif self.iq_format == IQFormat.COMPLEX64:
+            samples = np.memmap(file_path, dtype=np.complex64, mode="r")
+        else:
+            dtype = np.int16 if self.iq_format == IQFormat.INT16 else np.uint8
+            samples = np.memmap(file_path, dtype=dtype, mode="r")
+
+            # Interleaved I and Q, drop a trailing half sample
+            samples = samples[: len(samples) // 2 * 2].reshape(-1, 2)
+
+        # Float I/Q pairs are already complex in memory, float WAV data is +/- 1 so it isn't scaled
+        if samples.ndim == 2 and samples.dtype in (np.float32, np.float64):
+            samples = samples.view(np.result_type(samples.dtype, np.complex64))[:, 0]
+        elif samples.dtype not in INTEGER_SCALING:
+            raise ValueError(f"Unsupported IQ sample type {samples.dtype} in {file_path}")
+
+        self._samples = samples
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def read(self, start: int = 0, stop: int | None = None) -> np.ndarray[np.complex64]:
+        """
+        Read a range of samples in the reader's precision
+        :param start: Index of the first sample
+        :param stop: Index after the last sample, defaults to the end of the file
+        :return: The samples, a view of the mapping if the file is complex64 and so is the precision
+        """
+        samples = self._samples[start:stop]
+        if np.iscomplexobj(samples):
+            return samples.astype(self.precision.complex_dtype, copy=False)
+
+        # Convert in the real dtype of the precision so no wider temporaries are made
+        real_dtype = self.precision.real_dtype
+        offset, scale = INTEGER_SCALING[samples.dtype]
+        scale = scale if self.scale else 1.0
+        block = np.empty(len(samples), dtype=self.precision.complex_dtype)
+        block.real = (samples[:, 0] - real_dtype.type(offset)) * real_dtype.type(scale)
+        block.imag = (samples[:, 1] - real_dtype.type(offset)) * real_dtype.type(scale)
+        return block
+
+    def blocks(self, block_size: int, overlap: int = 0) -> Iterator[np.ndarray[np.complex64]]:
+        """
+        Iterate over the file in fixed size blocks
+        :param block_size: Number of samples per block, the last block may be shorter
+        :param overlap: Number of samples each block repeats from the end of the previous one
+        :return: An iterator of blocks in the reader's precision
+        """
+        if not 0 <= overlap < block_size:
+            raise ValueError("Overlap must be at least 0 and less than the block size")
+
+        step = block_size - overlap
+        for start in range(0, max(len(self) - overlap, 1), step):
+            yield self.read(start, start + block_size)
+
+
+def open_iq(
+    file_path: str,
+    fs: float | None = None,
+    iq_format: IQFormat | None = None,
+    scale: bool = True,
+    precision: Precision = Precision.SINGLE,
+) -> IQReader:
+    """
+    Open an IQ capture for reading
+    :param file_path: Path to the IQ file
+    :param fs: Sample rate of the file. WAV files carry their own
+    :param iq_format: Format of the file, sniffed from the header or extension if not given
+    :param scale: Scale integer samples to +/- 1, otherwise keep the raw counts
+    :param precision: Precision of the samples read, complex64 or complex128
+    :return: A reader for the file
+    """
+    return IQReader(file_path, fs=fs, iq_format=iq_format, scale=scale, precision=precision)
+
+
+def __getattr__(name: str):
+    # PEP 562, submodules are only imported once they're used
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
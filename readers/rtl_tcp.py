@@ -0,0 +1,362 @@
+"""
+Client and replay server for the rtl_tcp protocol.
+
+rtl_tcp sends a 12 byte header, the magic "RTL0" then the tuner type and the number of gain steps as big endian
+uint32, followed by interleaved uint8 I and Q samples for as long as the connection is open. Commands go the other
+way as 5 bytes, a command byte and a big endian uint32 parameter.
+
+Usage, replay a capture as a stand-in receiver:
+    python -m readers.rtl_tcp capture.cu8 --fs 1.152e6 --port 1234
+"""
+import argparse
+import asyncio
+import struct
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from enum import IntEnum
+
+import numpy as np
+
+from readers import INTEGER_SCALING, IQFormat, open_iq
+
+RTL_TCP_MAGIC = b"RTL0"
+
+# Magic, tuner type and gain count
+HEADER_STRUCT = struct.Struct(">4sII")
+
+# Command byte and parameter
+COMMAND_STRUCT = struct.Struct(">BI")
+
+# Default rtl_tcp port
+RTL_TCP_PORT = 1234
+
+# Complex samples per block handed on from the socket, 2 bytes each
+BLOCK_SIZE = 2**16
+
+# Blocks buffered between the socket and the consumer before the socket stops being read
+QUEUE_SIZE = 8
+
+
+class RtlTcpCommand(IntEnum):
+    SET_FREQUENCY = 0x01
+    SET_SAMPLE_RATE = 0x02
+    SET_GAIN_MODE = 0x03
+    SET_GAIN = 0x04
+    SET_FREQUENCY_CORRECTION = 0x05
+    SET_IF_GAIN = 0x06
+    SET_TEST_MODE = 0x07
+    SET_AGC_MODE = 0x08
+    SET_DIRECT_SAMPLING = 0x09
+    SET_OFFSET_TUNING = 0x0A
+    SET_GAIN_BY_INDEX = 0x0D
+    SET_BIAS_TEE = 0x0E
+
+
+@dataclass(frozen=True)
+class RtlTcpHeader:
+    tuner_type: int
+    gain_count: int
+
+    def pack(self) -> bytes:
+        return HEADER_STRUCT.pack(RTL_TCP_MAGIC, self.tuner_type, self.gain_count)
+
+    @classmethod
+    def unpack(cls, header: bytes) -> "RtlTcpHeader":
+        magic, tuner_type, gain_count = HEADER_STRUCT.unpack(header)
+        if magic != RTL_TCP_MAGIC:
+            raise ValueError(f"Not an rtl_tcp stream, the header starts with {magic!r}")
+        return cls(tuner_type, gain_count)
+
+
+def cu8_to_complex(iq_bytes: bytes | bytearray | memoryview) -> np.ndarray[np.complex64]:
+    """
+    Convert interleaved uint8 I and Q to complex64 scaled to +/- 1
+    :param iq_bytes: The interleaved samples, an even number of bytes
+    :return: The complex samples
+    """
+    samples = np.frombuffer(iq_bytes, dtype=np.uint8).reshape(-1, 2)
+
+    # Convert in float32 so no complex128 temporaries are made
+    offset, scale = INTEGER_SCALING[samples.dtype]
+    block = np.empty(len(samples), dtype=np.complex64)
+    block.real = (samples[:, 0] - np.float32(offset)) * np.float32(scale)
+    block.imag = (samples[:, 1] - np.float32(offset)) * np.float32(scale)
+    return block
+
+
+def complex_to_cu8(samples: np.ndarray) -> bytes:
+    """
+    Convert complex samples scaled to +/- 1 to interleaved uint8 I and Q, the inverse of cu8_to_complex
+    :param samples: The complex samples
+    :return: The interleaved samples
+    """
+    offset, scale = INTEGER_SCALING[np.dtype(np.uint8)]
+    interleaved = np.empty((len(samples), 2), dtype=np.float32)
+    interleaved[:, 0] = samples.real
+    interleaved[:, 1] = samples.imag
+    return np.clip(np.rint(interleaved / np.float32(scale) + np.float32(offset)), 0, 255).astype(np.uint8).tobytes()
+
+
+class RtlTcpSource:
+    """
+    asyncio client for an rtl_tcp server.
+
+    Samples are read off the socket into a bounded queue of complex64 blocks. When the consumer falls behind the
+    queue fills, the socket is no longer read and TCP flow control pushes back on the server, so memory stays bounded
+    by the queue size whatever the consumer does.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = RTL_TCP_PORT,
+        fs: float | None = None,
+        center_frequency: float | None = None,
+        gain: float | None = None,
+        block_size: int = BLOCK_SIZE,
+        queue_size: int = QUEUE_SIZE,
+    ):
+        """
+        :param host: Host of the rtl_tcp server
+        :param port: Port of the rtl_tcp server
+        :param fs: Sample rate to set on connecting, the server's current rate is used if not given
+        :param center_frequency: Frequency to tune to on connecting
+        :param gain: Tuner gain in dB, automatic gain if not given
+        :param block_size: Complex samples per block
+        :param queue_size: Blocks buffered before the socket stops being read
+        """
+        self.host = host
+        self.port = port
+        self.fs = fs
+        self.center_frequency = center_frequency
+        self.gain = gain
+        self.block_size = block_size
+        self.queue_size = queue_size
+        self.header: RtlTcpHeader | None = None
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    async def __aenter__(self) -> "RtlTcpSource":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def connect(self) -> None:
+        """
+        Connect, read the header and send the configured settings
+        """
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self.header = RtlTcpHeader.unpack(await self._reader.readexactly(HEADER_STRUCT.size))
+
+        if self.fs is not None:
+            await self.send_command(RtlTcpCommand.SET_SAMPLE_RATE, int(self.fs))
+        if self.center_frequency is not None:
+            await self.send_command(RtlTcpCommand.SET_FREQUENCY, int(self.center_frequency))
+        if self.gain is None:
+            await self.send_command(RtlTcpCommand.SET_GAIN_MODE, 0)
+        else:
+            await self.send_command(RtlTcpCommand.SET_GAIN_MODE, 1)
+            # Gain is sent in tenths of a dB
+            await self.send_command(RtlTcpCommand.SET_GAIN, int(round(self.gain * 10)))
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+        self._reader = self._writer = None
+
+    async def send_command(self, command: RtlTcpCommand, value: int) -> None:
+        """
+        Send a command to the server
+        :param command: The command
+        :param value: The parameter, sent as a uint32
+        """
+        if self._writer is None:
+            raise RuntimeError("The source isn't connected")
+        self._writer.write(COMMAND_STRUCT.pack(command, value & 0xFFFFFFFF))
+        await self._writer.drain()
+
+    async def blocks(self) -> AsyncIterator[np.ndarray[np.complex64]]:
+        """
+        Iterate over the stream in blocks until the server closes the connection
+        :return: An async iterator of complex64 blocks, the last block may be shorter
+        """
+        if self._reader is None:
+            raise RuntimeError("The source isn't connected")
+
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        receiver = asyncio.create_task(self._receive(queue))
+        try:
+            while (block := await queue.get()) is not None:
+                yield block
+
+            # Surface a dropped connection rather than ending the stream quietly
+            await receiver
+        finally:
+            receiver.cancel()
+
+    async def _receive(self, queue: asyncio.Queue) -> None:
+        """
+        Read blocks off the socket into the queue, None marks the end of the stream
+        :param queue: The bounded block queue
+        """
+        num_bytes = 2 * self.block_size
+        try:
+            while True:
+                try:
+                    iq_bytes = await self._reader.readexactly(num_bytes)
+                except asyncio.IncompleteReadError as error:
+                    # Drop a trailing half sample
+                    iq_bytes = error.partial[: len(error.partial) // 2 * 2]
+                    if iq_bytes:
+                        await queue.put(cu8_to_complex(iq_bytes))
+                    break
+
+                # Waits while the consumer is behind, leaving the data in the socket
+                await queue.put(cu8_to_complex(iq_bytes))
+        except Exception:
+            # Wake the consumer so it can pick up the error
+            await queue.put(None)
+            raise
+
+        await queue.put(None)
+
+
+class ReplayServer:
+    """
+    Stand-in rtl_tcp server that replays a capture to every client that connects.
+
+    Commands from clients are read and kept in `commands` but don't change the replay.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        fs: float | None = None,
+        iq_format: IQFormat | None = None,
+        realtime: bool = False,
+        loop: bool = False,
+        block_size: int = BLOCK_SIZE,
+        header: RtlTcpHeader = RtlTcpHeader(tuner_type=5, gain_count=29),
+    ):
+        """
+        :param file_path: The capture to replay
+        :param fs: Sample rate of a raw capture, WAV files carry their own
+        :param iq_format: Format of the capture, sniffed if not given
+        :param realtime: Pace the samples at the sample rate, otherwise send as fast as the client reads
+        :param loop: Start over at the end of the capture
+        :param block_size: Complex samples per write
+        :param header: Header sent to every client, an R820T tuner by default
+        """
+        # Open once so a bad capture fails here rather than in every client
+        self._iq_reader = open_iq(file_path, fs=fs, iq_format=iq_format)
+        if realtime and self._iq_reader.fs is None:
+            raise ValueError("The sample rate is needed to replay in real time")
+
+        self.file_path = file_path
+        self.realtime = realtime
+        self.loop = loop
+        self.block_size = block_size
+        self.header = header
+        self.commands: list[tuple[RtlTcpCommand | int, int]] = []
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.Server:
+        """
+        Start listening
+        :param host: Host to listen on
+        :param port: Port to listen on, 0 picks a free port
+        :return: The server, its sockets give the address
+        """
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        commands = asyncio.create_task(self._read_commands(reader))
+        try:
+            writer.write(self.header.pack())
+            await self._stream(writer)
+
+            # End of the capture, keep reading commands until the client hangs up
+            if writer.can_write_eof():
+                writer.write_eof()
+            await commands
+        except ConnectionError:
+            # The client hung up
+            pass
+        finally:
+            commands.cancel()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _stream(self, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        num_samples = 0
+
+        while True:
+            for block in self._iq_reader.blocks(self.block_size):
+                writer.write(complex_to_cu8(block))
+                # Waits while the client is behind
+                await writer.drain()
+
+                num_samples += len(block)
+                if self.realtime:
+                    await asyncio.sleep(max(started + num_samples / self._iq_reader.fs - loop.time(), 0))
+
+            if not self.loop:
+                return
+
+    async def _read_commands(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                command, value = COMMAND_STRUCT.unpack(await reader.readexactly(COMMAND_STRUCT.size))
+                try:
+                    command = RtlTcpCommand(command)
+                except ValueError:
+                    # Unknown commands are kept as their raw value
+                    pass
+                self.commands.append((command, value))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    replay = ReplayServer(
+        args.path,
+        fs=args.fs,
+        iq_format=args.format and IQFormat(args.format),
+        realtime=not args.fast,
+        loop=args.loop,
+    )
+    server = await replay.start(args.host, args.port)
+    print(f"Replaying {args.path} on {', '.join(str(sock.getsockname()) for sock in server.sockets)}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay an IQ capture as an rtl_tcp server")
+    parser.add_argument("path", help="Capture to replay")
+    parser.add_argument("--fs", type=float, help="Sample rate of a raw capture")
+    parser.add_argument("--format", choices=[iq_format.value for iq_format in IQFormat], help="Capture format")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on")
+    parser.add_argument("--port", type=int, default=RTL_TCP_PORT, help="Port to listen on")
+    parser.add_argument("--fast", action="store_true", help="Send as fast as the client reads instead of in real time")
+    parser.add_argument("--loop", action="store_true", help="Start over at the end of the capture")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
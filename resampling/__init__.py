@@ -1,9 +1,16 @@
+import importlib
+
 import numpy as np
-from scipy.signal import resample_poly
+
+import metrics
+from precision import Precision, cast
+
+# Submodules loaded on first attribute access
+_SUBMODULES = ("multistage",)
 
 
 def resample(
-    signal: np.ndarray, down: int, up: int, samples_per_symbol: int
+    signal: np.ndarray, down: int, up: int, samples_per_symbol: int, precision: Precision = Precision.SINGLE
 ) -> tuple[np.ndarray, int]:
     """
     Resample a signal
@@ -11,12 +18,25 @@ def resample(
     :param down: the sample rate of the signal
     :param up: the new sample rate of the signal
     :param samples_per_symbol: the number of samples per symbol
+    :param precision: the precision to resample in
     :return: the resampled signal new sample rate and new samples per symbol
     """
+    from scipy.signal import resample_poly
+
+    signal = cast(signal, precision)
 
     # Resample to new sample rate
-    resampled_signal = resample_poly(signal, up, down)  # up, down
+    with metrics.stage("resample", samples_in=len(signal)) as timer:
+        resampled_signal = resample_poly(signal, up, down)  # up, down
+        timer.samples_out = len(resampled_signal)
 
     resample_factor = down / up
 
     return resampled_signal, int(samples_per_symbol // resample_factor)
+
+
+def __getattr__(name: str):
+    # PEP 562, submodules are only imported once they're used
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,693 @@
+"""
+Multistage sample rate conversion planned for the fewest multiplies per output sample.
+
+A conversion from any input rate to any output rate is split into integer decimation stages followed by one rational
+stage for whatever ratio is left. Every stage only has to keep the passband free of aliases, whatever folds down above
+the passband is removed by a later stage, so early stages at high rates get away with short filters. Each integer stage
+is a CIC (adds only), a halfband filter (half its taps are zero) or a polyphase FIR, whichever is cheapest, and every
+factorization of the decimation is costed to find the best cascade.
+
+Plans and filter designs are cached, and `ResamplingPlan.resampler` runs a plan on a stream block by block. The delay
+of a cascade is rounded up to a whole number of output samples, by padding the last stage with zero taps and leading
+the stream with zeros, so the output can be lined up with the input like resample_poly does.
+
+Usage:
+    plan = plan_resampling(2.048e6, 48000, passband=5.5e3)
+    resampler = plan.resampler()
+    audio = np.concatenate([resampler.process(block) for block in blocks] + [resampler.flush()])
+"""
+import math
+from dataclasses import dataclass, field, replace
+from enum import Enum
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+
+import metrics
+from decimation import DecimatingFir
+
+# Default stopband attenuation in dB, aliases are pushed this far below the passband
+ATTENUATION_DB = 60.0
+
+# Highest CIC order tried, the droop of higher orders eats into the passband
+MAX_CIC_ORDER = 6
+
+# Most passband droop in dB a CIC stage may have
+MAX_CIC_DROOP_DB = 0.5
+
+# Most integer decimation stages in a cascade
+MAX_STAGES = 6
+
+# Largest denominator a sample rate ratio is reduced to
+MAX_RATIO_DENOMINATOR = 10**6
+
+# Number of plans and filter designs kept, least recently used are evicted first
+PLAN_CACHE_SIZE = 64
+
+
+class StageKind(str, Enum):
+    CIC = "cic"
+    HALFBAND = "halfband"
+    POLYPHASE = "polyphase"
+    RATIONAL = "rational"
+
+
+@dataclass(frozen=True)
+class ResamplingStage:
+    kind: StageKind
+    fs_in: float
+    up: int
+    down: int
+    # FIR taps, read only. CIC stages have none
+    taps: np.ndarray | None = field(default=None, compare=False, repr=False)
+    # Number of integrator-comb sections of a CIC stage
+    order: int = 0
+    # Leading zero taps that round the delay of the cascade up to a whole output sample
+    padding: int = 0
+
+    @property
+    def fs_out(self) -> float:
+        return self.fs_in * self.up / self.down
+
+    @property
+    def macs_per_output(self) -> float:
+        """
+        Multiply-accumulates per output sample of the stage. A CIC section costs a running sum and a difference per
+        input sample, counted as two
+        """
+        if self.kind == StageKind.CIC:
+            return 2 * self.order * self.down
+        if self.kind == StageKind.HALFBAND:
+            return _halfband_macs(len(self.taps))
+        return len(self.taps) / self.up
+
+    @property
+    def delay(self) -> float:
+        """
+        Group delay of the stage in seconds
+        """
+        if self.kind == StageKind.CIC:
+            return self.order * (self.down - 1) / 2 / self.fs_in
+        return ((len(self.taps) - self.padding - 1) / 2 + self.padding) / (self.fs_in * self.up)
+
+    def create(self) -> "CicDecimator | HalfbandDecimator | DecimatingFir | RationalResampler":
+        """
+        Create the streaming filter of the stage
+        :return: The filter, with process, flush and reset methods
+        """
+        if self.kind == StageKind.CIC:
+            return CicDecimator(self.down, self.order)
+        if self.kind == StageKind.HALFBAND:
+            return HalfbandDecimator(self.taps)
+        if self.kind == StageKind.POLYPHASE:
+            return DecimatingFir(self.taps, self.down, convolution_mode="full")
+        return RationalResampler(self.taps, self.up, self.down)
+
+
+@dataclass(frozen=True)
+class ResamplingPlan:
+    fs_in: float
+    fs_out: float
+    passband: float
+    attenuation_db: float
+    stages: tuple[ResamplingStage, ...]
+    # Zero samples pushed in ahead of the stream to round the delay of the cascade up to a whole output sample
+    lead: int = 0
+
+    @property
+    def macs_per_output(self) -> float:
+        """
+        Multiply-accumulates of every stage per sample of the final output
+        """
+        return sum(stage.macs_per_output * stage.fs_out / self.fs_out for stage in self.stages)
+
+    @property
+    def delay(self) -> float:
+        """
+        Group delay of the cascade in seconds
+        """
+        return self.lead / self.fs_in + sum(stage.delay for stage in self.stages)
+
+    def resampler(self) -> "StreamingResampler":
+        return StreamingResampler(self)
+
+
+def plan_resampling(
+    fs_in: float, fs_out: float, passband: float, attenuation_db: float = ATTENUATION_DB
+) -> ResamplingPlan:
+    """
+    Plan the cheapest cascade that converts fs_in to fs_out, keeping 0 to passband free of aliases
+    :param fs_in: Input sample rate
+    :param fs_out: Output sample rate
+    :param passband: Highest frequency that has to come through unaliased, below half of both rates
+    :param attenuation_db: Stopband attenuation of every stage
+    :return: The plan, cached on its arguments
+    """
+    if not 0 < passband < min(fs_in, fs_out) / 2:
+        raise ValueError(f"The passband must be between 0 and {min(fs_in, fs_out) / 2}, got {passband}")
+    return _plan(float(fs_in), float(fs_out), float(passband), float(attenuation_db))
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _plan(fs_in: float, fs_out: float, passband: float, attenuation_db: float) -> ResamplingPlan:
+    """
+    Plan a cascade, see plan_resampling
+    """
+    rate_in = _exact_rate(fs_in)
+    rate_out = _exact_rate(fs_out)
+
+    @lru_cache(maxsize=None)
+    def best_from(rate: Fraction, depth: int) -> tuple[float, tuple[tuple, ...]]:
+        """
+        Cheapest rest of the cascade from a rate, as (MACs per final output sample, stage specifications)
+        """
+        # Finish with the rational stage for whatever ratio is left
+        final = _rational_spec(rate, rate_out, passband, attenuation_db)
+        best = (_spec_cost(final, rate, rate_out), (final,) if final is not None else ())
+
+        if depth == MAX_STAGES:
+            return best
+
+        # Or decimate by an integer first, as long as the passband survives and the rate stays above the output
+        for factor in range(2, int(rate / rate_out) + 1):
+            rate_next = rate / factor
+            if rate_next - passband <= passband:
+                break
+
+            spec = _decimator_spec(rate, factor, passband, attenuation_db, first=depth == 0)
+            rest_cost, rest = best_from(rate_next, depth + 1)
+            cost = _spec_cost(spec, rate, rate_out) + rest_cost
+            if cost < best[0]:
+                best = (cost, (spec,) + rest)
+
+        return best
+
+    _, specs = best_from(rate_in, 0)
+
+    stages = []
+    rate = rate_in
+    for kind, up, down, parameter in specs:
+        stages.append(_build_stage(kind, rate, up, down, parameter, passband, attenuation_db))
+        rate = rate * up / down
+
+    stages, lead = _align_delay(tuple(stages), rate_in, rate_out)
+    return ResamplingPlan(fs_in, fs_out, passband, attenuation_db, stages, lead)
+
+
+def _align_delay(
+    stages: tuple[ResamplingStage, ...], rate_in: Fraction, rate_out: Fraction
+) -> tuple[tuple[ResamplingStage, ...], int]:
+    """
+    Round the delay of the cascade up to a whole number of output samples, the way resample_poly does. A polyphase or
+    rational last stage is padded with leading zero taps, which moves the delay in steps of its up sampled rate, and
+    the fewest zero samples that put the rest of the delay on that grid lead the stream. Halfband and CIC stages can't
+    be padded, a cascade of them is only led with zeros. Only a CIC stage with an odd order * (factor - 1) can leave
+    half an input sample over
+    :return: The stages, the last one padded, and the number of zero samples to lead the stream with
+    """
+    if not stages:
+        return stages, 0
+
+    *head, last = stages
+    paddable = last.kind in (StageKind.POLYPHASE, StageKind.RATIONAL)
+    if paddable:
+        # The padding moves the delay in steps of the up sampled rate of the last stage
+        step = _exact_rate(last.fs_in) * last.up
+    else:
+        head, step = stages, rate_out
+
+    delay = sum((_exact_delay(stage) for stage in head), Fraction(0))
+    if paddable:
+        delay += Fraction(len(last.taps) - 1, 2) / step
+
+    # The lead moves the delay in steps of an input sample, an output sample's worth of them covers every remainder
+    for lead in range(math.ceil(rate_in / rate_out) + 1):
+        steps = (delay + lead / rate_in) * step
+        if steps.denominator == 1:
+            break
+    else:
+        return stages, 0
+
+    if not paddable:
+        return stages, lead
+
+    padding = -steps.numerator % last.down
+    taps = np.concatenate((np.zeros(padding), last.taps))
+    taps.setflags(write=False)
+    return (*head, replace(last, taps=taps, padding=padding)), lead
+
+
+def _exact_delay(stage: ResamplingStage) -> Fraction:
+    """
+    Group delay of a stage in seconds as a fraction
+    """
+    rate = _exact_rate(stage.fs_in)
+    if stage.kind == StageKind.CIC:
+        return Fraction(stage.order * (stage.down - 1), 2) / rate
+    return (Fraction(len(stage.taps) - stage.padding - 1, 2) + stage.padding) / (rate * stage.up)
+
+
+def _exact_rate(fs: float) -> Fraction:
+    return Fraction(fs).limit_denominator(MAX_RATIO_DENOMINATOR)
+
+
+def _stopband(rate_in: Fraction, rate_out: Fraction, passband: float) -> float:
+    """
+    Stopband edge of a stage. Anything above it either aliases into the passband at the output rate of a decimating
+    stage or is an image of the passband at the input rate of an interpolating one
+    """
+    return float(min(rate_in, rate_out)) - passband
+
+
+def _num_taps(fs: float, passband: float, stopband: float, attenuation_db: float) -> tuple[int, float]:
+    """
+    Kaiser window length and beta for a low pass filter
+    :return: (number of taps, beta)
+    """
+    from scipy.signal import kaiserord
+
+    num_taps, beta = kaiserord(attenuation_db, (stopband - passband) / (0.5 * fs))
+    return num_taps | 1, beta
+
+
+def _halfband_macs(num_taps: int) -> float:
+    # Every other tap but the center is zero
+    return (num_taps + 1) / 2 + 1
+
+
+def _spec_cost(spec: tuple | None, rate: Fraction, fs_out: Fraction) -> float:
+    """
+    MACs per final output sample of a stage specification
+    """
+    if spec is None:
+        return 0.0
+
+    kind, up, down, parameter = spec
+    outputs = float(rate * up / down / fs_out)
+    if kind == StageKind.CIC:
+        return 2 * parameter * down * outputs
+    if kind == StageKind.HALFBAND:
+        return _halfband_macs(parameter) * outputs
+    return parameter / up * outputs
+
+
+def _rational_spec(
+    rate: Fraction, fs_out: Fraction, passband: float, attenuation_db: float
+) -> tuple[StageKind, int, int, int] | None:
+    """
+    The rational stage from a rate to the output rate, None if they are the same
+    :return: (kind, up, down, number of taps)
+    """
+    ratio = fs_out / rate
+    if ratio == 1:
+        return None
+
+    up, down = ratio.numerator, ratio.denominator
+    num_taps, _ = _num_taps(float(rate) * up, passband, _stopband(rate, rate * up / down, passband), attenuation_db)
+    return StageKind.RATIONAL, up, down, num_taps
+
+
+def _decimator_spec(
+    rate: Fraction, factor: int, passband: float, attenuation_db: float, first: bool
+) -> tuple[StageKind, int, int, int]:
+    """
+    The cheapest integer decimation stage by a factor
+    :param first: Whether this is the first stage, only the first runs at a rate high enough for a CIC to pay off
+    :return: (kind, 1, factor, number of taps or CIC order)
+    """
+    rate_next = rate / factor
+    stopband = _stopband(rate, rate_next, passband)
+    candidates = []
+
+    num_taps, _ = _num_taps(float(rate), passband, stopband, attenuation_db)
+    candidates.append((num_taps, (StageKind.POLYPHASE, 1, factor, num_taps)))
+
+    if factor == 2:
+        halfband_taps = _halfband_num_taps(float(rate), passband, attenuation_db)
+        candidates.append((_halfband_macs(halfband_taps), (StageKind.HALFBAND, 1, 2, halfband_taps)))
+
+    if first:
+        order = _cic_order(float(rate), factor, passband, stopband, attenuation_db)
+        if order is not None:
+            candidates.append((2 * order * factor, (StageKind.CIC, 1, factor, order)))
+
+    return min(candidates, key=lambda candidate: candidate[0])[1]
+
+
+def _halfband_num_taps(fs: float, passband: float, attenuation_db: float) -> int:
+    """
+    Length of a halfband filter, symmetric about fs / 4 so the transition runs from passband to fs / 2 - passband.
+    Lengths of 4k + 3 put the zero taps on the odd offsets from the center
+    """
+    num_taps, _ = _num_taps(fs, passband, fs / 2 - passband, attenuation_db)
+    return num_taps + (3 - num_taps) % 4
+
+
+def _cic_response(frequency: float, fs: float, factor: int, order: int) -> float:
+    """
+    Magnitude response of a CIC decimator normalized to unity gain at DC
+    """
+    x = math.pi * frequency / fs
+    if x == 0:
+        return 1.0
+    return abs(math.sin(factor * x) / (factor * math.sin(x))) ** order
+
+
+def _cic_order(fs: float, factor: int, passband: float, stopband: float, attenuation_db: float) -> int | None:
+    """
+    Lowest CIC order that attenuates everything that aliases into the passband enough
+    :return: The order, None if no order up to MAX_CIC_ORDER does it within the droop allowed
+    """
+    rate_next = fs / factor
+
+    # Every band around a multiple of the output rate folds onto the passband, the edges nearest the nulls are worst
+    alias_edges = [k * rate_next + sign * passband for k in range(1, factor // 2 + 1) for sign in (-1, 1)]
+    alias_edges = [edge for edge in alias_edges if edge <= fs / 2]
+
+    for order in range(1, MAX_CIC_ORDER + 1):
+        droop_db = -20 * math.log10(_cic_response(passband, fs, factor, order))
+        if droop_db > MAX_CIC_DROOP_DB:
+            return None
+
+        worst = max((_cic_response(edge, fs, factor, order) for edge in alias_edges), default=0.0)
+        if worst == 0 or -20 * math.log10(worst) >= attenuation_db:
+            return order
+
+    return None
+
+
+def _build_stage(
+    kind: StageKind, rate: Fraction, up: int, down: int, parameter: int, passband: float, attenuation_db: float
+) -> ResamplingStage:
+    """
+    Design the filter of a stage specification
+    """
+    if kind == StageKind.CIC:
+        return ResamplingStage(kind, float(rate), up, down, order=parameter)
+
+    if kind == StageKind.HALFBAND:
+        taps = _design_halfband(float(rate), parameter, passband, attenuation_db)
+    else:
+        stopband = _stopband(rate, rate * up / down, passband)
+        taps = _design_low_pass(float(rate) * up, parameter, passband, stopband, attenuation_db, up)
+
+    return ResamplingStage(kind, float(rate), up, down, taps)
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _design_low_pass(
+    fs: float, num_taps: int, passband: float, stopband: float, attenuation_db: float, gain: int
+) -> np.ndarray:
+    """
+    Kaiser windowed low pass filter with its cutoff halfway through the transition
+    :param gain: DC gain, the up sampling factor of a rational stage
+    :return: Read only taps
+    """
+    from scipy.signal import firwin
+
+    _, beta = _num_taps(fs, passband, stopband, attenuation_db)
+    taps = firwin(num_taps, (passband + stopband) / 2, window=("kaiser", beta), fs=fs) * gain
+    taps.setflags(write=False)
+    return taps
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _design_halfband(fs: float, num_taps: int, passband: float, attenuation_db: float) -> np.ndarray:
+    """
+    Kaiser windowed halfband filter, the taps on odd offsets from the center are exactly zero
+    :return: Read only taps
+    """
+    from scipy.signal import firwin
+
+    _, beta = _num_taps(fs, passband, fs / 2 - passband, attenuation_db)
+    taps = firwin(num_taps, fs / 4, window=("kaiser", beta), fs=fs)
+
+    center = (num_taps - 1) // 2
+    taps[center % 2 :: 2] = 0
+    taps[center] = 0.5
+    taps.setflags(write=False)
+    return taps
+
+
+class CicDecimator:
+    """
+    Streaming cascaded integrator-comb decimator.
+
+    Each section is a running sum over `factor` samples, computed as the difference of a cumulative sum so it costs
+    the same whatever the factor. The cumulative sums restart every block from the carried history and run in
+    float64, so they don't drift. Output samples line up with the full convolution, like DecimatingFir in 'full' mode.
+    """
+
+    def __init__(self, factor: int, order: int):
+        """
+        :param factor: The decimation factor
+        :param order: Number of sections
+        """
+        self.factor = factor
+        self.order = order
+        self.reset()
+
+    def reset(self) -> None:
+        self._histories = [np.zeros(self.factor - 1) for _ in range(self.order)]
+        self._dtype = np.dtype(np.float32)
+        self._num_samples = 0
+        self._next_output = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Filter and decimate the next block of the stream
+        :param block: The next samples of the stream
+        :return: The output samples that became available with this block
+        """
+        block = np.asarray(block)
+        self._dtype = np.result_type(block.dtype, self._dtype)
+        if not len(block):
+            return np.zeros(0, dtype=self._dtype)
+
+        first_sample = self._num_samples
+        self._num_samples += len(block)
+
+        signal = block
+        for section, history in enumerate(self._histories):
+            buffered = np.concatenate((history, signal))
+            sums = np.cumsum(buffered, dtype=np.result_type(buffered.dtype, np.float64))
+            signal = sums[self.factor - 1 :] - np.concatenate(((0,), sums[: -self.factor]))
+            self._histories[section] = buffered[len(buffered) - (self.factor - 1) :]
+
+        # Keep the samples on the decimation grid
+        offset = self._next_output - first_sample
+        output = signal[offset :: self.factor] / self.factor**self.order
+        self._next_output += len(output) * self.factor
+
+        return output.astype(self._dtype, copy=False)
+
+    def flush(self) -> np.ndarray:
+        """
+        Push zeros through the sections so the tail of the convolution comes out, then reset
+        :return: The remaining output samples
+        """
+        output = self.process(np.zeros(self.order * (self.factor - 1), dtype=self._dtype))
+        self.reset()
+        return output
+
+
+class HalfbandDecimator:
+    """
+    Streaming decimation by 2 with a halfband filter.
+
+    The even taps filter the even input samples and the only odd tap, the center, scales the odd input samples, so
+    the zero taps are never multiplied. Output samples line up with the full convolution.
+    """
+
+    def __init__(self, taps: np.ndarray):
+        """
+        :param taps: Halfband taps, 4k + 3 long
+        """
+        if len(taps) % 4 != 3:
+            raise ValueError("Halfband filters are 4k + 3 taps long")
+
+        self.taps = np.asarray(taps)
+        self._center = (len(taps) - 1) // 2
+        self._even_taps = self.taps[::2]
+        self.reset()
+
+    def reset(self) -> None:
+        self._history = np.zeros(len(self.taps) - 1, dtype=np.float32)
+        self._num_samples = 0
+        self._next_output = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Filter and decimate the next block of the stream
+        :param block: The next samples of the stream
+        :return: The output samples that became available with this block
+        """
+        block = np.asarray(block)
+        dtype = np.result_type(block.dtype, self._history.dtype, np.float32)
+        signal = np.concatenate((self._history.astype(dtype, copy=False), block.astype(dtype, copy=False)))
+        signal_start = self._num_samples - len(self._history)
+        self._num_samples += len(block)
+
+        # Output m needs input samples 2m - len(taps) + 1 to 2m
+        last_output = (self._num_samples - 1) // 2
+        num_outputs = max(last_output - self._next_output + 1, 0)
+
+        first_sample = 2 * self._next_output - (len(self.taps) - 1)
+        segment = signal[first_sample - signal_start : 2 * last_output - signal_start + 1]
+        taps = self._even_taps.astype(np.finfo(dtype).dtype, copy=False)
+
+        if num_outputs:
+            output = np.convolve(segment[::2], taps, mode="valid")
+            output += self.taps[self._center] * segment[self._center :: 2][:num_outputs]
+        else:
+            output = np.zeros(0, dtype=dtype)
+
+        self._next_output += num_outputs
+        self._history = signal[2 * self._next_output - (len(self.taps) - 1) - signal_start :]
+        return output
+
+    def flush(self) -> np.ndarray:
+        """
+        Push zeros through the filter so the tail of the convolution comes out, then reset
+        :return: The remaining output samples
+        """
+        output = self.process(np.zeros(len(self.taps) - 1, dtype=self._history.dtype))
+        self.reset()
+        return output
+
+
+class RationalResampler:
+    """
+    Streaming polyphase resampler by up / down.
+
+    Each block is run through upfirdn from an input sample on the grid where the up sampled signal lines up with the
+    output samples, with enough history for the filter, and only the output samples whose inputs have all arrived are
+    kept. Output samples line up with the full convolution of the up sampled signal.
+    """
+
+    def __init__(self, taps: np.ndarray, up: int, down: int):
+        """
+        :param taps: Filter taps at the up sampled rate, with a DC gain of up
+        :param up: The up sampling factor
+        :param down: The down sampling factor
+        """
+        if math.gcd(up, down) != 1:
+            raise ValueError("Reduce up / down to lowest terms")
+
+        self.taps = np.asarray(taps)
+        self.up = up
+        self.down = down
+        self.reset()
+
+    def reset(self) -> None:
+        self._history = np.zeros(0, dtype=np.float32)
+        self._history_start = 0
+        self._num_samples = 0
+        self._next_output = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Resample the next block of the stream
+        :param block: The next samples of the stream
+        :return: The output samples that became available with this block
+        """
+        block = np.asarray(block)
+        dtype = np.result_type(block.dtype, self._history.dtype, np.float32)
+        signal = np.concatenate((self._history.astype(dtype, copy=False), block.astype(dtype, copy=False)))
+        self._num_samples += len(block)
+
+        # Output m is up sampled sample m * down, it needs input samples up to m * down / up
+        last_output = (self._num_samples * self.up - 1) // self.down
+        num_outputs = max(last_output - self._next_output + 1, 0)
+
+        output = np.zeros(0, dtype=dtype)
+        if num_outputs:
+            from scipy.signal import upfirdn
+
+            first = self._next_output - self._history_start * self.up // self.down
+            output = upfirdn(
+                self.taps.astype(np.finfo(dtype).dtype, copy=False), signal, self.up, self.down
+            )[first : first + num_outputs].astype(dtype, copy=False)
+            self._next_output += num_outputs
+
+        # Keep from the first input the next output needs, rounded down onto the grid, where input n * down is
+        # up sampled sample n * up * down, a multiple of down
+        needed = max((self._next_output * self.down - (len(self.taps) - 1)) // self.up, 0)
+        keep_from = needed // self.down * self.down
+        self._history = signal[keep_from - self._history_start :]
+        self._history_start = keep_from
+
+        return output
+
+    def flush(self) -> np.ndarray:
+        """
+        Push zeros through the filter so the tail of the convolution comes out, then reset
+        :return: The remaining output samples
+        """
+        output = self.process(np.zeros(-(-len(self.taps) // self.up), dtype=self._history.dtype))
+        self.reset()
+        return output
+
+
+class StreamingResampler:
+    """
+    Runs a plan's stages on a stream, each stage keeping its own state between blocks
+    """
+
+    def __init__(self, plan: ResamplingPlan):
+        self.plan = plan
+        self._stages = [stage.create() for stage in plan.stages]
+        self._lead = plan.lead
+
+    def reset(self) -> None:
+        for stage in self._stages:
+            stage.reset()
+        self._lead = self.plan.lead
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Resample the next block of the stream
+        :param block: The next samples of the stream
+        :return: The output samples that became available with this block
+        """
+        with metrics.stage("resample", samples_in=len(block)) as timer:
+            if self._lead:
+                block = np.concatenate((np.zeros(self._lead, dtype=np.asarray(block).dtype), block))
+                self._lead = 0
+            for stage in self._stages:
+                block = stage.process(block)
+            timer.samples_out = len(block)
+
+        return block
+
+    def flush(self) -> np.ndarray:
+        """
+        Drain every stage in turn, then reset
+        :return: The remaining output samples
+        """
+        tail = np.zeros(0, dtype=np.float32)
+        for stage in self._stages:
+            tail = np.concatenate((stage.process(tail), stage.flush()))
+        self._lead = self.plan.lead
+        return tail
+
+
+def resample_to(
+    signal: np.ndarray, fs_in: float, fs_out: float, passband: float, attenuation_db: float = ATTENUATION_DB
+) -> np.ndarray:
+    """
+    Resample a whole signal with a planned cascade, without an FFT of the signal
+    :param signal: The signal
+    :param fs_in: Sample rate of the signal
+    :param fs_out: Sample rate to resample to
+    :param passband: Highest frequency that has to come through unaliased
+    :param attenuation_db: Stopband attenuation of every stage
+    :return: The resampled signal, compensated for the delay of the cascade like resample_poly
+    """
+    plan = plan_resampling(fs_in, fs_out, passband, attenuation_db)
+    resampler = plan.resampler()
+    output = np.concatenate((resampler.process(signal), resampler.flush()))
+
+    delay = round(plan.delay * fs_out)
+    return output[delay : delay + math.ceil(len(signal) * fs_out / fs_in)]
@@ -0,0 +1,11 @@
+import importlib
+
+# Submodules loaded on first attribute access
+_SUBMODULES = ("acars", "batch", "reassembly", "stream", "synthesis", "validation")
+
+
+def __getattr__(name: str):
+    # PEP 562, submodules are only imported once they're used
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
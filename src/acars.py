@@ -12,12 +12,22 @@ Methods:
 The class is designed to work with numpy arrays for signal processing and assumes the input signals
 are from ACARS transmissions.
 """
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
 
 import numpy as np
 
-from filters.fir_filter import low_pass_filter
+import metrics
+from filters.fir_filter import filter_taps, low_pass_filter
+from precision import Precision, cast
+
+try:
+    # Built from libacars_wrapper/setup.py against an installed libacars-2
+    from libacars_wrapper.libacars import PyMsgDir, decode_acars_batch
+except ImportError:
+    PyMsgDir = decode_acars_batch = None
 
 EXPECTED_FRAME_CODES = {
     "PREKEY": 0xFFFF,
@@ -35,6 +45,16 @@ class ThresholdMethod(str, Enum):
     PERCENTILE = "percentile"
 
 
+class TimingRecovery(str, Enum):
+    VECTORIZED = "vectorized"
+    REFERENCE = "reference"
+
+
+class ToneDetector(str, Enum):
+    CONVOLUTION = "convolution"
+    SLIDING_DFT = "sliding_dft"
+
+
 @dataclass
 class FrameControlCode:
     hex_str: str
@@ -46,6 +66,191 @@ class FrameControlCode:
 
 
 
+# Offsets of the fields of a frame from its SOH
+MODE_OFFSET = 1
+REGISTRATION_SLICE = slice(2, 9)
+ACK_OFFSET = 9
+LABEL_SLICE = slice(10, 12)
+BLOCK_ID_OFFSET = 12
+STX_OFFSET = 13
+SEQUENCE_SLICE = slice(14, 18)
+FLIGHT_SLICE = slice(18, 24)
+TEXT_OFFSET = 24
+
+# demod puts SOH after the +, * and two SYN characters
+DEMOD_SOH_INDEX = 4
+
+# Longest burst a DemodPlan allocates for up front, 1.5 seconds at 48 kHz
+DEMOD_PLAN_MAX_SAMPLES = 72000
+
+# Length of the overlap-add FFT blocks of a DemodPlan
+DEMOD_PLAN_FFT_SIZE = 2048
+
+# Most bursts demod_batch puts in one 2-D array
+DEMOD_BATCH_SIZE = 64
+
+# Fraction of its shortest burst the longest burst of a demod_batch bucket may exceed it by
+DEMOD_BATCH_PADDING = 0.25
+
+# Most samples in a demod_batch bucket, long bursts gain little from batching and the sync map of a bucket has to stay
+# in cache
+DEMOD_BATCH_SAMPLES = 2**16
+
+# bytes.translate table that clears the parity bit
+_STRIP_PARITY = bytes(value & 0x7F for value in range(256))
+
+# Column layout of parse_acars_records, fixed width fields are ASCII bytes
+ACARS_MESSAGE_DTYPE = np.dtype(
+    [
+        ("mode", "S1"),
+        ("registration", "S7"),
+        ("ack", "S1"),
+        ("label", "S2"),
+        ("block_id", "S1"),
+        ("stx", bool),
+        ("sequence", "S4"),
+        ("flight", "S6"),
+        ("text", object),
+        ("final_block", bool),
+    ]
+)
+
+# The fixed width fields as a view over the header bytes of a frame, SOH first
+_HEADER_DTYPE = np.dtype(
+    {
+        "names": ["mode", "registration", "ack", "label", "block_id", "sequence", "flight"],
+        "formats": ["S1", "S7", "S1", "S2", "S1", "S4", "S6"],
+        "offsets": [
+            MODE_OFFSET,
+            REGISTRATION_SLICE.start,
+            ACK_OFFSET,
+            LABEL_SLICE.start,
+            BLOCK_ID_OFFSET,
+            SEQUENCE_SLICE.start,
+            FLIGHT_SLICE.start,
+        ],
+        "itemsize": TEXT_OFFSET,
+    }
+)
+
+
+@dataclass(frozen=True, slots=True)
+class AcarsMessage:
+    """
+    The fields of an ACARS frame. Fields the frame is too short for are cut short or empty.
+    final_block is False for blocks ending in ETB, more blocks of the message follow.
+    """
+
+    mode: str
+    registration: str
+    ack: str
+    label: str
+    block_id: str
+    stx: bool
+    sequence: str
+    flight: str
+    text: str
+    final_block: bool = True
+
+    def format_meta(self) -> str:
+        """
+        Format the meta information the way parse_acars_message always has
+        :return: A string with the meta information, one field per line
+        """
+        result = [f"Aircraft={self.registration}"]
+
+        if self.stx:
+            result.append("STX")
+
+        # Only whole fields are shown
+        if len(self.sequence) == SEQUENCE_SLICE.stop - SEQUENCE_SLICE.start:
+            result.append("Seq. No=" + " ".join(f"{ord(char):02x}" for char in self.sequence))
+
+            printable_chars = "".join(char for char in self.sequence if char >= " " or char in "\x10\x13")
+            if printable_chars:
+                result.append(printable_chars)
+
+            if len(self.flight) == FLIGHT_SLICE.stop - FLIGHT_SLICE.start:
+                result.append(f"Flight={self.flight}")
+
+        return "\n".join(result)
+
+
+def parse_acars_record(
+    message: bytes | bytearray | memoryview | np.ndarray, soh_index: int = DEMOD_SOH_INDEX
+) -> AcarsMessage:
+    """
+    Parse the fields of a demodulated ACARS message
+    :param message: The demodulated ACARS message, with or without parity bits, as bytes or a uint8 buffer
+    :param soh_index: Index of the SOH in the message
+    :return: The fields of the message
+    """
+    frame = bytes(memoryview(message)[soh_index:])
+
+    # Parity bits aren't ASCII
+    if not frame.isascii():
+        frame = frame.translate(_STRIP_PARITY)
+    frame = memoryview(frame)
+
+    text, final_block = _frame_text(frame)
+
+    return AcarsMessage(
+        mode=str(frame[MODE_OFFSET : MODE_OFFSET + 1], "ascii"),
+        registration=str(frame[REGISTRATION_SLICE], "ascii"),
+        ack=str(frame[ACK_OFFSET : ACK_OFFSET + 1], "ascii"),
+        label=str(frame[LABEL_SLICE], "ascii"),
+        block_id=str(frame[BLOCK_ID_OFFSET : BLOCK_ID_OFFSET + 1], "ascii"),
+        stx=len(frame) > STX_OFFSET and frame[STX_OFFSET] == 0x02,
+        sequence=str(frame[SEQUENCE_SLICE], "ascii"),
+        flight=str(frame[FLIGHT_SLICE], "ascii"),
+        text=text,
+        final_block=final_block,
+    )
+
+
+def _frame_text(frame: memoryview) -> tuple[str, bool]:
+    """
+    Cut the text out of a frame without parity bits
+    :param frame: The frame, SOH first
+    :return: The text, up to ETX or ETB, or to DEL or the end when the frame is cut short, and whether the block is
+        the final one. Only ETB says more blocks follow
+    """
+    text_frame = bytes(frame[TEXT_OFFSET:])
+    text_ends = [index for index in (text_frame.find(0x03), text_frame.find(0x17)) if index != -1]
+    text_end = min(text_ends) if text_ends else text_frame.find(0x7F)
+    if text_end == -1:
+        text_end = len(text_frame)
+
+    final_block = text_end == len(text_frame) or text_frame[text_end] != 0x17
+    return str(text_frame[:text_end], "ascii"), final_block
+
+
+def parse_acars_records(messages: list[bytes | bytearray], soh_index: int = DEMOD_SOH_INDEX) -> np.ndarray:
+    """
+    Parse the fields of many demodulated ACARS messages into columns
+    :param messages: The demodulated ACARS messages, with or without parity bits
+    :param soh_index: Index of the SOH in the messages
+    :return: A structured array with ACARS_MESSAGE_DTYPE, one row per message
+    """
+    # Zero padded headers, numpy drops the trailing zeros of short fields
+    headers = np.zeros((len(messages), TEXT_OFFSET), dtype=np.uint8)
+    for row, message in enumerate(messages):
+        header = np.frombuffer(message, dtype=np.uint8)[soh_index : soh_index + TEXT_OFFSET]
+        headers[row, : len(header)] = header
+    headers &= 0x7F
+
+    fields = headers.view(_HEADER_DTYPE)[:, 0]
+    records = np.empty(len(messages), dtype=ACARS_MESSAGE_DTYPE)
+    for name in _HEADER_DTYPE.names:
+        records[name] = fields[name]
+    records["stx"] = headers[:, STX_OFFSET] == 0x02
+    texts = [_frame_text(memoryview(bytes(message[soh_index:]).translate(_STRIP_PARITY))) for message in messages]
+    records["text"] = [text for text, _ in texts]
+    records["final_block"] = [final_block for _, final_block in texts]
+
+    return records
+
+
 def parse_acars_message(message: bytearray) -> str:
     """
     Parse and print meta information from a demodulated ACARS message.
@@ -53,44 +258,48 @@ def parse_acars_message(message: bytearray) -> str:
     :return: A string with the parsed meta information.
     """
 
-    # TODO Implement Libacars
-    # # attempt libacars first
-    # node = parse_acars_message(self.truncate_message(message), PyMsgDir.LA_MSG_DIR_UNKNOWN)
-    # serialized_node = format_proto_tree(node, FormatMode.JSON)
-    # node_json = json.loads(serialized_node)
-    # acars_json = node_json.get('acars')
-    # if not acars_json.get('err', True):
-    #     return acars_json
+    # Full label and application decoding needs libacars, see decode_acars_json
 
-    result = []
+    return parse_acars_record(message).format_meta()
 
-    aircraft = "Aircraft="
-    aircraft += "".join(chr(value) for value in message[6:13])
-    result.append(aircraft)
 
-    if len(message) >= 17:
-        if message[17] == 0x02:
-            result.append("STX")
+def decode_acars_json(
+    messages: list[bytearray],
+    msg_dir=None,
+    max_workers: int | None = None,
+    batch_size: int = 64,
+) -> list[str]:
+    """
+    Decode messages with libacars into JSON, batches are decoded in parallel on a thread pool.
+    libacars parses without holding the GIL so the threads don't serialize.
+    :param messages: Messages demodulated with their parity bits, demod(..., strip_parity=False)
+    :param msg_dir: PyMsgDir direction of the messages, unknown by default
+    :param max_workers: Number of threads, defaults to the ThreadPoolExecutor default
+    :param batch_size: Number of messages per batch handed to libacars
+    :return: The libacars JSON of every message, an empty string where it couldn't be parsed
+    """
+    if decode_acars_batch is None:
+        raise RuntimeError("libacars_wrapper isn't built, see libacars_wrapper/setup.py")
 
-        if len(message) >= 22:
-            seq_no = "Seq. No="
-            seq_no += "".join(f"{value:02x} " for value in message[18:22])
-            result.append(seq_no.strip())
+    msg_dir = PyMsgDir.LA_MSG_DIR_UNKNOWN if msg_dir is None else msg_dir
+    # Views into the messages, libacars reads the frames through the buffer protocol
+    frames = [_acars_frame(message) for message in messages]
+    batches = [frames[start : start + batch_size] for start in range(0, len(frames), batch_size)]
 
-            printable_chars = "".join(
-                chr(value) if value >= 32 or value in [0x10, 0x13] else ""
-                for value in message[18:22]
-            )
-            if printable_chars:
-                result.append(printable_chars)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        decoded_batches = executor.map(lambda batch: decode_acars_batch(batch, msg_dir), batches)
+        return [decoded for decoded_batch in decoded_batches for decoded in decoded_batch]
 
-            if len(message) >= 28:
-                flight = "Flight="
-                flight += "".join(chr(value) for value in message[22:28])
-                result.append(flight)
 
-    final_output = "\n".join(result)
-    return final_output
+def _acars_frame(message: bytearray) -> memoryview:
+    """
+    View of the frame of a message, like truncate_acars_message without copying it
+    :param message: The message
+    :return: The message from the first SOH up to and including the first DEL after it
+    """
+    start = max(message.find(0x01), 0)
+    end = message.find(0x7F, start)
+    return memoryview(message)[start : end + 1 if end != -1 else len(message)]
 
 
 def truncate_acars_message(message: bytearray) -> bytearray:
@@ -142,7 +351,9 @@ def _synchronize_and_extract_bits(
     skip_index: int = 200,
     samples_per_symbol: int = 20,
     clock_deviation: int = 5,
-) -> np.ndarray[int]:
+    timing_recovery: TimingRecovery = TimingRecovery.VECTORIZED,
+    return_margins: bool = False,
+) -> np.ndarray[int] | tuple[np.ndarray[int], np.ndarray[np.float64]]:
     """
     Synchronizes the FH (2400Hz) signal and extracts bits by comparing FH and FL signals.
     :param fh_signal: The high-frequency signal.
@@ -150,9 +361,22 @@ def _synchronize_and_extract_bits(
     :param skip_index: The starting index for synchronization.
     :param samples_per_symbol: The number of samples per symbol.
     :param clock_deviation: The deviation allowed for clock synchronization.
-    :return: The extracted bits from the synchronized signal and the index of the last bit.
+    :param timing_recovery: VECTORIZED or the per symbol REFERENCE loop. Both make the same bit decisions, they only
+        differ where the loop raises an IndexError, see _synchronize_and_extract_bits_vectorized.
+    :param return_margins: Also return FH - FL at every bit decision, 0 where no decision was made.
+    :return: The extracted bits from the synchronized signal, and the margins if asked for.
     """
 
+    if timing_recovery == TimingRecovery.VECTORIZED:
+        return _synchronize_and_extract_bits_vectorized(
+            fh_signal,
+            fl_signal,
+            skip_index=skip_index,
+            samples_per_symbol=samples_per_symbol,
+            clock_deviation=clock_deviation,
+            return_margins=return_margins,
+        )
+
     # Find FH (2400Hz) peak for synchronization
     # This is Symbol Synchronization
     fh_peak = np.max(fh_signal[skip_index:].real)
@@ -183,6 +407,7 @@ def _synchronize_and_extract_bits(
     bits = np.zeros(
         (len(fh_signal) - sample_index) // samples_per_symbol + 1, dtype=int
     )
+    margins = np.zeros(len(bits), dtype=fh_signal.real.dtype)
 
     # Index for bits array
     # Skip 0 index and leave as 0
@@ -196,6 +421,7 @@ def _synchronize_and_extract_bits(
         bits[bit_index] = (
             1 if fh_signal[sample_index].real > fl_signal[sample_index].real else 0
         )
+        margins[bit_index] = fh_signal[sample_index].real - fl_signal[sample_index].real
         bit_index += 1
 
         # Freq Synchronization based on FH signal
@@ -218,6 +444,9 @@ def _synchronize_and_extract_bits(
             is_fh=False,
         )
 
+    if return_margins:
+        return bits, margins
+
     # noinspection PyTypeChecker
     return bits
 
@@ -268,57 +497,321 @@ def _synchronize_signal(
     return sample_index
 
 
-def _nrzi_decode(bits_in: np.ndarray[int]) -> np.ndarray[int]:
+def _synchronize_and_extract_bits_vectorized(
+    fh_signal: np.ndarray,
+    fl_signal: np.ndarray,
+    skip_index: int = 200,
+    samples_per_symbol: int = 20,
+    clock_deviation: int = 5,
+    return_margins: bool = False,
+) -> np.ndarray[int] | tuple[np.ndarray[int], np.ndarray[np.float64]]:
+    """
+    Vectorized equivalent of the _synchronize_and_extract_bits loop, the sample indices it visits come from
+    _timing_chains.
+
+    Two cases differ from the loop. The loop sizes the bits array for symbols that are never shortened and raises an
+    IndexError once corrections shorten enough of them to overrun it, here the decisions that don't fit are dropped,
+    they come after the end of any message. Where the loop reads past the end of the signal and raises an IndexError
+    this raises a ValueError, the same as every other synchronization failure.
+    :param fh_signal: The high-frequency signal.
+    :param fl_signal: The low-frequency signal.
+    :param skip_index: The starting index for synchronization.
+    :param samples_per_symbol: The number of samples per symbol.
+    :param clock_deviation: The deviation allowed for clock synchronization.
+    :param return_margins: Also return FH - FL at every bit decision, 0 where no decision was made.
+    :return: The extracted bits from the synchronized signal, and the margins if asked for.
+    """
+    fh_signal = fh_signal.real
+    fl_signal = fl_signal.real
+    num_samples = len(fh_signal)
+
+    # Find start of payload at about 50% of the FH (2400Hz) peak
+    fh_peak = np.max(fh_signal[skip_index:])
+    below_peak = np.flatnonzero(fh_signal[skip_index:] <= 0.5 * fh_peak)
+    if len(below_peak) == 0:
+        raise ValueError("Signal never drops below 50% of the FH peak.")
+
+    # Move to the center of the first bit
+    sample_index = skip_index + below_peak[0] + samples_per_symbol // 2
+
+    # Same size and layout as the loop, 0 index is left as 0
+    bits = np.zeros((num_samples - sample_index) // samples_per_symbol + 1, dtype=int)
+    margins = np.zeros(len(bits), dtype=fh_signal.dtype)
+
+    # The loop stops once the sample index reaches the last two symbols
+    last_index = num_samples - 2 * samples_per_symbol
+    if sample_index >= last_index:
+        return (bits, margins) if return_margins else bits
+
+    sample_indices, _, overran = _timing_chains(
+        fh_signal,
+        fl_signal,
+        np.array([sample_index]),
+        np.array([last_index]),
+        samples_per_symbol=samples_per_symbol,
+        clock_deviation=clock_deviation,
+    )
+    if overran[0]:
+        raise ValueError("Symbol synchronization ran past the end of the signal.")
+
+    # Compare FH and FL signals a symbol after every sample index the loop would have visited
+    decision_indices = sample_indices[: len(bits) - 1] + samples_per_symbol
+    margins[1 : len(decision_indices) + 1] = fh_signal[decision_indices] - fl_signal[decision_indices]
+    bits[1 : len(decision_indices) + 1] = margins[1 : len(decision_indices) + 1] > 0
+
+    if return_margins:
+        return bits, margins
+
+    # noinspection PyTypeChecker
+    return bits
+
+
+def _timing_chains(
+    fh_signal: np.ndarray,
+    fl_signal: np.ndarray,
+    starts: np.ndarray[np.intp],
+    stops: np.ndarray[np.intp],
+    samples_per_symbol: int = 20,
+    clock_deviation: int = 5,
+) -> tuple[np.ndarray[np.intp], np.ndarray[np.intp], np.ndarray[bool]]:
+    """
+    Follow the sample indices the _synchronize_and_extract_bits loop visits, from every start until its stop.
+
+    Every step of the loop moves a symbol on and applies the FH and FL corrections of _synchronize_signal, which only
+    depend on where the step lands. Most steps land where neither correction moves them, so only the sample indices
+    where one does, the events, become nodes of a graph. Every node points at the first event a whole number of
+    symbols after it, the nodes a chain passes through are found by pointer doubling in log2(events) array operations
+    and the plain steps between them are filled in afterwards.
+
+    Several tracks can be laid end to end with more than a symbol and a clock deviation of zeros between them, one
+    chain per track, as long as every chain starts and stops in its own track.
+    :param fh_signal: The real high-frequency signal.
+    :param fl_signal: The real low-frequency signal.
+    :param starts: The sample index every chain starts at, ascending.
+    :param stops: The sample index every chain stops at or after, two symbols before the end of its track.
+    :param samples_per_symbol: The number of samples per symbol.
+    :param clock_deviation: The deviation allowed for clock synchronization.
+    :return: The sample indices of every chain before its stop laid end to end, how many belong to each chain, and
+        whether each chain took a step the loop raises an IndexError on, reading past the end of the track.
+    """
+    num_samples = len(fh_signal)
+    tones = np.stack((fh_signal, fl_signal))
+    fh_above = tones[0] > tones[1]
+    fl_above = tones[0] < tones[1]
+
+    # Where _synchronize_signal finds a peak, the other tone is above a symbol either side
+    inner = slice(samples_per_symbol, num_samples - samples_per_symbol)
+    before = slice(None, num_samples - 2 * samples_per_symbol)
+    after = slice(2 * samples_per_symbol, None)
+    fh_peaks = np.flatnonzero(fh_above[inner] & fl_above[after] & fl_above[before])
+    fl_peaks = np.flatnonzero(fl_above[inner] & fh_above[after] & fh_above[before])
+    peaks = np.concatenate((fh_peaks, fl_peaks + num_samples)) + samples_per_symbol
+
+    # Offset of the first highest sample within +/- clock deviation of every peak, the windows of both tones at once
+    windows = tones.reshape(-1)[np.arange(-clock_deviation, clock_deviation + 1)[:, None] + peaks]
+    corrections = np.zeros(2 * num_samples, dtype=np.int8)
+    corrections[peaks] = np.argmax(windows == windows.max(axis=0), axis=0) - clock_deviation
+    fh_corrections, fl_corrections = corrections[:num_samples], corrections[num_samples:]
+
+    # Where a step landing on an event ends up, the FL correction applies where the FH correction left it
+    events = np.flatnonzero(fh_corrections | fl_corrections)
+    corrected = events + fh_corrections[events]
+    landed = corrected + fl_corrections[corrected]
+
+    # Index of the first event at or after every sample index along steps of a symbol, len(events) where there is
+    # none. Laid out backwards one symbol per row so the running minimum goes down the columns
+    num_rows = -(-num_samples // samples_per_symbol) + 1
+    size = num_rows * samples_per_symbol
+    first_event = np.full(size, len(events))
+    first_event[size - 1 - events] = np.arange(len(events))
+    np.minimum.accumulate(first_event.reshape(num_rows, -1), axis=0, out=first_event.reshape(num_rows, -1))
+
+    # Nodes are the events then the starts, the end follows them. A node steps to the first event a symbol or more
+    # after it, or to the end where it is at its stop or only reaches that event past its stop
+    end = len(events) + len(starts)
+    node_indices = np.concatenate((landed, starts))
+    chain = np.searchsorted(starts, node_indices, side="right") - 1
+    node_stops = np.append(stops, -1)[chain]
+    event_indices = np.append(events, size + samples_per_symbol)
+    following = first_event[size - 1 - samples_per_symbol - node_indices]
+    following[(node_indices >= node_stops) | (event_indices[following] - samples_per_symbol >= node_stops)] = end
+    following = np.append(following, end)
+
+    # Pointer doubling, every pass appends as many nodes to every chain as it has and squares the step
+    chains = np.arange(len(events), end)[:, None]
+    step = following
+    while np.any(chains[:, -1] != end):
+        chains = np.concatenate((chains, step[chains]), axis=1)
+        step = step[step]
+
+    # Every node of every chain in order, followed by steps of a symbol up to the next event or the stop
+    on_chain = chains != end
+    nodes = chains[on_chain]
+    node_indices = node_indices[nodes]
+    node_stops = node_stops[nodes]
+    next_events = following[nodes]
+    num_steps = np.where(
+        next_events != end,
+        (event_indices[np.minimum(next_events, len(events))] - node_indices) // samples_per_symbol,
+        np.maximum(-(-(node_stops - node_indices) // samples_per_symbol), 0),
+    )
+    offsets = node_indices - samples_per_symbol * (np.cumsum(num_steps) - num_steps)
+    sample_indices = np.repeat(offsets, num_steps) + samples_per_symbol * np.arange(np.sum(num_steps))
+
+    # The FL check after an FH correction compares a symbol on, which the loop reads past the end of the track
+    corrected = np.append(corrected, starts)[nodes]
+    overran = (nodes < len(events)) & (corrected >= node_stops + samples_per_symbol) & fl_above[corrected]
+
+    chain_steps = np.zeros(chains.shape, dtype=np.intp)
+    chain_steps[on_chain] = num_steps
+    chain_overran = np.zeros(chains.shape, dtype=bool)
+    chain_overran[on_chain] = overran
+
+    return sample_indices, chain_steps.sum(axis=1), chain_overran.any(axis=1)
+
+
+def _sliding_dft(signal: np.ndarray, frequency: float, fs: float, window_size: int, dtype: np.dtype) -> np.ndarray:
+    """
+    Correlate a real signal with a tone over a sliding window, recursively at O(1) per sample.
+
+    F[n] = e^(jw) F[n-1] + x[n] - e^(jwN) x[n-N] is the same sum as the full convolution with the kernel
+    e^(jwk), k < N. The comb x[n] - e^(jwN) x[n-N] is computed on the whole signal and the single pole resonator runs
+    in lfilter, so the cost doesn't grow with the window.
+    :param signal: The real signal
+    :param frequency: Frequency of the tone
+    :param fs: The sample rate of the signal
+    :param window_size: Length of the window, N
+    :param dtype: Complex dtype of the result
+    :return: The correlation, len(signal) + window_size - 1 samples like the full convolution
+    """
+    from scipy.signal import lfilter
+
+    w = 2 * np.pi * frequency / fs
+
+    # Zeros at the end let the window slide off the signal, like the tail of the full convolution
+    comb = np.zeros(len(signal) + window_size - 1, dtype=dtype)
+    comb[: len(signal)] = signal
+    comb[window_size:] -= dtype.type(np.exp(1j * w * window_size)) * signal[: len(comb) - window_size]
+
+    return lfilter(np.ones(1, dtype=dtype), np.array([1, -np.exp(1j * w)], dtype=dtype), comb)
+
+
+def _synchronize_and_extract_bits_batch(
+    fh_signal: np.ndarray,
+    fl_signal: np.ndarray,
+    num_samples: np.ndarray[np.intp],
+    skip_index: int = 200,
+    samples_per_symbol: int = 20,
+    clock_deviation: int = 5,
+) -> tuple[np.ndarray[int], np.ndarray, np.ndarray[np.intp], np.ndarray[bool]]:
+    """
+    _synchronize_and_extract_bits_vectorized for a batch of tracks, one per row.
+
+    The rows are laid end to end with enough zeros between them that no peak comparison or clock correction window of
+    one row reaches another, so the event graph of _timing_chains is built once for the whole batch.
+    :param fh_signal: The real high-frequency tracks, zero past the length of each row.
+    :param fl_signal: The real low-frequency tracks, zero past the length of each row.
+    :param num_samples: The length of each row.
+    :param skip_index: The starting index for synchronization.
+    :param samples_per_symbol: The number of samples per symbol.
+    :param clock_deviation: The deviation allowed for clock synchronization.
+    :return: The bits and margins of every row, zero padded, the number of bits of every row, and whether every row
+        synchronized. A row that never drops below 50% of its FH peak, or runs past its end, doesn't where the 1-D
+        version raises.
+    """
+    num_rows, width = fh_signal.shape
+    stride = width + samples_per_symbol + 2 * clock_deviation
+    row_starts = np.arange(num_rows) * stride
+
+    # Find start of payload at about 50% of the FH (2400Hz) peak of every row
+    valid = np.arange(skip_index, max(width, skip_index)) < num_samples[:, None]
+    tracks = fh_signal[:, skip_index:]
+    fh_peak = np.max(np.where(valid, tracks, -np.inf), axis=1, initial=-np.inf)
+    below_peak = valid & (tracks <= 0.5 * fh_peak[:, None])
+    synchronized = below_peak.any(axis=1)
+
+    # Move to the center of the first bit
+    sample_index = skip_index + np.argmax(below_peak, axis=1) + samples_per_symbol // 2
+    num_bits = np.where(synchronized, (num_samples - sample_index) // samples_per_symbol + 1, 0)
+
+    # The loop stops once the sample index reaches the last two symbols
+    last_index = num_samples - 2 * samples_per_symbol
+
+    fh_flat = np.zeros((num_rows, stride), dtype=fh_signal.dtype)
+    fl_flat = np.zeros((num_rows, stride), dtype=fl_signal.dtype)
+    fh_flat[:, :width] = fh_signal
+    fl_flat[:, :width] = fl_signal
+    fh_flat = fh_flat.reshape(-1)
+    fl_flat = fl_flat.reshape(-1)
+
+    # Chains of the rows that synchronized, a row that runs past its end doesn't
+    chain_rows = np.flatnonzero(synchronized & (sample_index < last_index))
+    sample_indices, num_decisions, overran = _timing_chains(
+        fh_flat,
+        fl_flat,
+        row_starts[chain_rows] + sample_index[chain_rows],
+        row_starts[chain_rows] + last_index[chain_rows],
+        samples_per_symbol=samples_per_symbol,
+        clock_deviation=clock_deviation,
+    )
+    synchronized[chain_rows[overran]] = False
+
+    # Decisions past the bits of a row are dropped like the 1-D version drops them
+    first_decision = np.cumsum(num_decisions) - num_decisions
+    decision = np.arange(len(sample_indices)) - np.repeat(first_decision, num_decisions)
+    rows = np.repeat(chain_rows, num_decisions)
+    kept = (decision < num_bits[rows] - 1) & synchronized[rows]
+    decision_indices = sample_indices[kept] + samples_per_symbol
+
+    margins = np.zeros((num_rows, int(num_bits.max(initial=1))), dtype=fh_signal.dtype)
+    margins[rows[kept], decision[kept] + 1] = fh_flat[decision_indices] - fl_flat[decision_indices]
+    bits = (margins > 0).astype(int)
+
+    return bits, margins, num_bits, synchronized
+
+
+def _nrzi_decode(bits_in: np.ndarray[int]) -> np.ndarray[np.uint8]:
     """
     Decode a Non-Return-to-Zero Inverted (NRZI) bitstream.
+
+    Works on the last axis so a batch of equal length bitstreams can be decoded at once.
     :param bits_in: The input bitstream to decode.
     Returns: The decoded NRZI bitstream.
     """
 
-    # Going to start on the 2nd index
-    bit_index_out = 2
-
-    # Pre-allocation with numpy array is better for performance rather that appending to a list
-    bits_out = np.zeros(len(bits_in) + bit_index_out, dtype=int)
-
     # Decode the message with NRZI decoding
     # 2400 Hz or 1 says the bits are the same as the previous bit
     # 1200 Hz or 0 says the bits are different from the previous bit
+    # So every decoded bit is the starting 1 flipped by every 0 so far, a cumulative XOR
+    flips = 1 - np.asarray(bits_in, dtype=np.uint8)
+    decoded = 1 ^ np.bitwise_xor.accumulate(flips, axis=-1)
+
     # Set the first two bits to 1
-    bits_out[0:bit_index_out] = 1  # Sync on 1200 Hz
-    prev_bit = 1
-    for bit_in in bits_in:
-        if bit_in == 0:
-            bits_out[bit_index_out] = 1 - prev_bit
-        else:
-            bits_out[bit_index_out] = prev_bit
-        prev_bit = bits_out[bit_index_out]
-        bit_index_out += 1
+    # Sync on 1200 Hz
+    leading_bits = np.ones(decoded.shape[:-1] + (2,), dtype=np.uint8)
 
     # noinspection PyTypeChecker
-    return bits_out
+    return np.concatenate((leading_bits, decoded), axis=-1)
 
 
-def _pack_acars_bytes(bits_in: np.ndarray[int]) -> bytearray:
+def _pack_acars_characters(bits_in: np.ndarray[np.uint8]) -> tuple[np.ndarray[np.uint8], np.ndarray[np.uint8]]:
     """
-    Pack the bits into bytes for the ACARS message. Note that for acars only the first 7 bits are packed.
-    The 8th bit is ignored because it is a parity bit.
-    :param bits_in: The bits to pack into bytes
-    :return: The packed message as a bytearray
+    Pack the bits into ACARS characters and their parity bits. The first 7 bits of every byte are the character,
+    least significant bit first, and the 8th bit is the parity bit.
+
+    Works on the last axis so a batch of equal length bitstreams can be packed at once. Bits after the last whole byte
+    are dropped.
+    :param bits_in: The bits to pack into characters
+    :return: The characters and the parity bit of every character
     """
+    bits_in = np.asarray(bits_in, dtype=np.uint8)
+    num_bytes = bits_in.shape[-1] // 8
+    bits_in = bits_in[..., : num_bytes * 8].reshape(bits_in.shape[:-1] + (num_bytes, 8))
 
-    # Pre-allocation is better for performance rather than appending to a list
-    message = bytearray(len(bits_in) // 8)
+    # packbits pads the 7 character bits with a zero 8th bit
+    characters = np.packbits(bits_in[..., :7], axis=-1, bitorder="little")[..., 0]
 
-    for byte_index in range(0, len(bits_in) // 8):
-        byte_value = 0
-        for bit_position in range(7):  # Only consider the first 7 bits
-            # bitwise OR operation and shift left
-            # Yay, bitwise operations!
-            byte_value |= bits_in[byte_index * 8 + bit_position] << bit_position
-        message[byte_index] = byte_value
-
-    return message
+    return characters, bits_in[..., 7]
 
 
 def demod(
@@ -329,6 +822,11 @@ def demod(
     fl: int | float = 1200,
     fh: int | float = 2400,
     skip_index: int = 200,
+    timing_recovery: TimingRecovery = TimingRecovery.VECTORIZED,
+    strip_parity: bool = True,
+    return_confidence: bool = False,
+    precision: Precision = Precision.SINGLE,
+    tone_detector: ToneDetector = ToneDetector.CONVOLUTION,
 ) -> (list, list, list, bytearray):
     """
     Demodulate an ACARS signal
@@ -339,115 +837,1159 @@ def demod(
     :param fl: Low frequency for signal processing (default: 1200)
     :param fh: High frequency for signal processing (default: 2400)
     :param skip_index: Number of samples to skip at the beginning of the signal (default: 200)
-    :return: The demodulated message
-    """
-
-    # Create 1200 Hz and 2400 Hz frequency kernels
-    # np.exp(1j * theta) = cos(theta) + j * sin(theta)
-    # 40 samples is a bit period or 2 symbol periods
-    # Or 2 FH (2400Hz) period and 1 FL (1200Hz) period
-    t = np.arange(40) / fs
-    fh_kernel = np.exp(1j * t * fh * 2 * np.pi)
-    fl_kernel = np.exp(1j * t * fl * 2 * np.pi)
-
-    # Create a complex signal with the real part as the input signal and the imaginary part as 0
-    signal = signal + 1j * 0
-
-    # Convolve the signal with the fh (2400Hz) and fl (1200Hz) kernels in the time domain to correlate the frequency
-    # components of the signal with the kernels
-    fh_signal = np.convolve(signal, fh_kernel)
-    fl_signal = np.convolve(signal, fl_kernel)
-
-    # Low-pass filter to isolate fh and fl frequencies
-    fh_signal = low_pass_filter(fh_signal, 3500, fs)
-    fl_signal = low_pass_filter(fl_signal, 3500, fs)
-
-    # Normalize the signal
-    fh_signal /= np.max(np.abs(fh_signal))
-    fl_signal /= np.max(np.abs(fl_signal))
-
-    # Take the magnitude of the signal
-    fh_signal[skip_index:].real = np.abs(fh_signal[skip_index:])
-    fh_signal[skip_index:].imag = 0
-    fl_signal[skip_index:].real = np.abs(fl_signal[skip_index:])
-    fl_signal[skip_index:].imag = 0
-
-    bits = _synchronize_and_extract_bits(
-        fh_signal=fh_signal,
-        fl_signal=fl_signal,
-        skip_index=skip_index,
-        samples_per_symbol=samples_per_symbol,
-        clock_deviation=clock_deviation,
-    )
+    :param timing_recovery: Symbol timing recovery implementation (default: VECTORIZED)
+    :param strip_parity: Drop the parity bit of every character. Keep it to validate the message, the parity bits
+        and the block check sequence need all 8 bits (default: True)
+    :param return_confidence: Also return the confidence of every bit of the message, 8 per byte least significant
+        bit first, as the FH/FL magnitude difference at its decision. Bits that weren't decided are infinitely
+        confident. A wrong decision inverts every bit from the one it belongs to onwards (default: False)
+    :param precision: Precision of the tone correlation and symbol sync, DOUBLE to check SINGLE against
+        (default: SINGLE)
+    :param tone_detector: CONVOLUTION with the tone kernels followed by a low pass filter, or a recursive
+        SLIDING_DFT over the same window without the filter, about 4 times faster (default: CONVOLUTION)
+    :return: The demodulated message, and the bit confidences if asked for
+    """
 
-    # Extracted bits are not yet in message format. Need to be NRZI decoded
-    nrzi_decoded = _nrzi_decode(bits)
+    with metrics.stage("demod.tone_correlation", samples_in=len(signal)) as timer:
+        # The signal is real, correlating it with the complex tones gives complex results of the same precision
+        signal = cast(signal, precision)
+
+        if tone_detector == ToneDetector.SLIDING_DFT:
+            # The 40 sample window already rejects the other tone, no low pass filter needed
+            fh_signal = _sliding_dft(signal, fh, fs, 40, precision.complex_dtype)
+            fl_signal = _sliding_dft(signal, fl, fs, 40, precision.complex_dtype)
+        elif tone_detector == ToneDetector.CONVOLUTION:
+            # Create 1200 Hz and 2400 Hz frequency kernels
+            # np.exp(1j * theta) = cos(theta) + j * sin(theta)
+            # 40 samples is a bit period or 2 symbol periods
+            # Or 2 FH (2400Hz) period and 1 FL (1200Hz) period
+            t = np.arange(40) / fs
+            fh_kernel = np.exp(1j * t * fh * 2 * np.pi).astype(precision.complex_dtype)
+            fl_kernel = np.exp(1j * t * fl * 2 * np.pi).astype(precision.complex_dtype)
+
+            # Convolve the signal with the fh (2400Hz) and fl (1200Hz) kernels in the time domain to correlate the
+            # frequency components of the signal with the kernels
+            fh_signal = np.convolve(signal, fh_kernel)
+            fl_signal = np.convolve(signal, fl_kernel)
+
+            # Low-pass filter to isolate fh and fl frequencies
+            fh_signal = low_pass_filter(fh_signal, 3500, fs, precision=precision)
+            fl_signal = low_pass_filter(fl_signal, 3500, fs, precision=precision)
+        else:
+            raise ValueError("Invalid tone detector")
+
+        # Normalize the signal
+        fh_signal /= np.max(np.abs(fh_signal))
+        fl_signal /= np.max(np.abs(fl_signal))
+
+        # Take the magnitude of the signal
+        fh_signal[skip_index:].real = np.abs(fh_signal[skip_index:])
+        fh_signal[skip_index:].imag = 0
+        fl_signal[skip_index:].real = np.abs(fl_signal[skip_index:])
+        fl_signal[skip_index:].imag = 0
+        timer.samples_out = len(fh_signal)
+
+    with metrics.stage("demod.symbol_sync", samples_in=len(fh_signal)) as timer:
+        bits, margins = _synchronize_and_extract_bits(
+            fh_signal=fh_signal,
+            fl_signal=fl_signal,
+            skip_index=skip_index,
+            samples_per_symbol=samples_per_symbol,
+            clock_deviation=clock_deviation,
+            timing_recovery=timing_recovery,
+            return_margins=True,
+        )
+        timer.samples_out = len(bits)
 
-    # Pack the bits into bytes being conscious of the 8th bit being a parity bit
-    demod_message = _pack_acars_bytes(nrzi_decoded)
+    demod_message = _pack_demod_message(bits, strip_parity)
 
     # This is more for debugging and visualization
     detected_codes = detect_acars_codes(demod_message)
 
+    if return_confidence:
+        return demod_message, _bit_confidence(margins, len(demod_message))
+
     return demod_message
 
 
+def _pack_demod_message(bits: np.ndarray[int], strip_parity: bool, out: bytearray | None = None) -> bytearray:
+    """
+    NRZI decode the bit decisions of a burst and pack them into characters
+    :param bits: The bit decisions
+    :param strip_parity: Drop the parity bit of every character
+    :param out: Bytearray to write the message into, replacing what it held
+    :return: The demodulated message, out if given
+    """
+    with metrics.stage("demod.pack", samples_in=len(bits)) as timer:
+        # Extracted bits are not yet in message format. Need to be NRZI decoded
+        nrzi_decoded = _nrzi_decode(bits)
+
+        # Pack the bits into bytes being conscious of the 8th bit being a parity bit
+        characters, parity = _pack_acars_characters(nrzi_decoded)
+        if not strip_parity:
+            characters |= parity << 7
+
+        demod_message = bytearray() if out is None else out
+        demod_message[:] = characters.tobytes()
+        timer.samples_out = len(demod_message)
+
+    return demod_message
+
+
+def _bit_confidence(margins: np.ndarray, num_bytes: int) -> np.ndarray[np.float32]:
+    """
+    The confidence of every bit of a demodulated message from the margins of the bit decisions
+    :param margins: FH - FL at every bit decision
+    :param num_bytes: Length of the message
+    :return: 8 confidences per byte, least significant bit first
+    """
+    # NRZI decoding puts two leading bits in front of the decisions, the first decision is the unset bits[0]
+    confidence = np.concatenate((np.full(3, np.inf), np.abs(margins[1:])))
+    return confidence[: num_bytes * 8].astype(np.float32)
+
+
+class DemodPlan:
+    """
+    A reusable demodulator for the bursts of one channel, planned once like an FFTW plan.
+
+    The 40 sample tone kernels of demod are fused with its low pass filter so each tone is one correlation, and both
+    fused kernels are transformed once for fixed size FFT blocks. A burst is then correlated with both tones at once
+    by overlap-add, in workspaces preallocated for max_samples that grow if a longer burst comes along. The bits are
+    the same as demod's with the CONVOLUTION tone detector, to within the rounding of the FFT.
+
+    A plan holds workspaces so it must not be shared between threads.
+    """
+
+    def __init__(
+        self,
+        fs: float = 48000.0,
+        samples_per_symbol: int = 20,
+        fl: int | float = 1200,
+        fh: int | float = 2400,
+        clock_deviation: int = 5,
+        skip_index: int = 200,
+        cutoff: float = 3500,
+        num_taps: int = 101,
+        timing_recovery: TimingRecovery = TimingRecovery.VECTORIZED,
+        max_samples: int = DEMOD_PLAN_MAX_SAMPLES,
+        fft_size: int = DEMOD_PLAN_FFT_SIZE,
+        precision: Precision = Precision.SINGLE,
+    ):
+        """
+        :param fs: The sample rate of the bursts
+        :param samples_per_symbol: samples per symbol
+        :param fl: Low frequency for signal processing (default: 1200)
+        :param fh: High frequency for signal processing (default: 2400)
+        :param clock_deviation: Sample deviations for clock synchronization +/-5 samples
+        :param skip_index: Number of samples to skip at the beginning of the signal (default: 200)
+        :param cutoff: Cutoff frequency of the low pass filter fused into the tone kernels
+        :param num_taps: Number of taps of the low pass filter fused into the tone kernels
+        :param timing_recovery: Symbol timing recovery implementation (default: VECTORIZED)
+        :param max_samples: Length of the longest burst the workspaces are allocated for up front
+        :param fft_size: Length of the overlap-add FFT blocks
+        :param precision: Precision of the tone correlation and symbol sync
+        """
+        self.fs = fs
+        self.samples_per_symbol = samples_per_symbol
+        self.clock_deviation = clock_deviation
+        self.skip_index = skip_index
+        self.timing_recovery = timing_recovery
+        self.precision = Precision(precision)
+
+        # Same 40 sample (one bit period) kernels as demod, each convolved with the low pass filter
+        t = np.arange(40) / fs
+        taps = filter_taps(cutoff=cutoff, fs=fs, num_taps=num_taps, precision=self.precision)
+        kernels = np.stack(
+            (np.convolve(np.exp(1j * t * fh * 2 * np.pi), taps), np.convolve(np.exp(1j * t * fl * 2 * np.pi), taps))
+        )
+
+        self.fft_size = fft_size
+        self._kernel_size = kernels.shape[1]
+        if fft_size <= 2 * (self._kernel_size - 1):
+            raise ValueError(f"The FFT size must be more than {2 * (self._kernel_size - 1)} for these kernels")
+
+        # Input samples per block, the rest of the block holds the tail of the convolution
+        self._block_size = fft_size - (self._kernel_size - 1)
+
+        # Where the 'same' low pass filter starts within the full convolution
+        self._filter_delay = (num_taps - 1) // 2
+
+        # Loaded with the first plan, decoders that never build one don't import it
+        import scipy.fft
+
+        self._spectra = scipy.fft.fft(kernels, fft_size)[:, None, :].astype(self.precision.complex_dtype)
+
+        self._allocate(max_samples)
+
+    def _allocate(self, max_samples: int) -> None:
+        """
+        Allocate the workspaces for bursts of up to max_samples
+        :param max_samples: Length of the longest burst
+        """
+        self.max_samples = max_samples
+        num_blocks = -(-max_samples // self._block_size)
+
+        # The end of every block stays zero, the convolution tail of the block goes there
+        self._blocks = np.zeros((num_blocks, self.fft_size), dtype=self.precision.real_dtype)
+        self._products = np.empty((2, num_blocks, self.fft_size), dtype=self.precision.complex_dtype)
+        self._correlation = np.empty((2, (num_blocks + 1) * self._block_size), dtype=self.precision.complex_dtype)
+        self._tracks = np.empty((2, max_samples + 39), dtype=self.precision.real_dtype)
+
+    def correlate(self, signal: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Correlate a burst with both tones and low pass filter the results
+        :param signal: The burst
+        :return: The complex FH and FL correlations, views of a workspace that the next call overwrites
+        """
+        signal = cast(signal, self.precision)
+        if len(signal) == 0:
+            raise ValueError("Nothing to correlate, the burst is empty")
+
+        # The full convolution with the 40 sample kernels, filtered in 'same' mode like demod
+        start = self._filter_delay
+        fh_signal, fl_signal = self._convolve(signal)[:, start : start + len(signal) + 39]
+        return fh_signal, fl_signal
+
+    def _convolve(self, signal: np.ndarray) -> np.ndarray:
+        """
+        Full convolution of a signal with both fused kernels by overlap-add
+        :param signal: The signal, in the plan's precision
+        :return: The FH and FL convolutions as rows, at least len(signal) + kernel size - 1 long. A view of a
+            workspace that the next call overwrites
+        """
+        import scipy.fft
+
+        num_samples = len(signal)
+        if num_samples > self.max_samples:
+            self._allocate(num_samples)
+
+        num_blocks = -(-num_samples // self._block_size)
+        block_size = self._block_size
+
+        # Split the signal into blocks, zero padding the last one
+        blocks = self._blocks[:num_blocks]
+        last_start = (num_blocks - 1) * block_size
+        blocks[:-1, :block_size] = signal[:last_start].reshape(-1, block_size)
+        blocks[-1, : num_samples - last_start] = signal[last_start:]
+        blocks[-1, num_samples - last_start : block_size] = 0
+
+        # Both tones from one transform of every block
+        products = self._products[:, :num_blocks]
+        np.multiply(scipy.fft.fft(blocks), self._spectra, out=products)
+        convolved = scipy.fft.ifft(products, overwrite_x=True)
+
+        # Overlap-add, the tails are shorter than a block so they only overlap the next block
+        correlation = self._correlation[:, : (num_blocks + 1) * block_size]
+        correlation[:, num_blocks * block_size :] = 0
+        correlation[:, : num_blocks * block_size] = convolved[..., :block_size].reshape(2, -1)
+        tails = correlation[:, block_size:].reshape(2, num_blocks, block_size)
+        tails[..., : self._kernel_size - 1] += convolved[..., block_size:]
+
+        return correlation
+
+    def demod(
+        self,
+        signal: np.ndarray,
+        out: bytearray | None = None,
+        strip_parity: bool = True,
+        return_confidence: bool = False,
+    ) -> bytearray | tuple[bytearray, np.ndarray[np.float32]]:
+        """
+        Demodulate a burst, see demod
+        :param signal: The burst
+        :param out: Bytearray to write the message into, replacing what it held
+        :param strip_parity: Drop the parity bit of every character (default: True)
+        :param return_confidence: Also return the confidence of every bit of the message (default: False)
+        :return: The demodulated message, out if given, and the bit confidences if asked for
+        """
+        skip_index = self.skip_index
+
+        with metrics.stage("demod.tone_correlation", samples_in=len(signal)) as timer:
+            correlations = self.correlate(signal)
+
+            # Normalized real parts before the skip index and normalized magnitudes after, as demod leaves them
+            tracks = self._tracks[:, : len(correlations[0])]
+            for track, correlation in zip(tracks, correlations):
+                np.abs(correlation, out=track)
+                peak = np.max(track)
+                if peak == 0:
+                    raise ValueError("Nothing to synchronize on, the burst is silent")
+                track[:skip_index] = correlation[:skip_index].real
+                track /= peak
+            timer.samples_out = tracks.shape[1]
+
+        with metrics.stage("demod.symbol_sync", samples_in=tracks.shape[1]) as timer:
+            bits, margins = _synchronize_and_extract_bits(
+                fh_signal=tracks[0],
+                fl_signal=tracks[1],
+                skip_index=skip_index,
+                samples_per_symbol=self.samples_per_symbol,
+                clock_deviation=self.clock_deviation,
+                timing_recovery=self.timing_recovery,
+                return_margins=True,
+            )
+            timer.samples_out = len(bits)
+
+        demod_message = _pack_demod_message(bits, strip_parity, out)
+
+        if return_confidence:
+            return demod_message, _bit_confidence(margins, len(demod_message))
+
+        return demod_message
+
+    def demod_batch(
+        self, bursts: Sequence[np.ndarray], strip_parity: bool = True, return_confidence: bool = False
+    ) -> list[bytearray | None] | tuple[list[bytearray | None], list[np.ndarray[np.float32] | None]]:
+        """
+        Demodulate many bursts together, see demod_batch
+        :param bursts: The bursts
+        :param strip_parity: Drop the parity bit of every character (default: True)
+        :param return_confidence: Also return the confidence of every bit of every message (default: False)
+        :return: The message of every burst, None for bursts that didn't synchronize, and the bit confidences if
+            asked for
+        """
+        messages = [None] * len(bursts)
+        confidences = [None] * len(bursts)
+
+        lengths = np.array([len(burst) for burst in bursts], dtype=np.intp)
+        for bucket in _length_buckets(lengths):
+            if len(bucket) == 1:
+                # Nothing to batch with, a long burst on its own is cheaper one dimensional
+                index = bucket[0]
+                try:
+                    messages[index], confidences[index] = self.demod(
+                        bursts[index], strip_parity=strip_parity, return_confidence=True
+                    )
+                except ValueError:
+                    pass
+                if not return_confidence:
+                    confidences[index] = None
+                continue
+
+            bucket_messages, bucket_confidences = self._demod_bucket(
+                [bursts[index] for index in bucket], lengths[bucket], strip_parity, return_confidence
+            )
+            for index, message, confidence in zip(bucket, bucket_messages, bucket_confidences):
+                messages[index] = message
+                confidences[index] = confidence
+
+        if return_confidence:
+            return messages, confidences
+
+        return messages
+
+    def _demod_bucket(
+        self, bursts: list[np.ndarray], lengths: np.ndarray[np.intp], strip_parity: bool, return_confidence: bool
+    ) -> tuple[list[bytearray | None], list[np.ndarray[np.float32] | None]]:
+        """
+        Demodulate bursts of similar lengths as the rows of 2-D arrays
+        :param bursts: The bursts, none of them empty
+        :param lengths: The length of every burst
+        :param strip_parity: Drop the parity bit of every character
+        :param return_confidence: Compute the bit confidences
+        :return: The message and the bit confidences of every burst, None where it didn't synchronize
+        """
+        skip_index = self.skip_index
+        num_bursts = len(bursts)
+
+        # Rows far enough apart that the convolution tail of a row ends before the next row starts
+        width = int(lengths.max()) + self._kernel_size - 1
+        rows = np.zeros((num_bursts, width), dtype=self.precision.real_dtype)
+        for row, burst in zip(rows, bursts):
+            row[: len(burst)] = cast(burst, self.precision)
+
+        with metrics.stage("demod.tone_correlation", samples_in=int(lengths.sum())) as timer:
+            correlations = self._convolve(rows.reshape(-1))[:, : num_bursts * width].reshape(2, num_bursts, width)
+
+            # The full convolution with the 40 sample kernels of every row, filtered in 'same' mode like demod
+            num_samples = lengths + 39
+            start = self._filter_delay
+            correlations = correlations[..., start : start + int(num_samples.max())]
+            valid = np.arange(correlations.shape[-1]) < num_samples[:, None]
+
+            # Normalized real parts before the skip index and normalized magnitudes after, as demod leaves them
+            tracks = np.where(valid, np.abs(correlations), 0)
+            peaks = tracks.max(axis=-1, keepdims=True)
+            tracks[..., :skip_index] = np.where(valid[:, :skip_index], correlations[..., :skip_index].real, 0)
+
+            # Silent bursts have no peak to normalize by and never synchronize
+            silent = np.any(peaks[..., 0] == 0, axis=0)
+            tracks /= np.where(peaks == 0, 1, peaks)
+            timer.samples_out = int(num_samples.sum())
+
+        with metrics.stage("demod.symbol_sync", samples_in=int(num_samples.sum())) as timer:
+            bits, margins, num_bits, synchronized = _synchronize_and_extract_bits_batch(
+                tracks[0],
+                tracks[1],
+                num_samples,
+                skip_index=skip_index,
+                samples_per_symbol=self.samples_per_symbol,
+                clock_deviation=self.clock_deviation,
+            )
+            synchronized &= ~silent
+            timer.samples_out = int(num_bits.sum())
+
+        with metrics.stage("demod.pack", samples_in=int(num_bits.sum())) as timer:
+            # NRZI decoding and packing work along the rows, the bits past the end of a row only fill bytes dropped
+            characters, parity = _pack_acars_characters(_nrzi_decode(bits))
+            if not strip_parity:
+                characters |= parity << 7
+
+            # NRZI decoding puts two leading bits in front of every row
+            num_bytes = (num_bits + 2) // 8
+            messages = [
+                bytearray(row[:length].tobytes()) if ok else None
+                for row, length, ok in zip(characters, num_bytes, synchronized)
+            ]
+            timer.samples_out = int(num_bytes[synchronized].sum())
+
+        confidences = [
+            _bit_confidence(row[:count], length) if return_confidence and ok else None
+            for row, count, length, ok in zip(margins, num_bits, num_bytes, synchronized)
+        ]
+
+        return messages, confidences
+
+
+def _length_buckets(
+    lengths: np.ndarray[np.intp],
+    max_bucket: int = DEMOD_BATCH_SIZE,
+    max_padding: float = DEMOD_BATCH_PADDING,
+    max_samples: int = DEMOD_BATCH_SAMPLES,
+) -> list[np.ndarray[np.intp]]:
+    """
+    Group bursts of similar lengths so padding them to the longest in their group wastes little
+    :param lengths: The length of every burst
+    :param max_bucket: Most bursts in a group
+    :param max_padding: Fraction of the shortest burst of a group the longest may exceed it by
+    :param max_samples: Most padded samples in a group, a group always takes at least one burst
+    :return: The indices of the bursts in every group, empty bursts are left out
+    """
+    order = np.argsort(lengths, kind="stable")
+    order = order[lengths[order] > 0]
+
+    buckets = []
+    start = 0
+    while start < len(order):
+        end = start + 1
+        shortest = lengths[order[start]]
+        while (
+            end < len(order)
+            and end - start < max_bucket
+            and lengths[order[end]] <= shortest * (1 + max_padding)
+            and (end - start + 1) * lengths[order[end]] <= max_samples
+        ):
+            end += 1
+        buckets.append(order[start:end])
+        start = end
+
+    return buckets
+
+
+def demod_batch(
+    bursts: Sequence[np.ndarray],
+    fs: float = 48000.0,
+    samples_per_symbol: int = 20,
+    clock_deviation: int = 5,
+    fl: int | float = 1200,
+    fh: int | float = 2400,
+    skip_index: int = 200,
+    strip_parity: bool = True,
+    return_confidence: bool = False,
+    precision: Precision = Precision.SINGLE,
+) -> list[bytearray | None] | tuple[list[bytearray | None], list[np.ndarray[np.float32] | None]]:
+    """
+    Demodulate many ACARS bursts at once.
+
+    Bursts are bucketed by length and zero padded into the rows of 2-D arrays, then tone correlation, filtering,
+    normalization, timing recovery, NRZI decoding and packing run on whole buckets. The per call overhead of NumPy
+    is paid per bucket rather than per burst, which is most of the cost of short bursts. The messages are the same as
+    demod's with the CONVOLUTION tone detector and VECTORIZED timing recovery, to within the rounding of the FFT.
+    :param bursts: The normalized bursts to demodulate
+    :param fs: The sample rate of the bursts
+    :param samples_per_symbol: samples per symbol
+    :param clock_deviation: Sample deviations for clock synchronization +/-5 samples
+    :param fl: Low frequency for signal processing (default: 1200)
+    :param fh: High frequency for signal processing (default: 2400)
+    :param skip_index: Number of samples to skip at the beginning of every burst (default: 200)
+    :param strip_parity: Drop the parity bit of every character (default: True)
+    :param return_confidence: Also return the confidence of every bit of every message (default: False)
+    :param precision: Precision of the tone correlation and symbol sync (default: SINGLE)
+    :return: The message of every burst, None for bursts that didn't synchronize or are empty, and the bit
+        confidences if asked for
+    """
+    plan = DemodPlan(
+        fs=fs,
+        samples_per_symbol=samples_per_symbol,
+        fl=fl,
+        fh=fh,
+        clock_deviation=clock_deviation,
+        skip_index=skip_index,
+        precision=precision,
+    )
+    return plan.demod_batch(bursts, strip_parity=strip_parity, return_confidence=return_confidence)
+
+
+class DemodState(str, Enum):
+    SEARCH = "search"
+    ARMED = "armed"
+    SYNC = "sync"
+
+
+class StreamingDemodulator:
+    """
+    A stateful ACARS demodulator for continuous sample streams.
+
+    Samples are pushed in blocks of any size with `process`. The tone correlator and low pass filter histories are
+    carried between blocks (overlap-save), as are the symbol clock sample index and the NRZI previous bit, so memory is
+    bounded by the block size rather than the capture length. Frames are returned as soon as their DEL character is
+    decoded.
+
+    The prekey search replaces the global FH peak used by `demod`. A run of FH (2400Hz) dominance at least
+    `prekey_symbols` long arms the search and the payload starts where FH falls to 50% of the running prekey peak.
+    The FH and FL tracks are normalized by their running peaks rather than the global maximum of the burst.
+    """
+
+    def __init__(
+        self,
+        fs: float = 48000.0,
+        samples_per_symbol: int = 20,
+        clock_deviation: int = 5,
+        fl: int | float = 1200,
+        fh: int | float = 2400,
+        cutoff: float = 3500,
+        num_taps: int = 101,
+        prekey_symbols: int = 16,
+        dominance: float = 2.0,
+        sync_search_bytes: int = 8,
+        max_frame_bytes: int = 256,
+        precision: Precision = Precision.SINGLE,
+    ):
+        """
+        :param fs: The sample rate of the signal
+        :param samples_per_symbol: samples per symbol
+        :param clock_deviation: Sample deviations for clock synchronization +/-5 samples
+        :param fl: Low frequency for signal processing (default: 1200)
+        :param fh: High frequency for signal processing (default: 2400)
+        :param cutoff: Cutoff frequency of the low pass filter applied to the tone correlations
+        :param num_taps: Number of taps of the low pass filter applied to the tone correlations
+        :param prekey_symbols: Number of symbols FH has to dominate FL before the payload start is searched for
+        :param dominance: Factor FH has to exceed FL by to count as prekey
+        :param sync_search_bytes: Number of bytes a SOH has to be found in before the lock is dropped
+        :param max_frame_bytes: Number of bytes after which a frame without DEL is dropped as truncated, counted in
+            frames_truncated and the frames_truncated metric
+        :param precision: Precision of the tone correlation and symbol sync
+        """
+        self.fs = fs
+        self.samples_per_symbol = samples_per_symbol
+        self.clock_deviation = clock_deviation
+        self.prekey_samples = prekey_symbols * samples_per_symbol
+        self.dominance = dominance
+        self.sync_search_bytes = sync_search_bytes
+        self.max_frame_bytes = max_frame_bytes
+        self.precision = Precision(precision)
+
+        # Same 40 sample (one bit period) kernels as demod
+        t = np.arange(40) / fs
+        self._fh_kernel = np.exp(1j * t * fh * 2 * np.pi).astype(self.precision.complex_dtype)
+        self._fl_kernel = np.exp(1j * t * fl * 2 * np.pi).astype(self.precision.complex_dtype)
+        self._taps = filter_taps(cutoff=cutoff, fs=fs, num_taps=num_taps, precision=self.precision)
+
+        # Samples the sync loop needs around the current sample index
+        self._lookback = samples_per_symbol + clock_deviation
+        self._lookahead = 2 * samples_per_symbol + 2 * clock_deviation
+
+        # Frames dropped without a DEL, over the life of the demodulator
+        self.frames_truncated = 0
+
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Drop all carried state and start searching for a prekey again
+        """
+        complex_dtype = self.precision.complex_dtype
+        self._signal_history = np.zeros(len(self._fh_kernel) - 1, dtype=self.precision.real_dtype)
+        self._fh_history = np.zeros(len(self._taps) - 1, dtype=complex_dtype)
+        self._fl_history = np.zeros(len(self._taps) - 1, dtype=complex_dtype)
+
+        # Magnitude tracks and the absolute sample index of their first element
+        self._fh = np.zeros(0, dtype=self.precision.real_dtype)
+        self._fl = np.zeros(0, dtype=self.precision.real_dtype)
+        self._offset = 0
+        self._scan_index = 0
+
+        self._reset_burst()
+
+    def _reset_burst(self) -> None:
+        """
+        Return to prekey search, keeping the filter histories and magnitude tracks
+        """
+        self.state = DemodState.SEARCH
+        self._run_length = 0
+        self._run_peak = 0.0
+
+        # Normalized tracks are only kept while synchronized
+        self._fh_norm = np.zeros(0, dtype=self.precision.real_dtype)
+        self._fl_norm = np.zeros(0, dtype=self.precision.real_dtype)
+        self._norm_offset = 0
+        self._fh_peak = 0.0
+        self._fl_peak = 0.0
+
+        self._sample_index = 0
+        self._prev_bit = 1
+        self._byte_value = 0
+        self._bit_position = 0
+        self._frame = bytearray()
+        self._soh_seen = False
+
+    def process(self, block: np.ndarray[np.float32]) -> list[bytearray]:
+        """
+        Push a block of samples through the demodulator
+        :param block: The next samples of the stream
+        :return: The frames completed within this block
+        """
+        if len(block) == 0:
+            return []
+
+        with metrics.stage("demod.tone_correlation", samples_in=len(block)) as timer:
+            fh_magnitude, fl_magnitude = self._correlate(np.asarray(block))
+            timer.samples_out = len(fh_magnitude)
+
+        self._fh = np.concatenate((self._fh, fh_magnitude))
+        self._fl = np.concatenate((self._fl, fl_magnitude))
+        if self.state == DemodState.SYNC:
+            self._extend_normalized(len(self._fh) - len(fh_magnitude))
+
+        frames = []
+        with metrics.stage("demod.symbol_sync", samples_in=len(fh_magnitude)) as timer:
+            while self._run(frames):
+                pass
+            timer.samples_out = len(frames)
+
+        self._trim()
+        return frames
+
+    def flush(self) -> list[bytearray]:
+        """
+        Push enough silence through the demodulator to drain the filters, then reset
+        :return: The frames completed by the flush
+        """
+        drain = np.zeros(len(self._fh_kernel) + len(self._taps) + self._lookahead, dtype=np.float32)
+        frames = self.process(drain)
+
+        # A frame cut off by the end of the stream never got its DEL
+        if self.state == DemodState.SYNC and self._soh_seen:
+            self.frames_truncated += 1
+            metrics.count("frames_truncated")
+
+        self.reset()
+        return frames
+
+    def _correlate(self, block: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Correlate a block with the tone kernels and low pass filter the result, carrying history between blocks
+        :param block: The next samples of the stream
+        :return: The FH and FL magnitudes of the block
+        """
+
+        # Overlap-save: prepend the previous samples and keep only the fully overlapped outputs
+        signal = np.concatenate((self._signal_history, cast(block, self.precision)))
+        self._signal_history = signal[-(len(self._fh_kernel) - 1) :]
+        fh_signal = np.convolve(signal, self._fh_kernel, mode="valid")
+        fl_signal = np.convolve(signal, self._fl_kernel, mode="valid")
+
+        # Same again for the low pass filter on each tone
+        fh_signal = np.concatenate((self._fh_history, fh_signal))
+        self._fh_history = fh_signal[-(len(self._taps) - 1) :]
+        fl_signal = np.concatenate((self._fl_history, fl_signal))
+        self._fl_history = fl_signal[-(len(self._taps) - 1) :]
+
+        taps = self._taps.astype(self.precision.real_dtype, copy=False)
+        return (
+            np.abs(np.convolve(fh_signal, taps, mode="valid")),
+            np.abs(np.convolve(fl_signal, taps, mode="valid")),
+        )
+
+    def _extend_normalized(self, start: int) -> None:
+        """
+        Normalize the magnitude tracks from a buffer index on by their running peaks
+        :param start: Buffer index to start normalizing from
+        """
+        fh_peak = np.maximum.accumulate(np.maximum(self._fh[start:], self._fh_peak))
+        fl_peak = np.maximum.accumulate(np.maximum(self._fl[start:], self._fl_peak))
+        self._fh_peak = fh_peak[-1]
+        self._fl_peak = fl_peak[-1]
+
+        # Avoid dividing by zero on silence, with the smallest normal number of the tracks' precision
+        tiny = np.finfo(self._fh.dtype).tiny
+        self._fh_norm = np.concatenate((self._fh_norm, self._fh[start:] / np.maximum(fh_peak, tiny)))
+        self._fl_norm = np.concatenate((self._fl_norm, self._fl[start:] / np.maximum(fl_peak, tiny)))
+
+    def _run(self, frames: list[bytearray]) -> bool:
+        """
+        Advance the state machine as far as the buffered samples allow
+        :param frames: List completed frames are appended to
+        :return: Whether the state changed and the buffer should be scanned again
+        """
+        if self.state == DemodState.SYNC:
+            return self._extract(frames)
+        return self._search()
+
+    def _search(self) -> bool:
+        """
+        Search the unscanned magnitudes for the end of a prekey
+        :return: Whether a prekey end was found and the demodulator is now synchronized
+        """
+        start = self._scan_index - self._offset
+        fh_signal = self._fh[start:]
+        fl_signal = self._fl[start:]
+        if len(fh_signal) == 0:
+            return False
+
+        if self.state == DemodState.SEARCH:
+            # Length of the FH dominant run ending at each sample, continuing the run from the previous block
+            dominant = fh_signal > self.dominance * fl_signal
+            indices = np.arange(len(dominant))
+            last_break = np.maximum.accumulate(np.where(dominant, -1, indices))
+            run_length = indices - last_break
+            run_length[last_break == -1] += self._run_length
+
+            armed = np.flatnonzero(run_length >= self.prekey_samples)
+            if len(armed) == 0:
+                self._run_length = int(run_length[-1])
+                if not dominant[-1]:
+                    self._run_peak = 0.0
+                elif last_break[-1] == -1:
+                    self._run_peak = max(self._run_peak, np.max(fh_signal))
+                else:
+                    self._run_peak = np.max(fh_signal[last_break[-1] + 1 :])
+                self._scan_index += len(fh_signal)
+                return False
+
+            # Peak of the prekey up to the arming sample, including the part seen in earlier blocks
+            arm_index = armed[0]
+            run_start = arm_index - run_length[arm_index] + 1
+            self._run_peak = max(
+                self._run_peak if run_start < 0 else 0.0,
+                np.max(fh_signal[max(run_start, 0) : arm_index + 1]),
+            )
+            self.state = DemodState.ARMED
+            self._scan_index += arm_index
+            fh_signal = fh_signal[arm_index:]
+
+        # Find start of payload after the prekey, about 50% of the running peak value
+        peak = np.maximum.accumulate(np.maximum(fh_signal, self._run_peak))
+        below = np.flatnonzero(fh_signal <= 0.5 * peak)
+        if len(below) == 0:
+            self._run_peak = peak[-1]
+            self._scan_index += len(fh_signal)
+            return False
+
+        self._lock(self._scan_index + below[0], peak[below[0]])
+        return True
+
+    def _lock(self, payload_index: int, fh_peak: float) -> None:
+        """
+        Synchronize on the start of a payload
+        :param payload_index: Absolute sample index the payload starts at
+        :param fh_peak: The FH peak of the prekey
+        """
+        self.state = DemodState.SYNC
+
+        # Normalize from far enough back for the sync loop to look behind the first bit
+        self._norm_offset = max(payload_index - self._lookback, self._offset)
+        self._fh_norm = np.zeros(0, dtype=self.precision.real_dtype)
+        self._fl_norm = np.zeros(0, dtype=self.precision.real_dtype)
+        self._fh_peak = fh_peak
+        self._fl_peak = 0.0
+        self._extend_normalized(self._norm_offset - self._offset)
+
+        # Move to the center of the first bit
+        self._sample_index = payload_index + self.samples_per_symbol // 2
+
+        # Same start as _nrzi_decode, the bits are set to 1 and the skipped bit decodes as 0
+        self._prev_bit = 0
+        self._byte_value = 0b011
+        self._bit_position = 3
+
+    def _extract(self, frames: list[bytearray]) -> bool:
+        """
+        Extract bits while the buffer holds enough samples around the sample index
+        :param frames: List completed frames are appended to
+        :return: Whether a frame ended and the demodulator returned to prekey search
+        """
+        samples_per_symbol = self.samples_per_symbol
+        end = self._norm_offset + len(self._fh_norm) - self._lookahead
+
+        # Work on indices relative to the normalized tracks
+        fh_signal = self._fh_norm
+        fl_signal = self._fl_norm
+        sample_index = self._sample_index - self._norm_offset
+        end -= self._norm_offset
+
+        while sample_index < end:
+            sample_index += samples_per_symbol
+
+            # Compare FH and FL signals and NRZI decode against the previous bit
+            bit = self._prev_bit if fh_signal[sample_index] > fl_signal[sample_index] else 1 - self._prev_bit
+            self._prev_bit = bit
+
+            # Only the first 7 bits are packed, the 8th bit is parity
+            if self._bit_position < 7:
+                self._byte_value |= bit << self._bit_position
+            self._bit_position += 1
+
+            sample_index = _synchronize_signal(
+                fh_signal,
+                fl_signal,
+                sample_index=sample_index,
+                samples_per_symbol=samples_per_symbol,
+                clock_deviation=self.clock_deviation,
+                is_fh=True,
+            )
+            sample_index = _synchronize_signal(
+                fh_signal,
+                fl_signal,
+                sample_index=sample_index,
+                samples_per_symbol=samples_per_symbol,
+                clock_deviation=self.clock_deviation,
+                is_fh=False,
+            )
+
+            if self._bit_position == 8 and self._end_byte(frames, sample_index + self._norm_offset):
+                return True
+
+        self._sample_index = sample_index + self._norm_offset
+        return False
+
+    def _end_byte(self, frames: list[bytearray], sample_index: int) -> bool:
+        """
+        Append a completed byte to the frame and decide whether the frame is over
+        :param frames: List completed frames are appended to
+        :param sample_index: Absolute sample index after the byte
+        :return: Whether the frame ended
+        """
+        byte_value = self._byte_value
+        self._frame.append(byte_value)
+        self._byte_value = 0
+        self._bit_position = 0
+
+        if byte_value == EXPECTED_FRAME_CODES["SOH"]:
+            self._soh_seen = True
+
+        if self._soh_seen and byte_value == EXPECTED_FRAME_CODES["DEL"]:
+            frames.append(self._frame)
+        elif len(self._frame) >= self.max_frame_bytes:
+            # No DEL this far in means the lock was lost, the frame is incomplete so it is dropped, not emitted
+            self.frames_truncated += 1
+            metrics.count("frames_truncated")
+        elif self._soh_seen or len(self._frame) < self.sync_search_bytes:
+            return False
+
+        # Frame is done or the lock was false, resume the prekey search after the last bit
+        self._reset_burst()
+        self._scan_index = max(sample_index, self._offset)
+        return True
+
+    def _trim(self) -> None:
+        """
+        Drop samples the state machine can no longer look back at
+        """
+        if self.state == DemodState.SYNC:
+            keep_from = self._sample_index - self._lookback
+        else:
+            keep_from = self._scan_index - self._lookback
+        drop = min(max(keep_from - self._offset, 0), len(self._fh))
+
+        self._fh = self._fh[drop:]
+        self._fl = self._fl[drop:]
+        self._offset += drop
+
+        if self.state == DemodState.SYNC:
+            drop = max(keep_from - self._norm_offset, 0)
+            self._fh_norm = self._fh_norm[drop:]
+            self._fl_norm = self._fl_norm[drop:]
+            self._norm_offset += drop
+
+
 def message_region_detection(
     signal: np.ndarray,
     threshold_method: ThresholdMethod = ThresholdMethod.STD,
     window_size: int = 100,
     percentile: int | float = 40,
-) -> (int, int):
+    std_threshold: float = 1.0,
+    release_factor: float = 1.0,
+    min_length: int = 0,
+    merge_gap: int = 0,
+) -> np.ndarray[np.intp]:
     """
-    Detect the region of the message in the signal using a thresholding method.
+    Detect the regions of messages in the signal using a thresholding method.
+
+    Rolling statistics and the smoothing are box sums over cumulative sums and regions are segmented with np.diff, so
+    the cost is O(n) whatever the window size.
     :param signal: The input signal to detect the message region.
     :param threshold_method: The method to use for thresholding (STD or PERCENTILE).
     :param window_size: The size of the window for thresholding.
-    :param std_factor: The standard deviation factor for thresholding if STD.
     :param percentile: The percentile for thresholding if PERCENTILE.
-    :return: The start and end indices of the message region.
+    :param std_threshold: Rolling standard deviation a window needs to count as message if STD.
+    :param release_factor: Hysteresis, a region continues while the statistic stays above release_factor times the
+        threshold as long as somewhere it exceeds the threshold itself. 1.0 disables hysteresis
+    :param min_length: Regions shorter than this many samples are dropped
+    :param merge_gap: Regions separated by this many samples or fewer are merged
+    :return: Start and inclusive end indices of each message region as an (N, 2) array
     """
 
-    # Take the magnitude of the signal
-    signal_amplitude = np.abs(signal)
+    with metrics.stage("region_detection", samples_in=len(signal)) as timer:
+        # Take the magnitude of the signal
+        signal_amplitude = np.abs(signal)
 
-    # Compute the threshold for message detection
-    if threshold_method == ThresholdMethod.STD:
-        # Use a rolling std deviation
-        windows = np.lib.stride_tricks.sliding_window_view(
-            signal_amplitude, window_size
-        )
-        message_region = np.std(windows, axis=-1)
+        # Compute the threshold for message detection
+        if threshold_method == ThresholdMethod.STD:
+            # Use a rolling std deviation
+            rolling_std = _rolling_std(signal_amplitude, window_size)
+            message_region = rolling_std >= std_threshold
+            release_region = rolling_std >= std_threshold * release_factor
 
-        window_threshold = 0
-    elif threshold_method == ThresholdMethod.PERCENTILE:
-        threshold = np.percentile(signal_amplitude, percentile)
-        message_region = signal_amplitude > threshold
+            window_threshold = 0
+        elif threshold_method == ThresholdMethod.PERCENTILE:
+            threshold = np.percentile(signal_amplitude, percentile)
+            message_region = signal_amplitude > threshold
+            release_region = signal_amplitude > threshold * release_factor
 
-        window_threshold = window_size * ((100 - percentile) / 100)
-    else:
-        raise ValueError("Invalid threshold method")
+            window_threshold = window_size * ((100 - percentile) / 100)
+        else:
+            raise ValueError("Invalid threshold method")
 
-    # Smooth the threshold'd region to create hard boundaries
-    smoothed_region = np.convolve(
-        message_region.astype(int), np.ones(window_size), mode="same"
-    )
+        # Smooth the threshold'd region to create hard boundaries
+        # Convolution increases the amplitude
+        # Window threshold is dynamic based on the thresholding method
+        active = _box_sum_same(release_region, window_size) > window_threshold
+        seeds = _box_sum_same(message_region, window_size) > window_threshold
+
+        starts, ends = _active_runs(active)
+        starts, ends = _filter_regions(starts, ends, seeds, min_length, merge_gap)
+        timer.samples_out = int((ends - starts).sum())
+
+    metrics.count("bursts_detected", len(starts))
+
+    return np.stack((starts, ends), axis=-1)
+
+
+def _rolling_std(signal: np.ndarray, window_size: int) -> np.ndarray[np.float64]:
+    """
+    Standard deviation of every window_size window of a signal from cumulative sums
+    :param signal: The signal
+    :param window_size: The window size
+    :return: The standard deviation of each of the len(signal) - window_size + 1 windows
+    """
+    if len(signal) < window_size:
+        return np.zeros(0)
+
+    # The variance doesn't depend on the mean, removing it keeps the cumulative sums small and precise
+    centered = signal - np.mean(signal, dtype=np.float64)
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squared_sums = np.concatenate(([0.0], np.cumsum(centered * centered)))
+
+    window_sums = sums[window_size:] - sums[:-window_size]
+    window_squared_sums = squared_sums[window_size:] - squared_sums[:-window_size]
+    variance = (window_squared_sums - window_sums * window_sums / window_size) / window_size
+
+    # Rounding can push a constant window a hair below 0
+    return np.sqrt(np.maximum(variance, 0))
+
+
+def _box_sum_same(values: np.ndarray, window_size: int) -> np.ndarray:
+    """
+    np.convolve(values, np.ones(window_size), mode="same") as a difference of cumulative sums
+    :param values: The values to sum
+    :param window_size: The window size
+    :return: The sum of the window around each value
+    """
+    if 0 < len(values) < window_size:
+        # np.convolve swaps its inputs here, short enough to not matter
+        return np.convolve(values.astype(int), np.ones(window_size, dtype=int), mode="same")
+
+    sums = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    indices = np.arange(len(values))
+
+    # 'same' centers the window on the middle of the full convolution, window_size // 2 values back
+    return sums[np.minimum(indices + (window_size - 1) // 2 + 1, len(values))] - sums[
+        np.maximum(indices - window_size // 2, 0)
+    ]
+
+
+def _active_runs(active: np.ndarray[bool]) -> tuple[np.ndarray[np.intp], np.ndarray[np.intp]]:
+    """
+    Find the runs of True in a mask
+    :param active: The mask
+    :return: Start and inclusive end index of each run
+    """
+    edges = np.diff(active.astype(np.int8), prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+
+def _filter_regions(
+    starts: np.ndarray[np.intp], ends: np.ndarray[np.intp], seeds: np.ndarray[bool], min_length: int, merge_gap: int
+) -> tuple[np.ndarray[np.intp], np.ndarray[np.intp]]:
+    """
+    Keep the runs that contain a seed, merge the ones close together and drop the short ones
+    :param starts: Start index of each run
+    :param ends: Inclusive end index of each run
+    :param seeds: Mask of the samples that can start a region
+    :param min_length: Regions shorter than this many samples are dropped
+    :param merge_gap: Regions separated by this many samples or fewer are merged
+    :return: Start and inclusive end index of each region
+    """
+    seed_counts = np.concatenate(([0], np.cumsum(seeds, dtype=np.int64)))
+    seeded = seed_counts[ends + 1] > seed_counts[starts]
+    starts, ends = starts[seeded], ends[seeded]
+    if len(starts) == 0:
+        return starts, ends
+
+    # A gap longer than merge_gap separates two regions
+    separated = starts[1:] - ends[:-1] - 1 > merge_gap
+    starts = starts[np.concatenate(([True], separated))]
+    ends = ends[np.concatenate((separated, [True]))]
+
+    long_enough = ends - starts + 1 >= min_length
+    return starts[long_enough], ends[long_enough]
+
+
+class StreamingRegionDetector:
+    """
+    Streaming version of message_region_detection with the STD threshold method.
+
+    Blocks of any size are pushed with `process` and regions are returned, in absolute sample indices, once nothing
+    later in the stream can change them. After `flush` the regions are the same as message_region_detection over the
+    whole stream. Only the samples of the region being tracked are held, so memory doesn't grow with the stream.
+    """
+
+    def __init__(
+        self,
+        window_size: int = 100,
+        std_threshold: float = 1.0,
+        release_factor: float = 1.0,
+        min_length: int = 0,
+        merge_gap: int = 0,
+    ):
+        """
+        :param window_size: The size of the window for thresholding.
+        :param std_threshold: Rolling standard deviation a window needs to count as message.
+        :param release_factor: Hysteresis, see message_region_detection. 1.0 disables hysteresis
+        :param min_length: Regions shorter than this many samples are dropped
+        :param merge_gap: Regions separated by this many samples or fewer are merged
+        """
+        self.window_size = window_size
+        self.std_threshold = std_threshold
+        self.release_factor = release_factor
+        self.min_length = min_length
+        self.merge_gap = merge_gap
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Drop all carried state and restart the stream at sample 0
+        """
+        # The last window_size - 1 amplitudes, the start of the next window
+        self._amplitude_history = np.zeros(0)
+
+        # Threshold flags of every window not yet smoothed, and the window index of the first
+        self._message_flags = np.zeros(0, dtype=bool)
+        self._release_flags = np.zeros(0, dtype=bool)
+        self._flags_offset = 0
+        self._num_windows = 0
+
+        # Smoothed masks of every sample that may still be part of a region, and the index of the first
+        self._active = np.zeros(0, dtype=bool)
+        self._seeds = np.zeros(0, dtype=bool)
+        self._mask_offset = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray[np.intp]:
+        """
+        Detect regions in the next block of the stream
+        :param block: The next samples of the stream
+        :return: Start and inclusive end indices of the regions completed by this block as an (N, 2) array
+        """
+        amplitude = np.concatenate((self._amplitude_history, np.abs(block)))
+        rolling_std = _rolling_std(amplitude, self.window_size)
+        self._amplitude_history = amplitude[len(rolling_std) :]
+        self._num_windows += len(rolling_std)
+
+        self._message_flags = np.concatenate((self._message_flags, rolling_std >= self.std_threshold))
+        self._release_flags = np.concatenate(
+            (self._release_flags, rolling_std >= self.std_threshold * self.release_factor)
+        )
 
-    # Convolution increases the amplitude
-    # Window threshold is dynamic based on the thresholding method
-    message_indices = np.where(smoothed_region > window_threshold)[0]
-
-    # Find gaps in message_indices to segment regions
-    regions = []
-    if len(message_indices) > 0:
-        start_index = message_indices[0]
-        for i in range(1, len(message_indices)):
-            # If there's a gap between current and previous index, mark the end of a region
-            if message_indices[i] != message_indices[i - 1] + 1:
-                end_index = message_indices[i - 1]
-                regions.append((start_index, end_index))
-                start_index = message_indices[i]
-        # Append the last region
-        regions.append((start_index, message_indices[-1]))
-
-    return regions
+        # A smoothed sample needs the flags (window_size - 1) // 2 windows after it
+        return self._segment(self._num_windows - (self.window_size - 1) // 2, final=False)
+
+    def flush(self) -> np.ndarray[np.intp]:
+        """
+        Close the stream, windows past its end count as quiet, then reset
+        :return: Start and inclusive end indices of the remaining regions as an (N, 2) array
+        """
+        regions = self._segment(self._num_windows, final=True)
+        self.reset()
+        return regions
+
+    def _segment(self, smoothed_end: int, final: bool) -> np.ndarray[np.intp]:
+        """
+        Smooth the flags up to a window index and return the regions that can no longer change
+        :param smoothed_end: Index after the last window that can be smoothed
+        :param final: The stream has ended, every region is complete
+        :return: Start and inclusive end indices of the completed regions as an (N, 2) array
+        """
+        # Flags before the start of the stream and after its end are quiet
+        smoothed_start = self._mask_offset + len(self._active)
+        num_smoothed = max(smoothed_end - smoothed_start, 0)
+        active = self._box_sum(self._release_flags, smoothed_start, num_smoothed) > 0
+        seeds = self._box_sum(self._message_flags, smoothed_start, num_smoothed) > 0
+
+        # Flags further back than the next smoothed window's reach aren't needed again
+        drop = min(smoothed_start + num_smoothed - self.window_size // 2 - self._flags_offset, len(self._message_flags))
+        self._message_flags = self._message_flags[max(drop, 0) :]
+        self._release_flags = self._release_flags[max(drop, 0) :]
+        self._flags_offset += max(drop, 0)
+
+        self._active = np.concatenate((self._active, active))
+        self._seeds = np.concatenate((self._seeds, seeds))
+
+        starts, ends = _active_runs(self._active)
+
+        # A run touching the end of the masks may still grow, hold it back
+        hold_from = len(self._active)
+        if not final and len(ends) and ends[-1] == len(self._active) - 1:
+            hold_from = starts[-1]
+            starts, ends = starts[:-1], ends[:-1]
+
+        starts, ends = _filter_regions(starts, ends, self._seeds, min_length=0, merge_gap=self.merge_gap)
+
+        # A region is complete once the quiet after it is too long for anything later to merge into it
+        complete = (hold_from - ends - 1 > self.merge_gap) | final
+        keep_from = starts[~complete][0] if not complete.all() else hold_from
+
+        starts, ends = starts[complete], ends[complete]
+        long_enough = ends - starts + 1 >= self.min_length
+        regions = np.stack((starts[long_enough], ends[long_enough]), axis=-1) + self._mask_offset
+
+        self._active = self._active[keep_from:]
+        self._seeds = self._seeds[keep_from:]
+        self._mask_offset += keep_from
+
+        return regions
+
+    def _box_sum(self, flags: np.ndarray[bool], start: int, count: int) -> np.ndarray[np.int64]:
+        """
+        The 'same' box sum of the window flags for count windows from start
+        :param flags: Window flags starting at window self._flags_offset
+        :param start: Index of the first window to smooth
+        :param count: Number of windows to smooth
+        :return: The smoothed flags
+        """
+        # Window indices each box sum covers, clipped to the flags seen so far
+        sums = np.concatenate(([0], np.cumsum(flags, dtype=np.int64)))
+        indices = np.arange(start, start + count) - self._flags_offset
+        upper = np.clip(indices + (self.window_size - 1) // 2 + 1, 0, len(flags))
+        lower = np.clip(indices - self.window_size // 2, 0, len(flags))
+        return sums[upper] - sums[lower]
@@ -0,0 +1,433 @@
+"""
+Batch decoding of ACARS captures across a process pool.
+
+Files, or shards of large files, are decoded in worker processes and the results come back in the order the work was
+planned, each with its own timing and error. A file that fails to decode is reported and the batch carries on.
+
+Usage:
+    python -m src.batch captures/ --fs 1.152e6 --workers 8
+"""
+import argparse
+import os
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from fractions import Fraction
+from functools import partial
+
+import numpy as np
+
+import metrics
+import resampling
+from am_modulation.demod import am_rectified_async_demodulate
+from filters.fir_filter import low_pass_filter
+from normalization import normalize_burst, normalize_signal
+from precision import Precision
+from readers import IQFormat, open_iq
+from src.acars import AcarsMessage, DemodPlan, ThresholdMethod, message_region_detection, parse_acars_record
+from src.reassembly import ReassemblyTable
+from src.validation import ValidationCounters, filter_valid_frames
+
+# Symbol rate is always 2400 for ACARS
+BD = 2400
+
+# Sample rate the audio is resampled to before demodulation
+AUDIO_FS = 48000
+
+# Longest ACARS transmission, shards read this far past their end so a message that starts in a shard is whole
+SHARD_OVERLAP_SECONDS = 1.5
+
+# Samples read before a shard so a message starting right at the shard boundary isn't cut by the filters
+SHARD_LEAD_SECONDS = 0.1
+
+# Jobs in flight per worker, bounds the memory held by results that are waiting on an earlier job
+JOBS_PER_WORKER = 4
+
+# Longest a job may run before it is reported as an error and its worker is killed
+JOB_TIMEOUT_SECONDS = 600.0
+
+
+@dataclass(frozen=True)
+class BatchJob:
+    file_path: str
+    start: int = 0
+    stop: int | None = None
+    fs: float | None = None
+    iq_format: IQFormat | None = None
+    precision: Precision = Precision.SINGLE
+    agc: bool = False
+
+
+@dataclass
+class BatchResult:
+    job: BatchJob
+    messages: list[AcarsMessage] = field(default_factory=list)
+    elapsed: float = 0.0
+    failed_regions: int = 0
+    validation: ValidationCounters = field(default_factory=ValidationCounters)
+    error: str | None = None
+
+
+def plan_jobs(
+    file_paths: Iterable[str],
+    fs: float | None = None,
+    iq_format: IQFormat | None = None,
+    shard_seconds: float | None = None,
+    precision: Precision = Precision.SINGLE,
+    agc: bool = False,
+) -> list[BatchJob]:
+    """
+    Split files into jobs, one per file or one per shard of a file
+    :param file_paths: The captures to decode
+    :param fs: Sample rate of raw captures, WAV files carry their own
+    :param iq_format: Format of the captures, sniffed per file if not given
+    :param shard_seconds: Length of each shard, None decodes every file as one job
+    :param precision: Precision the jobs are decoded in
+    :param agc: Normalize bursts with the streaming AGC rather than by their peak
+    :return: The jobs in file then offset order
+    """
+    jobs = []
+    for file_path in file_paths:
+        if shard_seconds is None:
+            jobs.append(BatchJob(file_path, fs=fs, iq_format=iq_format, precision=precision, agc=agc))
+            continue
+
+        try:
+            iq_reader = open_iq(file_path, fs=fs, iq_format=iq_format)
+            num_samples, file_fs = len(iq_reader), iq_reader.fs
+        except (OSError, ValueError):
+            # Let the worker report why the file can't be read
+            jobs.append(BatchJob(file_path, fs=fs, iq_format=iq_format, precision=precision, agc=agc))
+            continue
+
+        shard_size = max(int(shard_seconds * file_fs), 1)
+        for start in range(0, max(num_samples, 1), shard_size):
+            jobs.append(
+                BatchJob(file_path, start, min(start + shard_size, num_samples), file_fs, iq_format, precision, agc)
+            )
+
+    return jobs
+
+
+def decode_samples(
+    samples: np.ndarray,
+    fs: float,
+    first_region: int = 0,
+    last_region: int | None = None,
+    counters: ValidationCounters | None = None,
+    precision: Precision = Precision.SINGLE,
+    agc: bool = False,
+) -> tuple[list[AcarsMessage], int]:
+    """
+    Run the detect, demod, validate and parse chain over AM modulated IQ samples
+    :param samples: The IQ samples
+    :param fs: The sample rate of the samples
+    :param first_region: Ignore messages that start before this sample
+    :param last_region: Ignore messages that start at or after this sample
+    :param counters: Counters to add the frame validation results to
+    :param precision: Precision of every stage of the chain
+    :param agc: Normalize bursts with the streaming AGC, which rides out impulses and fades within a burst but costs
+        10 to 20 times as much as dividing by the peak of the burst
+    :return: The parsed valid messages and the number of detected regions that failed to demodulate
+    """
+    samples_per_symbol = int(AUDIO_FS / BD)
+
+    # Need to use rectified demodulator
+    demodulated_samples = am_rectified_async_demodulate(samples, precision=precision)
+
+    # Experiment with cutoff 5-6 kHz
+    filtered_samples = low_pass_filter(demodulated_samples, cutoff=5.5e3, fs=fs, precision=precision)
+
+    # Resample to the audio rate with the smallest integer ratio, fractional sample rates included
+    resample_ratio = AUDIO_FS / Fraction(fs).limit_denominator()
+    resampled_samples, _ = resampling.resample(
+        filtered_samples,
+        up=resample_ratio.numerator,
+        down=resample_ratio.denominator,
+        samples_per_symbol=samples_per_symbol,
+        precision=precision,
+    )
+
+    # Message boundaries in audio samples
+    ratio = AUDIO_FS / fs
+    first_region = int(first_region * ratio)
+    last_region = len(resampled_samples) if last_region is None else int(last_region * ratio)
+
+    regions = message_region_detection(resampled_samples, threshold_method=ThresholdMethod.STD)
+    normalize = partial(normalize_burst, fs=AUDIO_FS) if agc else normalize_signal
+    bursts = [
+        normalize(resampled_samples[region_start:region_end])
+        for region_start, region_end in regions
+        if first_region <= region_start < last_region
+    ]
+
+    # Every burst of the job is demodulated together, bursts of similar lengths share NumPy calls
+    demod_plan = DemodPlan(fs=AUDIO_FS, samples_per_symbol=samples_per_symbol, precision=precision)
+    results, results_confidences = demod_plan.demod_batch(bursts, strip_parity=False, return_confidence=True)
+
+    demod_messages = [message for message in results if message is not None]
+    confidences = [confidence for confidence in results_confidences if confidence is not None]
+
+    # Noise bursts that trip the detector don't synchronize
+    failed_regions = len(bursts) - len(demod_messages)
+    metrics.count("demod_failures", failed_regions)
+
+    # Correct or drop frames with parity or BCS errors before spending any time parsing them
+    messages = [
+        parse_acars_record(message) for message in filter_valid_frames(demod_messages, counters, confidences)
+    ]
+
+    return messages, failed_regions
+
+
+def decode_job(job: BatchJob) -> BatchResult:
+    """
+    Decode one job, errors are caught and returned in the result
+    :param job: The job to decode
+    :return: The result of the job
+    """
+    started = time.perf_counter()
+    result = BatchResult(job)
+
+    try:
+        # Raw integer counts, the STD region detection threshold is tuned to them
+        iq_reader = open_iq(job.file_path, fs=job.fs, iq_format=job.iq_format, scale=False, precision=job.precision)
+        if iq_reader.fs is None:
+            raise ValueError("The sample rate is needed for raw captures")
+
+        stop = len(iq_reader) if job.stop is None else job.stop
+
+        # Read a little before the shard and a whole message past it, then keep the messages starting in the shard
+        read_start = max(job.start - int(SHARD_LEAD_SECONDS * iq_reader.fs), 0)
+        read_stop = stop + int(SHARD_OVERLAP_SECONDS * iq_reader.fs)
+        samples = iq_reader.read(read_start, read_stop)
+
+        result.messages, result.failed_regions = decode_samples(
+            samples,
+            iq_reader.fs,
+            first_region=job.start - read_start,
+            last_region=stop - read_start,
+            counters=result.validation,
+            precision=job.precision,
+            agc=job.agc,
+        )
+    except Exception as error:
+        # One bad capture must not take down the batch
+        result.error = f"{type(error).__name__}: {error}"
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def decode_files(
+    file_paths: Iterable[str],
+    fs: float | None = None,
+    iq_format: IQFormat | None = None,
+    shard_seconds: float | None = None,
+    max_workers: int | None = None,
+    precision: Precision = Precision.SINGLE,
+    job_timeout: float | None = JOB_TIMEOUT_SECONDS,
+    agc: bool = False,
+) -> Iterator[BatchResult]:
+    """
+    Decode captures across a process pool
+    :param file_paths: The captures to decode
+    :param fs: Sample rate of raw captures, WAV files carry their own
+    :param iq_format: Format of the captures, sniffed per file if not given
+    :param shard_seconds: Split files into shards of this length so large files use every worker
+    :param max_workers: Number of worker processes, defaults to the number of cores
+    :param precision: Precision the captures are decoded in
+    :param job_timeout: Seconds to wait for the result of each job before it is reported as an error, None to wait
+        forever. Counted from when the job is next in line, by then it is running
+    :param agc: Normalize bursts with the streaming AGC rather than by their peak
+    :return: An iterator of results in the order the jobs were planned
+    """
+    jobs = deque(
+        plan_jobs(file_paths, fs=fs, iq_format=iq_format, shard_seconds=shard_seconds, precision=precision, agc=agc)
+    )
+    max_workers = max_workers or os.cpu_count() or 1
+
+    pending = deque()
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        if job_timeout is not None:
+            # Fail before any job runs rather than when the first one times out
+            _worker_processes(executor)
+
+        while jobs or pending:
+            # Keep every worker busy without queueing the whole batch up front
+            while jobs and len(pending) < max_workers * JOBS_PER_WORKER:
+                job = jobs.popleft()
+                pending.append((job, executor.submit(decode_job, job)))
+
+            job, future = pending.popleft()
+            try:
+                yield future.result(timeout=job_timeout)
+            except TimeoutError:
+                # The job is stuck in a worker that can't be interrupted, kill the pool and requeue the other jobs
+                _terminate(executor)
+                jobs.extendleft(reversed([pending_job for pending_job, _ in pending]))
+                pending.clear()
+
+                yield BatchResult(job, elapsed=job_timeout, error=f"TimeoutError: No result after {job_timeout} s")
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+            except BrokenProcessPool:
+                # A worker died outright and took the pool with it, requeue the jobs that were in flight
+                executor.shutdown(cancel_futures=True)
+                jobs.extendleft(reversed([pending_job for pending_job, _ in pending]))
+                pending.clear()
+
+                # Any of the running jobs could have killed it, rerun this one alone to find out if it was the cause
+                yield _decode_isolated(job, job_timeout)
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _decode_isolated(job: BatchJob, job_timeout: float | None = JOB_TIMEOUT_SECONDS) -> BatchResult:
+    """
+    Decode a job in a process of its own so a crash is pinned on the job that caused it
+    :param job: The job to decode
+    :param job_timeout: Seconds to wait for the result before it is reported as an error, None to wait forever
+    :return: The result of the job
+    """
+    executor = ProcessPoolExecutor(max_workers=1)
+    try:
+        return executor.submit(decode_job, job).result(timeout=job_timeout)
+    except TimeoutError:
+        _terminate(executor)
+        return BatchResult(job, elapsed=job_timeout, error=f"TimeoutError: No result after {job_timeout} s")
+    except BrokenProcessPool as error:
+        return BatchResult(job, error=f"{type(error).__name__}: {error}")
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _terminate(executor: ProcessPoolExecutor) -> None:
+    """
+    Kill the workers of a pool and shut it down without waiting on the jobs they are running
+    :param executor: The pool
+    """
+    # There is no public way to stop a running job, the worker processes have to go
+    for process in list(_worker_processes(executor).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _worker_processes(executor: ProcessPoolExecutor) -> dict:
+    """
+    The worker processes of a pool, by pid. ProcessPoolExecutor only keeps them in the private _processes, which
+    every CPython since 3.2 has, this fails loudly rather than leaving a stuck job running if that ever changes
+    :param executor: The pool
+    :return: The worker processes, empty once the pool is shut down
+    """
+    if not hasattr(executor, "_processes"):
+        raise RuntimeError(
+            "ProcessPoolExecutor no longer exposes _processes on this Python, stuck jobs can't be killed. "
+            "Run without a job timeout"
+        )
+    return executor._processes or {}
+
+
+def _expand_paths(paths: Iterable[str]) -> list[str]:
+    """
+    Expand directories to the files in them
+    :param paths: Files and directories
+    :return: Sorted file paths
+    """
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_paths.extend(
+                sorted(
+                    os.path.join(path, name) for name in os.listdir(path) if os.path.isfile(os.path.join(path, name))
+                )
+            )
+        else:
+            file_paths.append(path)
+    return file_paths
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Decode ACARS from directories of IQ captures")
+    parser.add_argument("paths", nargs="+", help="Captures or directories of captures")
+    parser.add_argument("--fs", type=float, help="Sample rate of raw captures")
+    parser.add_argument("--format", choices=[iq_format.value for iq_format in IQFormat], help="Capture format")
+    parser.add_argument("--shard-seconds", type=float, help="Split captures into shards of this many seconds")
+    parser.add_argument("--workers", type=int, help="Number of worker processes")
+    parser.add_argument(
+        "--job-timeout",
+        type=float,
+        default=JOB_TIMEOUT_SECONDS,
+        help="Seconds a job may take before it is reported as an error, 0 to wait forever",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=[precision.value for precision in Precision],
+        default=Precision.SINGLE.value,
+        help="Floating point precision of the decode chain, double to check single precision results",
+    )
+    parser.add_argument(
+        "--agc",
+        action="store_true",
+        help="Normalize bursts with the streaming AGC, copes with impulses and fades at 10 to 20 times the cost",
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    num_messages = 0
+    num_errors = 0
+    counters = ValidationCounters()
+    reassembly = ReassemblyTable()
+
+    for result in decode_files(
+        _expand_paths(args.paths),
+        fs=args.fs,
+        iq_format=args.format and IQFormat(args.format),
+        shard_seconds=args.shard_seconds,
+        max_workers=args.workers,
+        precision=Precision(args.precision),
+        job_timeout=args.job_timeout or None,
+        agc=args.agc,
+    ):
+        job = result.job
+        stop = "end" if job.stop is None else job.stop
+        if result.error is not None:
+            num_errors += 1
+            print(f"{job.file_path} [{job.start}:{stop}] ERROR {result.error}")
+            continue
+
+        num_messages += len(result.messages)
+        counters.count_from(result.validation)
+        print(
+            f"{job.file_path} [{job.start}:{stop}] {len(result.messages)} messages, "
+            f"{result.validation.corrected} corrected, "
+            f"{result.validation.frames - result.validation.valid - result.validation.corrected} rejected "
+            f"in {result.elapsed:.2f} s"
+        )
+        for message in result.messages:
+            print(f"META--->>: {message.format_meta()}")
+
+            # Results come back in capture order, so the blocks of a message arrive in the order they were sent
+            whole_message = reassembly.add(message)
+            if whole_message is not None and whole_message is not message:
+                print(f"REASSEMBLED--->>: {whole_message.format_meta()}")
+
+    print(f"{num_messages} messages, {num_errors} errors in {time.perf_counter() - started:.2f} s")
+    print(
+        f"Frames: {counters.frames} valid={counters.valid} no_frame={counters.no_frame} "
+        f"parity={counters.parity_errors} bcs={counters.bcs_errors} corrected={counters.corrected}"
+    )
+    print(
+        f"Reassembly: completed={reassembly.counters.completed} partial={len(reassembly)} "
+        f"duplicates={reassembly.counters.duplicates} out_of_sequence={reassembly.counters.out_of_sequence} "
+        f"expired={reassembly.counters.expired} evicted={reassembly.counters.evicted} "
+        f"oversized={reassembly.counters.oversized} orphaned={reassembly.counters.orphaned}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Reassembly of multi-block ACARS messages.
+
+Long messages are sent as several blocks. Every block but the last ends in ETB, the last ends in ETX. The blocks of a
+message share the registration, label and message number (the first three characters of the sequence field) and are
+ordered by the block sequence character that follows it, 'A' for the first block, 'B' for the second and so on.
+A block that doesn't follow the last one held drops the partial message, and a block other than 'A' without a partial
+message to go on is an orphan whose earlier blocks were missed. Orphans are counted and dropped.
+
+Only downlink blocks with text carry a message number, a letter, two digits and the block letter. Uplinks and frames
+without STX have none and can't be stitched, they come straight back.
+
+Partial messages are held in a table of fixed capacity. Entries that see no block for `ttl` seconds expire and the
+least recently updated entry is evicted when the table is full, so memory stays flat whatever the traffic.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+
+from src.acars import AcarsMessage
+
+# ACARS allows at most 16 blocks per message
+MAX_BLOCKS = 16
+
+# Length of a message number with its block letter
+MESSAGE_NUMBER_LENGTH = 4
+
+
+@dataclass
+class ReassemblyCounters:
+    completed: int = 0
+    duplicates: int = 0
+    out_of_sequence: int = 0
+    expired: int = 0
+    evicted: int = 0
+    oversized: int = 0
+    orphaned: int = 0
+
+
+@dataclass(slots=True)
+class _PartialMessage:
+    last_block: AcarsMessage
+    updated: float
+    texts: list[str] = field(default_factory=list)
+
+
+class ReassemblyTable:
+    """
+    Stitch the blocks of multi-block ACARS messages back together.
+
+    Blocks are pushed with `add` in the order they are received. Single block messages come straight back, blocks of
+    a longer message are held until its final block arrives and the whole message is returned as one AcarsMessage.
+    """
+
+    def __init__(self, capacity: int = 1024, ttl: float = 600.0, max_blocks: int = MAX_BLOCKS):
+        """
+        :param capacity: Most partial messages held at once
+        :param ttl: Seconds a partial message is held without receiving a block
+        :param max_blocks: Most blocks per message, longer messages are dropped
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_blocks = max_blocks
+        self.counters = ReassemblyCounters()
+        self._partials: OrderedDict[tuple[str, str, str], _PartialMessage] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._partials)
+
+    def add(self, message: AcarsMessage, timestamp: float | None = None) -> AcarsMessage | None:
+        """
+        Add a received block
+        :param message: The block
+        :param timestamp: Time the block was received in seconds, defaults to time.monotonic(). Must not go backwards
+        :return: The whole message once its final block is added, None while it is incomplete
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        self.expire(timestamp)
+
+        if not _has_message_number(message):
+            # Nothing to key the blocks by
+            return message
+
+        key = (message.registration, message.label, message.sequence[:3])
+        block = message.sequence[3]
+        partial = self._partials.pop(key, None)
+
+        if partial is not None:
+            if message.sequence == partial.last_block.sequence:
+                # Retransmission of the block we already have
+                self.counters.duplicates += 1
+                self._partials[key] = partial
+                return None
+
+            if block != chr(ord(partial.last_block.sequence[3]) + 1):
+                # Blocks went missing or came out of order, the message can't be completed
+                self.counters.out_of_sequence += 1
+                if block != "A":
+                    return None
+                partial = None
+
+        if partial is None:
+            if block != "A":
+                # The blocks before it were missed, its message can't be completed
+                self.counters.orphaned += 1
+                return None
+            if message.final_block:
+                # Single block messages don't need the table
+                return message
+            partial = _PartialMessage(message, timestamp)
+
+        partial.texts.append(message.text)
+        partial.last_block = message
+        partial.updated = timestamp
+
+        if message.final_block:
+            self.counters.completed += 1
+            return replace(message, text="".join(partial.texts))
+
+        if len(partial.texts) >= self.max_blocks:
+            self.counters.oversized += 1
+            return None
+
+        # Most recently updated last
+        self._partials[key] = partial
+        if len(self._partials) > self.capacity:
+            self._partials.popitem(last=False)
+            self.counters.evicted += 1
+
+        return None
+
+    def expire(self, timestamp: float | None = None) -> int:
+        """
+        Drop the partial messages that haven't received a block within the TTL
+        :param timestamp: The current time in seconds, defaults to time.monotonic()
+        :return: The number of partial messages dropped
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+
+        # Entries are ordered by their last update so the stale ones are at the front
+        expired = 0
+        while self._partials and timestamp - next(iter(self._partials.values())).updated > self.ttl:
+            self._partials.popitem(last=False)
+            expired += 1
+
+        self.counters.expired += expired
+        return expired
+
+    def clear(self) -> None:
+        """
+        Drop every partial message
+        """
+        self._partials.clear()
+
+
+def _has_message_number(message: AcarsMessage) -> bool:
+    """
+    Whether a block carries a message number to reassemble it by
+    :param message: The block
+    :return: True for a letter, two digits and a block letter after STX
+    """
+    sequence = message.sequence
+    return (
+        message.stx
+        and len(sequence) == MESSAGE_NUMBER_LENGTH
+        and sequence.isascii()
+        and sequence[0].isupper()
+        and sequence[1:3].isdigit()
+        and sequence[3].isupper()
+    )
@@ -0,0 +1,203 @@
+"""
+Live decoding of ACARS from rtl_tcp receivers.
+
+Each receiver is read by an asyncio task into a bounded queue of blocks, the blocks go through the AM detect, resample
+and demod chain in an executor so the event loop stays free for the sockets, and the messages from every receiver are
+merged into one bounded queue. A slow stage blocks the one before it rather than buffering, so any number of receivers
+are decoded on one event loop with flat memory.
+
+Usage:
+    python -m src.stream 192.168.1.10:1234 192.168.1.11:1234 --fs 1.152e6 --frequency 131.55e6
+"""
+import argparse
+import asyncio
+from collections.abc import AsyncIterator, Iterable
+from concurrent.futures import Executor
+
+import numpy as np
+
+import metrics
+from am_modulation.demod import am_rectified_async_demodulate
+from normalization import StreamingNormalizer
+from precision import Precision
+from readers.rtl_tcp import QUEUE_SIZE, RTL_TCP_PORT, RtlTcpSource
+from resampling.multistage import plan_resampling
+from src.acars import AcarsMessage, StreamingDemodulator, parse_acars_record
+from src.reassembly import ReassemblyTable
+
+# Symbol rate is always 2400 for ACARS
+BD = 2400
+
+# Sample rate the audio is resampled to before demodulation
+AUDIO_FS = 48000
+
+
+class StreamDecoder:
+    """
+    The stateful decode chain for one receiver.
+
+    Blocks of AM modulated IQ samples of any size are pushed with `process`. The resampler, AGC and demodulator carry
+    their state between blocks, so messages split across blocks decode the same as in one piece.
+    """
+
+    def __init__(self, fs: float, cutoff: float = 5.5e3, precision: Precision = Precision.SINGLE):
+        """
+        :param fs: The sample rate of the IQ samples, any rate above 48000
+        :param cutoff: Highest frequency of the AM envelope kept free of aliases when resampling to 48000
+        :param precision: Precision of every stage of the chain
+        """
+        self.fs = fs
+        self.precision = Precision(precision)
+
+        # Experiment with cutoff 5-6 kHz
+        self._resampler = plan_resampling(fs, AUDIO_FS, passband=cutoff).resampler()
+        self._normalizer = StreamingNormalizer(AUDIO_FS)
+        self._demodulator = StreamingDemodulator(
+            fs=AUDIO_FS, samples_per_symbol=AUDIO_FS // BD, precision=self.precision
+        )
+
+    def reset(self) -> None:
+        self._resampler.reset()
+        self._normalizer.reset()
+        self._demodulator.reset()
+
+    def process(self, block: np.ndarray[np.complex64]) -> list[AcarsMessage]:
+        """
+        Decode the next block of the stream
+        :param block: The next IQ samples
+        :return: The messages completed within this block
+        """
+        # Need to use rectified demodulator
+        audio = self._resampler.process(am_rectified_async_demodulate(block, precision=self.precision))
+        return self._parse(self._demodulator.process(self._normalizer.process(audio)))
+
+    def flush(self) -> list[AcarsMessage]:
+        """
+        Drain the filters at the end of the stream, then reset
+        :return: The messages completed by the flush
+        """
+        frames = self._demodulator.process(self._normalizer.process(self._resampler.flush()))
+        frames.extend(self._demodulator.flush())
+        self.reset()
+        return self._parse(frames)
+
+    @staticmethod
+    def _parse(frames: list[bytearray]) -> list[AcarsMessage]:
+        # The prekey can lose a byte or gain one at lock, parse from wherever the SOH landed
+        messages = [parse_acars_record(frame, soh_index=frame.find(0x01)) for frame in frames if 0x01 in frame]
+        metrics.count("frames_decoded", len(messages))
+        metrics.count("frames_rejected", len(frames) - len(messages))
+        return messages
+
+
+async def decode_stream(
+    source: RtlTcpSource, decoder: StreamDecoder, executor: Executor | None = None
+) -> AsyncIterator[AcarsMessage]:
+    """
+    Decode a connected source until its server closes the connection
+    :param source: The connected source
+    :param decoder: The decoder for the source's sample rate
+    :param executor: Executor the decode chain runs in, the event loop's default thread pool if not given. The
+        decoder is stateful so the blocks of a stream are decoded one at a time, in order
+    :return: An async iterator of the decoded messages
+    """
+    loop = asyncio.get_running_loop()
+
+    # The source keeps reading into its bounded queue while a block is decoded
+    async for block in source.blocks():
+        for message in await loop.run_in_executor(executor, decoder.process, block):
+            yield message
+
+    for message in await loop.run_in_executor(executor, decoder.flush):
+        yield message
+
+
+async def decode_receivers(
+    sources: Iterable[RtlTcpSource], executor: Executor | None = None, queue_size: int = QUEUE_SIZE
+) -> AsyncIterator[tuple[RtlTcpSource, AcarsMessage]]:
+    """
+    Decode several receivers concurrently on one event loop
+    :param sources: The sources, connected here. Each must have its sample rate set
+    :param executor: Executor the decode chains run in, the event loop's default thread pool if not given
+    :param queue_size: Messages buffered before the receivers are paused
+    :return: An async iterator of (source, message) in the order the messages are decoded
+    """
+    sources = list(sources)
+    for source in sources:
+        if source.fs is None:
+            raise ValueError(f"The sample rate of {source.host}:{source.port} must be set")
+
+    queue = asyncio.Queue(maxsize=queue_size)
+
+    async def receive(source: RtlTcpSource) -> None:
+        async with source:
+            async for message in decode_stream(source, StreamDecoder(source.fs), executor):
+                # Waits while the consumer is behind, which pauses this receiver's socket in turn
+                await queue.put((source, message))
+
+    async def run() -> None:
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                for source in sources:
+                    task_group.create_task(receive(source))
+        except Exception:
+            # Wake the consumer so it can pick up the error
+            await queue.put(None)
+            raise
+
+        await queue.put(None)
+
+    runner = asyncio.create_task(run())
+    try:
+        while (item := await queue.get()) is not None:
+            yield item
+
+        # Surface a failed receiver
+        await runner
+    finally:
+        runner.cancel()
+
+
+def _parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return (host, int(port)) if host else (address, RTL_TCP_PORT)
+
+
+async def _decode(args: argparse.Namespace) -> None:
+    sources = [
+        RtlTcpSource(host, port, fs=args.fs, center_frequency=args.frequency, gain=args.gain)
+        for host, port in map(_parse_address, args.addresses)
+    ]
+    reassembly = {id(source): ReassemblyTable() for source in sources}
+
+    async for source, message in decode_receivers(sources):
+        print(f"{source.host}:{source.port} META--->>: {message.format_meta()}")
+
+        whole_message = reassembly[id(source)].add(message)
+        if whole_message is not None and whole_message is not message:
+            print(f"{source.host}:{source.port} REASSEMBLED--->>: {whole_message.format_meta()}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Decode ACARS live from rtl_tcp receivers")
+    parser.add_argument("addresses", nargs="+", help="host:port of each rtl_tcp server")
+    parser.add_argument("--fs", type=float, default=1.152e6, help="Sample rate")
+    parser.add_argument("--frequency", type=float, help="Frequency to tune the receivers to")
+    parser.add_argument("--gain", type=float, help="Tuner gain in dB, automatic if not given")
+    parser.add_argument("--metrics", action="store_true", help="Print per-stage metrics in Prometheus format on exit")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable()
+
+    try:
+        asyncio.run(_decode(args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.metrics:
+            print(metrics.REGISTRY.prometheus(), end="")
+
+
+if __name__ == "__main__":
+    main()
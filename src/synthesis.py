@@ -0,0 +1,400 @@
+"""
+Vectorized ACARS transmitter for load generation.
+
+Messages are encoded to frames, prekey to DEL with parity and BCS, as rows of a 2D array, then MSK modulated and AM
+modulated onto an IQ carrier for the whole batch at once. Every stage writes into arrays sized up front and
+`synthesize_capture` builds a capture of any length a batch of bursts at a time, so memory is bounded by the batch.
+
+The channel is configurable per burst: carrier frequency offset, symbol clock drift, carrier phase and noise.
+
+Usage:
+    capture, starts = synthesize_capture(messages, fs=1.152e6, snr_db=20, rng=0)
+"""
+from collections.abc import Sequence
+
+import numpy as np
+
+from src.acars import AcarsMessage
+from src.validation import ETB, ETX, ODD_PARITY_TABLE, SOH, crc16
+
+# Symbol rate is always 2400 for ACARS
+BD = 2400
+
+# MSK tones, FH when a bit repeats the previous bit and FL when it changes
+FL = 1200
+FH = 2400
+
+# Bytes of FH tone before the frame, all ones NRZI encode to a steady FH
+PREKEY_BYTES = 16
+
+# Characters between the prekey and the SOH
+FRAME_START = b"+*\x16\x16"
+
+STX = 0x02
+DEL = 0x7F
+
+# Carrier rise and fall time in symbols
+RAMP_SYMBOLS = 1
+
+# Bursts modulated at once by synthesize_capture
+BATCH_SIZE = 256
+
+# Silence before, between and after the bursts of a capture
+GAP_SECONDS = 0.25
+
+
+def _odd_parity(characters: np.ndarray[np.uint8]) -> np.ndarray[np.uint8]:
+    """
+    Set the 8th bit of every character so it has odd parity
+    :param characters: 7 bit characters
+    :return: The characters with their parity bits
+    """
+    characters = characters & 0x7F
+    return characters | np.where(ODD_PARITY_TABLE[characters], 0, 0x80).astype(np.uint8)
+
+
+# Prekey and frame start as sent, the same for every frame
+_FRAME_HEADER = b"\xff" * PREKEY_BYTES + _odd_parity(np.frombuffer(FRAME_START + bytes((SOH,)), np.uint8)).tobytes()
+
+
+def _frame_body(message: AcarsMessage) -> bytes:
+    """
+    The characters of a message from the mode to the ETX or ETB, without parity bits
+    :param message: The message
+    :return: The characters
+    """
+    header = message.mode + message.registration + message.ack + message.label + message.block_id
+    text = message.sequence + message.flight + message.text if message.stx else ""
+    end = ETX if message.final_block else ETB
+    return (header + ("\x02" if message.stx else "") + text).encode("ascii") + bytes((end,))
+
+
+def encode_frames(messages: Sequence[AcarsMessage]) -> tuple[np.ndarray[np.uint8], np.ndarray[np.intp]]:
+    """
+    Encode messages to frames as they are sent, prekey, '+', '*', SYN, SYN, SOH, the message with parity, BCS and DEL
+    :param messages: The messages
+    :return: The frames as the rows of a zero padded 2D array and the length of each frame
+    """
+    bodies = [_frame_body(message) for message in messages]
+    body_lengths = np.fromiter((len(body) for body in bodies), dtype=np.intp, count=len(bodies))
+
+    header_length = len(_FRAME_HEADER)
+    lengths = header_length + body_lengths + 3
+    frames = np.zeros((len(bodies), max(lengths, default=header_length + 3)), dtype=np.uint8)
+    frames[:, :header_length] = np.frombuffer(_FRAME_HEADER, dtype=np.uint8)
+
+    # Scatter every body into its row in one assignment
+    rows = np.repeat(np.arange(len(bodies)), body_lengths)
+    columns = np.arange(len(rows)) - np.repeat(np.cumsum(body_lengths) - body_lengths, body_lengths) + header_length
+    frames[rows, columns] = _odd_parity(np.frombuffer(b"".join(bodies), dtype=np.uint8))
+
+    # BCS over everything after the SOH, least significant byte first, then DEL
+    bcs = crc16(frames[:, header_length:], body_lengths)
+    row_indices = np.arange(len(bodies))
+    bcs_index = header_length + body_lengths
+    frames[row_indices, bcs_index] = bcs & 0xFF
+    frames[row_indices, bcs_index + 1] = bcs >> 8
+    frames[row_indices, bcs_index + 2] = _odd_parity(np.array([DEL], dtype=np.uint8))[0]
+
+    return frames, lengths
+
+
+def burst_lengths(
+    frame_lengths: np.ndarray[np.intp], fs: float, drift: float | np.ndarray = 0.0
+) -> np.ndarray[np.intp]:
+    """
+    Number of samples each frame modulates to
+    :param frame_lengths: The length of each frame in bytes
+    :param fs: Sample rate
+    :param drift: Fractional symbol clock error of each burst
+    :return: The length of each burst in samples
+    """
+    symbol_rate = BD * (1 + np.broadcast_to(drift, np.shape(frame_lengths)))
+    return np.floor(8 * np.asarray(frame_lengths) * fs / symbol_rate).astype(np.intp)
+
+
+def msk_modulate(
+    frames: np.ndarray[np.uint8],
+    lengths: np.ndarray[np.intp],
+    fs: float,
+    drift: float | np.ndarray = 0.0,
+    out: np.ndarray[np.float32] | None = None,
+) -> tuple[np.ndarray[np.float32], np.ndarray[np.intp]]:
+    """
+    NRZI encode and MSK modulate frames, least significant bit first, with continuous phase across symbols.
+
+    Over a symbol FH advances the phase by a whole cycle and FL by half a cycle, so every symbol starts at a phase of
+    0 or pi and is a cosine of its tone with the sign set by the number of FL symbols before it. Clock drift stretches
+    the tones with the symbols, as when the modem clock is off.
+    :param frames: The frames as the rows of a zero padded 2D array
+    :param lengths: The length of each frame in bytes
+    :param fs: Sample rate
+    :param drift: Fractional symbol clock error, one for all bursts or one per burst
+    :param out: Array of at least (number of frames, longest burst) to write the audio into
+    :return: The audio of each burst as the rows of a zero padded 2D array and the length of each burst
+    """
+    frames = np.atleast_2d(frames)
+    num_bursts = len(frames)
+    drift = np.broadcast_to(np.asarray(drift, dtype=np.float64), (num_bursts,))
+
+    # NRZI, FH when a bit repeats the one before it. The prekey before the frame is all ones
+    bits = np.unpackbits(frames, axis=1, bitorder="little")
+    previous = np.concatenate((np.ones((num_bursts, 1), dtype=np.uint8), bits[:, :-1]), axis=1)
+    is_fl = bits != previous
+
+    # Every FL symbol flips the sign of the symbols after it, only the parity of the count matters
+    flips = np.cumsum(is_fl, axis=1, dtype=np.int8) - is_fl
+
+    num_samples = burst_lengths(lengths, fs, drift)
+    max_samples = int(num_samples.max(initial=0))
+    if out is None:
+        out = np.empty((num_bursts, max_samples), dtype=np.float32)
+    elif out.shape[0] < num_bursts or out.shape[1] < max_samples:
+        raise ValueError(f"out needs to be at least {(num_bursts, max_samples)}, got {out.shape}")
+    audio = out[:num_bursts, :max_samples]
+
+    samples_per_symbol = fs / BD
+    if samples_per_symbol == int(samples_per_symbol) and not np.any(drift):
+        # Every symbol is one of four waveforms, FH or FL either sign, so copy them into place
+        samples_per_symbol = int(samples_per_symbol)
+        fraction = np.arange(samples_per_symbol, dtype=np.float32) / np.float32(samples_per_symbol)
+        waveforms = np.cos(np.float32(2 * np.pi) * np.array([[FL / BD], [FH / BD]], dtype=np.float32) * fraction)
+        waveforms = np.concatenate((waveforms, -waveforms))
+
+        # Frames can be padded past the longest burst
+        num_symbols = max_samples // samples_per_symbol
+        waveform_index = (~is_fl[:, :num_symbols]).astype(np.intp) + 2 * (flips[:, :num_symbols] & 1)
+        if audio.flags.c_contiguous:
+            np.take(waveforms, waveform_index, axis=0, out=audio.reshape(num_bursts, num_symbols, samples_per_symbol))
+        else:
+            audio[:] = np.take(waveforms, waveform_index, axis=0).reshape(num_bursts, max_samples)
+    else:
+        # Cycles of the tone per symbol signed with the sign of the symbol
+        codes = np.where(is_fl, np.float32(FL / BD), np.float32(FH / BD)) * (1 - 2 * (flips & 1)).astype(np.float32)
+        _msk_drifting(codes, fs, drift, audio)
+
+    for burst, length in zip(audio, num_samples):
+        burst[length:] = 0
+
+    return audio, num_samples
+
+
+def _msk_drifting(codes: np.ndarray[np.float32], fs: float, drift: np.ndarray, audio: np.ndarray[np.float32]) -> None:
+    """
+    MSK modulate at any sample rate and clock drift
+    :param codes: Cycles of the tone per symbol signed with the sign of the symbol
+    :param fs: Sample rate
+    :param drift: Fractional symbol clock error of each burst
+    :param audio: Array to write the audio into
+    """
+    max_samples = audio.shape[1]
+
+    # Position of every sample in symbols, split into its symbol and the fraction of the symbol gone
+    position = np.arange(max_samples, dtype=np.float32) * (BD * (1 + drift) / fs).astype(np.float32)[:, np.newaxis]
+    symbols = np.minimum(position.astype(np.intp), codes.shape[1] - 1)
+    position -= symbols
+
+    symbol_codes = np.take_along_axis(codes, symbols, axis=1)
+    np.multiply(position, np.abs(symbol_codes), out=position)
+    np.cos(np.float32(2 * np.pi) * position, out=audio)
+    audio *= np.sign(symbol_codes)
+
+
+def am_modulate_bursts(
+    audio: np.ndarray[np.float32],
+    num_samples: np.ndarray[np.intp],
+    fs: float,
+    amplitude: float = 1.0,
+    modulation_depth: float = 0.5,
+    frequency_offset: float | np.ndarray = 0.0,
+    phase: float | np.ndarray = 0.0,
+    out: np.ndarray[np.complex64] | None = None,
+) -> np.ndarray[np.complex64]:
+    """
+    AM modulate bursts of audio onto an IQ carrier keyed on for the length of each burst, with raised cosine edges
+    :param audio: The audio of each burst as the rows of a zero padded 2D array
+    :param num_samples: The length of each burst
+    :param fs: Sample rate
+    :param amplitude: Amplitude of the unmodulated carrier
+    :param modulation_depth: Modulation depth of the audio
+    :param frequency_offset: Carrier frequency offset from 0 Hz, one for all bursts or one per burst
+    :param phase: Carrier phase at the start of each burst, one for all bursts or one per burst
+    :param out: Array of at least the shape of audio to write the IQ samples into
+    :return: The IQ samples of each burst as the rows of a zero padded 2D array
+    """
+    num_bursts, max_samples = audio.shape
+    if out is None:
+        out = np.empty(audio.shape, dtype=np.complex64)
+    elif out.shape[0] < num_bursts or out.shape[1] < max_samples:
+        raise ValueError(f"out needs to be at least {audio.shape}, got {out.shape}")
+    iq = out[:num_bursts, :max_samples]
+
+    # Envelope in the real part, scaled in float32 so no float64 temporaries are made
+    envelope = iq.real
+    np.multiply(audio, np.float32(amplitude * modulation_depth), out=envelope)
+    envelope += np.float32(amplitude)
+    iq.imag = 0
+
+    # Raised cosine edges, and the carrier is off past the end of each burst
+    ramp_samples = max(int(round(RAMP_SYMBOLS * fs / BD)), 2)
+    ramp = (0.5 - 0.5 * np.cos(np.linspace(0, np.pi, ramp_samples))).astype(np.float32)
+    for burst, length in zip(iq, num_samples):
+        edge = min(ramp_samples, length // 2)
+        burst[:edge] *= ramp[:edge]
+        burst[length - edge : length] *= ramp[:edge][::-1]
+        burst[length:] = 0
+
+    # Bursts sharing a frequency offset share one carrier, only the starting phase differs
+    phase = np.broadcast_to(np.asarray(phase, dtype=np.float64), (num_bursts,))
+    iq *= np.exp(1j * phase).astype(np.complex64)[:, np.newaxis]
+
+    frequency_offset = np.asarray(frequency_offset, dtype=np.float64)
+    n = np.arange(max_samples)
+    if frequency_offset.ndim == 0 or np.all(frequency_offset == frequency_offset.flat[0]):
+        if frequency_offset.flat[0] != 0:
+            iq *= np.exp(2j * np.pi * frequency_offset.flat[0] / fs * n).astype(np.complex64)
+    else:
+        for burst, offset in zip(iq, np.broadcast_to(frequency_offset, (num_bursts,))):
+            burst *= np.exp(2j * np.pi * offset / fs * n).astype(np.complex64)
+
+    return iq
+
+
+def add_noise(samples: np.ndarray[np.complex64], std: float, rng: np.random.Generator) -> np.ndarray[np.complex64]:
+    """
+    Add complex white Gaussian noise in place
+    :param samples: The samples
+    :param std: Standard deviation of each of I and Q
+    :param rng: The random generator
+    :return: The samples
+    """
+    if samples.ndim > 1 and not samples.flags.c_contiguous:
+        # Rows of a larger array, each row is contiguous
+        for row in samples:
+            add_noise(row, std, rng)
+        return samples
+
+    # I and Q are interleaved float32 in memory
+    interleaved = samples.reshape(-1).view(np.float32)
+    noise = rng.standard_normal(len(interleaved), dtype=np.float32)
+    noise *= np.float32(std)
+    interleaved += noise
+    return samples
+
+
+def noise_std(amplitude: float, snr_db: float) -> float:
+    """
+    Noise standard deviation of each of I and Q for a carrier to noise ratio
+    :param amplitude: Amplitude of the unmodulated carrier
+    :param snr_db: Carrier power over the complex noise power in dB
+    :return: The standard deviation
+    """
+    return amplitude / np.sqrt(2 * 10 ** (snr_db / 10))
+
+
+def synthesize_bursts(
+    messages: Sequence[AcarsMessage],
+    fs: float,
+    amplitude: float = 1.0,
+    modulation_depth: float = 0.5,
+    frequency_offset: float | np.ndarray = 0.0,
+    drift: float | np.ndarray = 0.0,
+    snr_db: float | None = None,
+    rng: np.random.Generator | int | None = None,
+) -> tuple[np.ndarray[np.complex64], np.ndarray[np.intp]]:
+    """
+    Synthesize one IQ burst per message
+    :param messages: The messages
+    :param fs: Sample rate
+    :param amplitude: Amplitude of the unmodulated carrier
+    :param modulation_depth: Modulation depth of the audio
+    :param frequency_offset: Carrier frequency offset from 0 Hz, one for all bursts or one per burst
+    :param drift: Fractional symbol clock error, one for all bursts or one per burst
+    :param snr_db: Carrier to noise ratio in dB, no noise if not given
+    :param rng: Random generator or seed for the carrier phases and the noise
+    :return: The bursts as the rows of a zero padded 2D array and the length of each burst
+    """
+    rng = np.random.default_rng(rng)
+    frames, lengths = encode_frames(messages)
+    audio, num_samples = msk_modulate(frames, lengths, fs, drift)
+
+    phase = rng.uniform(0, 2 * np.pi, len(messages))
+    bursts = am_modulate_bursts(audio, num_samples, fs, amplitude, modulation_depth, frequency_offset, phase)
+    if snr_db is not None:
+        add_noise(bursts, noise_std(amplitude, snr_db), rng)
+
+    return bursts, num_samples
+
+
+def synthesize_capture(
+    messages: Sequence[AcarsMessage],
+    fs: float,
+    gap_seconds: float = GAP_SECONDS,
+    amplitude: float = 1.0,
+    modulation_depth: float = 0.5,
+    frequency_offset: float | np.ndarray = 0.0,
+    drift: float | np.ndarray = 0.0,
+    snr_db: float | None = None,
+    rng: np.random.Generator | int | None = None,
+    batch_size: int = BATCH_SIZE,
+    out: np.ndarray[np.complex64] | None = None,
+) -> tuple[np.ndarray[np.complex64], np.ndarray[np.intp]]:
+    """
+    Synthesize a capture of messages one after another with silence between them
+    :param messages: The messages
+    :param fs: Sample rate
+    :param gap_seconds: Silence before, between and after the bursts
+    :param amplitude: Amplitude of the unmodulated carrier
+    :param modulation_depth: Modulation depth of the audio
+    :param frequency_offset: Carrier frequency offset from 0 Hz, one for all bursts or one per burst
+    :param drift: Fractional symbol clock error, one for all bursts or one per burst
+    :param snr_db: Carrier to noise ratio in dB, no noise if not given. Noise covers the gaps too
+    :param rng: Random generator or seed for the carrier phases and the noise
+    :param batch_size: Bursts modulated at once, bounds the memory used on top of the capture
+    :param out: Array of at least the capture length to write the capture into
+    :return: The capture and the start sample of every burst
+    """
+    rng = np.random.default_rng(rng)
+    num_messages = len(messages)
+    frequency_offset = np.broadcast_to(np.asarray(frequency_offset, dtype=np.float64), (num_messages,))
+    drift = np.broadcast_to(np.asarray(drift, dtype=np.float64), (num_messages,))
+
+    frames, lengths = encode_frames(messages)
+    num_samples = burst_lengths(lengths, fs, drift)
+
+    # Lay the bursts out with a gap before each and one after the last
+    gap = int(gap_seconds * fs)
+    starts = gap + np.cumsum(num_samples + gap) - (num_samples + gap)
+    capture_length = int(starts[-1] + num_samples[-1] + gap) if num_messages else gap
+
+    if out is None:
+        out = np.empty(capture_length, dtype=np.complex64)
+    elif len(out) < capture_length:
+        raise ValueError(f"out needs at least {capture_length} samples, got {len(out)}")
+    capture = out[:capture_length]
+    capture[:] = 0
+
+    phase = rng.uniform(0, 2 * np.pi, num_messages)
+    for batch in range(0, num_messages, batch_size):
+        batch_slice = slice(batch, batch + batch_size)
+        audio, batch_samples = msk_modulate(frames[batch_slice], lengths[batch_slice], fs, drift[batch_slice])
+        bursts = am_modulate_bursts(
+            audio,
+            batch_samples,
+            fs,
+            amplitude,
+            modulation_depth,
+            frequency_offset[batch_slice],
+            phase[batch_slice],
+        )
+        for burst, start, length in zip(bursts, starts[batch_slice], batch_samples):
+            capture[start : start + length] = burst[:length]
+
+    if snr_db is not None:
+        std = noise_std(amplitude, snr_db)
+        # Noise in blocks so no capture sized float temporaries are made
+        block_size = batch_size * int(fs // BD) * 8 * 64
+        for block_start in range(0, capture_length, block_size):
+            add_noise(capture[block_start : block_start + block_size], std, rng)
+
+    return capture, starts
@@ -0,0 +1,340 @@
+"""
+Validation of demodulated ACARS frames.
+
+Every character from SOH to the ETX/ETB that ends the text carries an odd parity bit, and the two bytes after ETX/ETB
+are the block check sequence (BCS), a CRC-16/Kermit over the characters after SOH up to and including ETX/ETB.
+Frames have to be demodulated with `demod(..., strip_parity=False)` so the 8th bit of every byte is still there.
+
+Parity is checked first and frames that fail it are rejected before the CRC is computed. The CRC is table driven and
+computed for a batch of frames at once, one byte position at a time across every frame.
+
+Frames that fail can be corrected with the bit confidences from `demod(..., return_confidence=True)`. Characters that
+fail parity point at the suspect bits, the least confident of them are flipped in turn and the BCS confirms a fix.
+"""
+import itertools
+from collections.abc import Sequence
+from dataclasses import dataclass
+from enum import Enum
+
+import numpy as np
+
+import metrics
+
+SOH = 0x01
+ETX = 0x03
+ETB = 0x17
+
+# CRC-16/Kermit, the reflected CCITT polynomial with an initial value of 0
+CRC16_POLYNOMIAL = 0x8408
+
+# Number of correction candidates validated together
+CORRECTION_BATCH_SIZE = 64
+
+
+def _crc16_table(polynomial: int) -> np.ndarray[np.uint16]:
+    """
+    Build the byte at a time lookup table of a reflected CRC-16
+    :param polynomial: The reflected polynomial
+    :return: The CRC of every byte value
+    """
+    crc = np.arange(256, dtype=np.uint16)
+    for _ in range(8):
+        crc = np.where(crc & 1, (crc >> 1) ^ polynomial, crc >> 1).astype(np.uint16)
+    return crc
+
+
+CRC16_TABLE = _crc16_table(CRC16_POLYNOMIAL)
+
+# Whether each byte value has an odd number of set bits
+ODD_PARITY_TABLE = np.array([bin(value).count("1") % 2 == 1 for value in range(256)])
+
+# bytes.translate table that clears the parity bit
+STRIP_PARITY_TABLE = bytes(value & 0x7F for value in range(256))
+
+
+class FrameCheck(str, Enum):
+    VALID = "valid"
+    NO_FRAME = "no_frame"
+    PARITY = "parity"
+    BCS = "bcs"
+
+
+@dataclass
+class ValidationCounters:
+    frames: int = 0
+    valid: int = 0
+    no_frame: int = 0
+    parity_errors: int = 0
+    bcs_errors: int = 0
+    corrected: int = 0
+
+    def count(self, checks: Sequence[FrameCheck]) -> None:
+        """
+        Add the results of a batch of checks
+        :param checks: The result of every frame in the batch
+        """
+        self.frames += len(checks)
+        self.valid += checks.count(FrameCheck.VALID)
+        self.no_frame += checks.count(FrameCheck.NO_FRAME)
+        self.parity_errors += checks.count(FrameCheck.PARITY)
+        self.bcs_errors += checks.count(FrameCheck.BCS)
+
+    def count_from(self, other: "ValidationCounters") -> None:
+        """
+        Add the counts of another set of counters, to total the counters of separate workers
+        :param other: The counters to add
+        """
+        self.frames += other.frames
+        self.valid += other.valid
+        self.no_frame += other.no_frame
+        self.parity_errors += other.parity_errors
+        self.bcs_errors += other.bcs_errors
+        self.corrected += other.corrected
+
+
+def strip_parity(message: bytes | bytearray) -> bytearray:
+    """
+    Clear the parity bit of every character
+    :param message: A message demodulated with its parity bits
+    :return: The message as demod returns it by default
+    """
+    return bytearray(message).translate(STRIP_PARITY_TABLE)
+
+
+def frame_bounds(message: bytes | bytearray) -> tuple[int, int] | None:
+    """
+    Find the SOH and the ETX or ETB ending the text of a frame
+    :param message: A message demodulated with its parity bits
+    :return: The index of SOH and of ETX/ETB, None if the frame is incomplete
+    """
+    soh_index = message.find(SOH)
+    if soh_index == -1:
+        return None
+
+    # Search without the parity bits so a corrupted terminator is a parity error rather than a missing frame
+    characters = bytes(message).translate(STRIP_PARITY_TABLE)
+    end_indices = [index for index in (characters.find(ETX, soh_index), characters.find(ETB, soh_index)) if index != -1]
+    if not end_indices:
+        return None
+
+    # The two BCS bytes must follow
+    end_index = min(end_indices)
+    if end_index + 2 >= len(message):
+        return None
+
+    return soh_index, end_index
+
+
+def crc16(frames: np.ndarray[np.uint8], lengths: np.ndarray[np.intp]) -> np.ndarray[np.uint16]:
+    """
+    CRC-16/Kermit of a batch of byte strings
+    :param frames: The byte strings as the rows of a zero padded 2D array
+    :param lengths: The length of each row
+    :return: The CRC of every row. Rows ending in their own CRC, least significant byte first, give 0
+    """
+    frames = np.atleast_2d(frames)
+    crc = np.zeros(len(frames), dtype=np.uint16)
+
+    # One table lookup per byte position across every frame, rows that have ended keep their CRC
+    for position in range(frames.shape[1]):
+        updated = (crc >> 8) ^ CRC16_TABLE[(crc ^ frames[:, position]) & 0xFF]
+        crc = np.where(position < lengths, updated, crc)
+
+    return crc
+
+
+def validate_frames(
+    messages: Sequence[bytes | bytearray], counters: ValidationCounters | None = None
+) -> list[FrameCheck]:
+    """
+    Check the parity of every character and the BCS of a batch of frames
+    :param messages: Messages demodulated with their parity bits
+    :param counters: Counters to add the results to
+    :return: The result of every message
+    """
+    checks = [FrameCheck.NO_FRAME] * len(messages)
+    spans = []
+
+    for index, message in enumerate(messages):
+        bounds = frame_bounds(message)
+        if bounds is None:
+            continue
+
+        soh_index, end_index = bounds
+
+        # Parity covers SOH up to the terminator, cheap enough to reject on before the CRC
+        characters = np.frombuffer(bytes(message[soh_index : end_index + 1]), dtype=np.uint8)
+        if not ODD_PARITY_TABLE[characters].all():
+            checks[index] = FrameCheck.PARITY
+            continue
+
+        # The CRC covers the characters after SOH through the terminator and the BCS itself
+        spans.append((index, message[soh_index + 1 : end_index + 3]))
+
+    if spans:
+        lengths = np.array([len(span) for _, span in spans])
+        frames = np.zeros((len(spans), lengths.max()), dtype=np.uint8)
+        for row, (_, span) in enumerate(spans):
+            frames[row, : len(span)] = np.frombuffer(bytes(span), dtype=np.uint8)
+
+        residues = crc16(frames, lengths)
+        for (index, _), residue in zip(spans, residues):
+            checks[index] = FrameCheck.VALID if residue == 0 else FrameCheck.BCS
+
+    if counters is not None:
+        counters.count(checks)
+
+    return checks
+
+
+def validate_frame(message: bytes | bytearray, counters: ValidationCounters | None = None) -> FrameCheck:
+    """
+    Check the parity of every character and the BCS of a frame
+    :param message: A message demodulated with its parity bits
+    :param counters: Counters to add the result to
+    :return: The result of the check
+    """
+    return validate_frames([message], counters)[0]
+
+
+def _inverted_frame_end(message: bytes | bytearray, soh_index: int) -> int | None:
+    """
+    Find where the text of a frame whose tail was inverted by a wrong decision ends
+    :param message: A message demodulated with its parity bits
+    :param soh_index: The index of SOH
+    :return: The index of the ETX/ETB, None if it can't be found
+    """
+    # DEL is its own odd parity character, inverted it has every bit but the parity bit clear
+    del_index = message.find(0x7F ^ 0xFF, soh_index + 4)
+    if del_index == -1:
+        return None
+
+    # The terminator can be partly inverted itself, it is the character before the two BCS bytes
+    return del_index - 3
+
+
+def _suspect_bits(message: bytes | bytearray) -> tuple[np.ndarray[np.intp], np.ndarray[np.intp]] | None:
+    """
+    Find the bits of a frame that are likely wrong
+    :param message: A message demodulated with its parity bits
+    :return: The indices of the bits of the characters failing parity, and of every bit from after SOH to the end of
+        the BCS. None without a SOH to correct from
+    """
+    soh_index = message.find(SOH)
+    if soh_index == -1:
+        return None
+
+    bounds = frame_bounds(message)
+    end_index = bounds[1] if bounds is not None else _inverted_frame_end(message, soh_index)
+    characters = np.frombuffer(bytes(message[soh_index : (end_index or len(message) - 1) + 1]), dtype=np.uint8)
+    failing = np.flatnonzero(~ODD_PARITY_TABLE[characters]) + soh_index
+
+    if end_index is None:
+        # Past the first failing character the BCS and trailing bytes fail parity at random
+        failing = failing[:1]
+        end_index = len(message) - 1
+
+    # A wrong decision that inverts an even number of bits of a character, or an error in the BCS, passes parity
+    frame_bits = np.arange((soh_index + 1) * 8, min(end_index + 3, len(message)) * 8)
+
+    # A single wrong bit at the end of a character takes a flip at the start of the next one to correct
+    suspects = (failing[:, np.newaxis] * 8 + np.arange(9)).ravel()
+
+    return suspects[suspects < len(message) * 8], frame_bits
+
+
+def correct_frame(
+    message: bytes | bytearray,
+    confidence: np.ndarray,
+    max_flips: int = 2,
+    num_candidates: int = 12,
+    max_attempts: int = 256,
+) -> bytearray | None:
+    """
+    Correct a frame that fails validation by flipping its least confident decisions.
+
+    A wrong decision inverts every bit after it, so flipping the decision of a bit inverts the message from that bit
+    on. Two neighbouring flips correct a single bit. Flip patterns are tried in order of their total confidence, lowest
+    first, and the first that passes the parity and BCS checks is returned.
+    :param message: A message demodulated with its parity bits
+    :param confidence: The confidence of every bit of the message from demod(..., return_confidence=True)
+    :param max_flips: Most decisions flipped at once
+    :param num_candidates: Number of the least confident bits that are considered, first from the characters failing
+        parity then from the whole frame
+    :param max_attempts: Most flip patterns validated before giving up
+    :return: The corrected message with its parity bits, None if no correction was found
+    """
+    bits = np.unpackbits(np.frombuffer(bytes(message), dtype=np.uint8), bitorder="little")
+    confidence = np.asarray(confidence)[: len(bits)]
+
+    suspect_bits = _suspect_bits(message)
+    if suspect_bits is None:
+        return None
+
+    # Patterns over the parity suspects first, then over the whole frame for errors parity can't see
+    patterns = {}
+    for suspects in suspect_bits:
+        suspects = np.unique(suspects[suspects < len(confidence)])
+        candidates = suspects[np.argsort(confidence[suspects], kind="stable")][:num_candidates]
+        candidates = candidates[np.isfinite(confidence[candidates])]
+
+        # Cheapest patterns first
+        stage = [
+            pattern
+            for num_flips in range(1, max_flips + 1)
+            for pattern in itertools.combinations(candidates.tolist(), num_flips)
+        ]
+        costs = [confidence[list(pattern)].sum() for pattern in stage]
+        patterns.update(dict.fromkeys(stage[index] for index in np.argsort(costs, kind="stable")))
+
+    patterns = [list(pattern) for pattern in itertools.islice(patterns, max_attempts)]
+
+    for batch_start in range(0, len(patterns), CORRECTION_BATCH_SIZE):
+        batch = patterns[batch_start : batch_start + CORRECTION_BATCH_SIZE]
+
+        flips = np.zeros((len(batch), len(bits)), dtype=np.uint8)
+        for row, pattern in enumerate(batch):
+            flips[row, pattern] = 1
+
+        # Every flipped decision inverts the rest of the message
+        corrected_bits = bits ^ np.bitwise_xor.accumulate(flips, axis=-1)
+        corrected = np.packbits(corrected_bits.reshape(len(batch), -1, 8), axis=-1, bitorder="little")[..., 0]
+
+        checks = validate_frames([row.tobytes() for row in corrected])
+        if FrameCheck.VALID in checks:
+            return bytearray(corrected[checks.index(FrameCheck.VALID)].tobytes())
+
+    return None
+
+
+def filter_valid_frames(
+    messages: Sequence[bytes | bytearray],
+    counters: ValidationCounters | None = None,
+    confidences: Sequence[np.ndarray] | None = None,
+) -> list[bytearray]:
+    """
+    Drop the frames that fail validation
+    :param messages: Messages demodulated with their parity bits
+    :param counters: Counters to add the results to
+    :param confidences: Bit confidences of every message, frames that fail are corrected with them when given
+    :return: The valid messages with their parity bits stripped, ready for parse_acars_message
+    """
+    checks = validate_frames(messages, counters)
+
+    valid_messages = []
+    for index, (message, check) in enumerate(zip(messages, checks)):
+        if check != FrameCheck.VALID and confidences is not None:
+            message = correct_frame(message, confidences[index])
+            if message is None:
+                continue
+            if counters is not None:
+                counters.corrected += 1
+        elif check != FrameCheck.VALID:
+            continue
+
+        valid_messages.append(strip_parity(message))
+
+    metrics.count("frames_decoded", len(valid_messages))
+    metrics.count("frames_rejected", len(messages) - len(valid_messages))
+
+    return valid_messages
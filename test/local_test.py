@@ -4,14 +4,17 @@ import numpy as np
 
 import resampling
 from am_modulation.demod import am_rectified_async_demodulate
+from channelizer import channelize
 from decimation import decimate
-from filters.fir_filter import low_pass_filter
-from scipy.signal import resample
+from filters.fir_filter import filter_taps, low_pass_filter
 from scipy.io import wavfile
 
 from normalization import normalize_signal
 from plotting import plot_signal
-from src.acars import message_region_detection, ThresholdMethod, demod, parse_acars_message
+from readers import IQFormat, open_iq
+from resampling.multistage import resample_to
+from src.acars import message_region_detection, ThresholdMethod, demod, demod_batch, parse_acars_message
+from src.validation import FrameCheck, ValidationCounters, strip_parity, validate_frame
 
 # Symbol rate is always 2400 for ACARS
 BD = 2400
@@ -33,22 +36,23 @@ def process_gnu_radio_file():
     """
 
     acars_file_path = os.path.join("data", "GNU_RADIO", "gr-acars_1.152M_2.bin")
-    acars_samples = np.fromfile(acars_file_path, dtype=np.complex64)
-    fs = 1.152e6
+    iq_reader = open_iq(acars_file_path, fs=1.152e6, iq_format=IQFormat.COMPLEX64)
+    acars_samples = iq_reader.read()
+    fs = iq_reader.fs
 
     samples_per_symbol = int(fs / BD)
 
     # Need to use rectified demodulator
     demodulated_samples = am_rectified_async_demodulate(acars_samples)
 
+    # Low pass filter and decimate in one polyphase pass so only the kept samples are filtered
     # Experiment with cutoff 5-6 kHz
-    filtered_samples = low_pass_filter(demodulated_samples, cutoff=5.5e3, fs=fs)
-
-    plot_signal(filtered_samples, "Filtered Signal")
-
-    # Decimate
     decimated_samples, fs, samples_per_symbol = decimate(
-        filtered_samples, decimation_factor=8, fs=fs, samples_per_symbol=samples_per_symbol
+        demodulated_samples,
+        decimation_factor=8,
+        fs=fs,
+        samples_per_symbol=samples_per_symbol,
+        taps=filter_taps(cutoff=5.5e3, fs=fs),
     )
 
     plot_signal(decimated_samples, "Decimated Signal")
@@ -136,14 +140,12 @@ def process_sigid_file():
     """
 
     acars_file_path = os.path.join("data", "SIGID", "acars_IQ.wav")
-    fs, acars_samples = wavfile.read(acars_file_path)
 
-    # Extract the real and imaginary parts of the samples, since the file is split into two channels
-    real_part = acars_samples[:, 0]
-    imag_part = acars_samples[:, 1]
-
-    # Combine the real and imaginary parts into a single complex array
-    acars_samples = np.array(real_part + 1j * imag_part, dtype=np.complex64)
+    # The file is split into two channels, I and Q, the reader combines them into complex64
+    # Keep the raw int16 counts, the STD region detection threshold is tuned to them
+    iq_reader = open_iq(acars_file_path, scale=False)
+    acars_samples = iq_reader.read()
+    fs = iq_reader.fs
 
     # Need to use the rectified demodulator
     demodulated_samples = am_rectified_async_demodulate(acars_samples)
@@ -153,12 +155,8 @@ def process_sigid_file():
 
     new_fs = 48000
 
-    # The sample rate of the sigid file isn't a clean multiple of 48000Hz so need to use a different resample method
-    # Calculate new number of samples
-    new_num_samples = int(len(filtered_samples) * (new_fs / fs))
-
-    # Resample the data
-    resampled_samples = resample(filtered_samples, new_num_samples)
+    # The sample rate of the sigid file isn't a clean multiple of 48000Hz, the planner works out a cascade for any ratio
+    resampled_samples = resample_to(filtered_samples, fs, new_fs, passband=5.5e3)
 
     samples_per_symbol = int(new_fs / BD)
 
@@ -185,7 +183,70 @@ def process_sigid_file():
         write_binary(demod_message, f"sigid_acars{index}.demod")
 
 
+def process_wideband_file():
+    """
+    Function to quickly setup up demodulating every ACARS channel of a wideband capture
+    """
+
+    acars_file_path = os.path.join("data", "WIDEBAND", "acars_2.4M_131.3M.bin")
+    iq_reader = open_iq(acars_file_path, fs=2.4e6, iq_format=IQFormat.COMPLEX64)
+    acars_samples = iq_reader.read()
+    fs = iq_reader.fs
+    center_frequency = 131.3e6
+
+    # Split the capture into every ACARS channel it covers in one pass
+    channels, channel_fs = channelize(acars_samples, fs=fs, center_frequency=center_frequency)
+
+    new_fs = 48000
+    samples_per_symbol = int(new_fs / BD)
+    validation_counters = ValidationCounters()
+
+    for channel, channel_samples in channels.items():
+        # Need to use rectified demodulator
+        demodulated_samples = am_rectified_async_demodulate(channel_samples)
+
+        # Experiment with cutoff 5-6 kHz
+        filtered_samples = low_pass_filter(demodulated_samples, cutoff=5.5e3, fs=channel_fs)
+
+        # resample
+        resampled_samples, _ = resampling.resample(
+            filtered_samples, up=int(new_fs / 1e3), down=int(channel_fs / 1e3), samples_per_symbol=samples_per_symbol
+        )
+
+        message_regions = message_region_detection(
+            resampled_samples, threshold_method=ThresholdMethod.STD
+        )
+
+        # Extract and normalize every message using the indices detected, then demodulate them together
+        demod_messages = demod_batch(
+            [normalize_signal(resampled_samples[start:end]) for start, end in message_regions],
+            fs=new_fs,
+            samples_per_symbol=samples_per_symbol,
+            strip_parity=False,
+        )
+
+        for index, demod_message in enumerate(demod_messages):
+            if demod_message is None:
+                print(f"{channel / 1e6:.3f} MHz Rejected--->>: no sync")
+                continue
+
+            # Skip frames with parity or BCS errors rather than parsing noise
+            frame_check = validate_frame(demod_message, validation_counters)
+            if frame_check != FrameCheck.VALID:
+                print(f"{channel / 1e6:.3f} MHz Rejected--->>: {frame_check.value}")
+                continue
+            demod_message = strip_parity(demod_message)
+
+            meta_info = parse_acars_message(demod_message)
+            print(f"{channel / 1e6:.3f} MHz META--->>: {meta_info}")
+
+            write_binary(demod_message, f"wideband_acars_{channel / 1e3:.0f}_{index}.demod")
+
+    print(f"Validation--->>: {validation_counters}")
+
+
 def main():
+    process_wideband_file()
     process_sigid_file()
     process_wikipedia_file()
     process_gnu_radio_file()
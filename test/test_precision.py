@@ -0,0 +1,107 @@
+"""
+SINGLE precision decodes the same messages as DOUBLE, on bursts synthesized with src.synthesis.
+"""
+import numpy as np
+import pytest
+
+from am_modulation.demod import am_rectified_async_demodulate
+from filters.fir_filter import filter_taps, low_pass_filter
+from precision import Precision
+from src.acars import AcarsMessage, demod
+from src.batch import decode_samples
+from src.synthesis import synthesize_bursts, synthesize_capture
+
+# Sample rate the audio is demodulated at
+AUDIO_FS = 48000.0
+
+# Carrier amplitude in int16 counts, the scale the STD region detection threshold is tuned to
+CARRIER_AMPLITUDE = 3000.0
+
+# Largest difference between the SINGLE and DOUBLE bit confidences, relative to the largest DOUBLE confidence of the
+# burst. float32 rounding puts it around 5e-7, the bound leaves room for other inputs
+CONFIDENCE_TOLERANCE = 1e-5
+
+
+def _messages(num_messages: int) -> list[AcarsMessage]:
+    """
+    Downlink messages with varying registrations, sequences and texts
+    """
+    return [
+        AcarsMessage(
+            mode="2",
+            registration=f".N{index:05d}",
+            ack="\x15",
+            label="H1",
+            block_id="1",
+            stx=True,
+            sequence=f"M{index:02d}A",
+            flight=f"AB{index:04d}",
+            text=f"PRECISION TEST {index} THE QUICK BROWN FOX",
+        )
+        for index in range(num_messages)
+    ]
+
+
+@pytest.mark.parametrize("snr_db", [None, 30.0, 15.0])
+def test_demod_single_matches_double(snr_db):
+    num_messages = 8
+    rng = np.random.default_rng(0)
+    bursts, num_samples = synthesize_bursts(
+        _messages(num_messages),
+        AUDIO_FS,
+        amplitude=CARRIER_AMPLITUDE,
+        frequency_offset=rng.uniform(-20, 20, num_messages),
+        drift=rng.uniform(-1e-4, 1e-4, num_messages),
+        snr_db=snr_db,
+        rng=rng,
+    )
+
+    for burst, length in zip(bursts, num_samples):
+        audio = am_rectified_async_demodulate(burst[:length], precision=Precision.DOUBLE)
+        single, single_confidence = demod(audio, AUDIO_FS, return_confidence=True, precision=Precision.SINGLE)
+        double, double_confidence = demod(audio, AUDIO_FS, return_confidence=True, precision=Precision.DOUBLE)
+
+        assert single == double
+        assert len(double) > 0
+
+        # Bits that weren't decided are infinitely confident in both
+        decided = np.isfinite(double_confidence)
+        np.testing.assert_array_equal(decided, np.isfinite(single_confidence))
+        difference = np.abs(single_confidence[decided] - double_confidence[decided])
+        assert difference.max() <= CONFIDENCE_TOLERANCE * double_confidence[decided].max()
+
+
+def test_decode_samples_single_matches_double():
+    messages = _messages(12)
+    capture, _ = synthesize_capture(
+        messages, AUDIO_FS, amplitude=CARRIER_AMPLITUDE, frequency_offset=5.0, drift=5e-5, snr_db=77.0, rng=1
+    )
+
+    single, single_errors = decode_samples(capture, AUDIO_FS, precision=Precision.SINGLE)
+    double, double_errors = decode_samples(capture, AUDIO_FS, precision=Precision.DOUBLE)
+
+    assert single == double
+    assert single_errors == double_errors == 0
+    assert [message.text for message in double] == [message.text for message in messages]
+
+
+def test_double_low_pass_filter_has_float64_taps():
+    signal = np.random.default_rng(0).standard_normal(20000)
+    taps = filter_taps(5.5e3, AUDIO_FS, precision=Precision.DOUBLE)
+    single_taps = filter_taps(5.5e3, AUDIO_FS, precision=Precision.SINGLE)
+
+    assert taps.dtype == np.float64
+    assert single_taps.dtype == np.float32
+    assert np.sum(taps) == pytest.approx(1.0, abs=1e-15)
+    # The double taps aren't the single ones widened
+    assert np.any(taps != single_taps.astype(np.float64))
+
+    filtered = low_pass_filter(signal, 5.5e3, AUDIO_FS, precision=Precision.DOUBLE)
+    np.testing.assert_allclose(filtered, np.convolve(signal, taps, mode="same"), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64, np.complex64, np.complex128])
+def test_low_pass_filter_keeps_the_input_precision(dtype):
+    signal = np.random.default_rng(0).standard_normal(1000).astype(dtype)
+
+    assert low_pass_filter(signal, 5.5e3, AUDIO_FS).dtype == dtype
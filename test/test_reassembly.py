@@ -0,0 +1,126 @@
+"""
+ReassemblyTable stitches numbered downlink blocks and passes everything else straight back.
+"""
+import pytest
+
+from src.acars import AcarsMessage, parse_acars_record
+from src.reassembly import ReassemblyTable
+
+# Bytes demod leaves before the SOH
+PREKEY = b"\xff\xff\x16\x16"
+
+# Stand-in block check sequence, the parser doesn't look at it
+BCS = b"\x0c\x5f"
+
+
+def _block(sequence: str, text: str, final_block: bool) -> AcarsMessage:
+    """
+    A downlink block with a message number
+    """
+    return AcarsMessage(
+        mode="2",
+        registration=".N12345",
+        ack="\x15",
+        label="H1",
+        block_id="1",
+        stx=True,
+        sequence=sequence,
+        flight="AB0001",
+        text=text,
+        final_block=final_block,
+    )
+
+
+def _parse(body: bytes) -> AcarsMessage:
+    """
+    Parse a frame from the mode to the ETX or ETB
+    """
+    return parse_acars_record(PREKEY + b"\x01" + body + BCS + b"\x7f")
+
+
+def test_single_block_comes_straight_back():
+    table = ReassemblyTable()
+    message = _block("M01A", "HELLO", True)
+
+    assert table.add(message, 0.0) is message
+    assert len(table) == 0
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        # Uplinks carry no message number, the sequence is the start of the text
+        b"2.N12345AH1A\x02REQUEST POSITION\x03",
+        # Frames without STX have no sequence field at all
+        b"2.N12345\x15_d1\x03",
+        # Uplinks can span blocks, without a message number they can't be stitched
+        b"2.N12345AH1A\x02REQUEST POSITION\x17",
+    ],
+)
+def test_blocks_without_a_message_number_come_straight_back(body):
+    table = ReassemblyTable()
+    message = _parse(body)
+
+    assert table.add(message, 0.0) is message
+    assert len(table) == 0
+    assert table.counters.orphaned == 0
+
+
+def test_blocks_are_stitched_in_order():
+    table = ReassemblyTable()
+
+    assert table.add(_block("M02A", "FIRST ", False), 0.0) is None
+    assert table.add(_block("M02B", "SECOND ", False), 1.0) is None
+    whole_message = table.add(_block("M02C", "THIRD", True), 2.0)
+
+    assert whole_message.text == "FIRST SECOND THIRD"
+    assert table.counters.completed == 1
+    assert len(table) == 0
+
+
+def test_duplicates_are_counted_and_ignored():
+    table = ReassemblyTable()
+
+    assert table.add(_block("M03A", "FIRST ", False), 0.0) is None
+    assert table.add(_block("M03A", "FIRST ", False), 1.0) is None
+    whole_message = table.add(_block("M03B", "SECOND", True), 2.0)
+
+    assert whole_message.text == "FIRST SECOND"
+    assert table.counters.duplicates == 1
+
+
+def test_gap_drops_the_message_and_is_counted_once():
+    table = ReassemblyTable()
+
+    assert table.add(_block("M04A", "FIRST ", False), 0.0) is None
+    assert table.add(_block("M04C", "THIRD", True), 1.0) is None
+
+    assert table.counters.out_of_sequence == 1
+    assert table.counters.orphaned == 0
+    assert table.counters.completed == 0
+    assert len(table) == 0
+
+
+def test_restart_after_a_gap_starts_a_new_message():
+    table = ReassemblyTable()
+
+    assert table.add(_block("M05A", "OLD ", False), 0.0) is None
+    assert table.add(_block("M05A", "NEW ", False), 1.0) is None
+    assert table.counters.duplicates == 1
+
+    assert table.add(_block("M05C", "LOST", False), 2.0) is None
+    assert table.add(_block("M05A", "FIRST ", False), 3.0) is None
+    whole_message = table.add(_block("M05B", "SECOND", True), 4.0)
+
+    assert whole_message.text == "FIRST SECOND"
+    assert table.counters.out_of_sequence == 1
+
+
+def test_orphan_blocks_are_counted_and_dropped():
+    table = ReassemblyTable()
+
+    assert table.add(_block("M06B", "SECOND ", False), 0.0) is None
+    assert table.add(_block("M07C", "THIRD", True), 1.0) is None
+
+    assert table.counters.orphaned == 2
+    assert len(table) == 0
@@ -0,0 +1,39 @@
+"""
+resample_to lines its output up with the input like resample_poly, whatever stages the cascade is planned with.
+"""
+import numpy as np
+import pytest
+
+from resampling.multistage import plan_resampling, resample_to
+
+# Sample rate the audio is resampled to
+AUDIO_FS = 48000.0
+
+# Frequency of the test tone
+TONE = 1000.0
+
+
+@pytest.mark.parametrize("fs", [96000.0, 1.152e6, 2.4e6, 2.048e6, 250000.0, 44100.0, 960000.0, 3.2e6, 1.2e7])
+def test_resample_to_leaves_no_delay(fs):
+    plan = plan_resampling(fs, AUDIO_FS, 5.5e3)
+    assert plan.delay * AUDIO_FS == pytest.approx(round(plan.delay * AUDIO_FS), abs=1e-9)
+
+    signal = np.sin(2 * np.pi * TONE * np.arange(int(0.05 * fs)) / fs)
+    resampled = resample_to(signal, fs, AUDIO_FS, 5.5e3)
+    assert len(resampled) == int(np.ceil(len(signal) * AUDIO_FS / fs))
+
+    # Phase of the tone away from the edges against a tone sampled at the output rate
+    middle = np.arange(len(resampled) // 4, 3 * len(resampled) // 4)
+    phasor = np.exp(-2j * np.pi * TONE * middle / AUDIO_FS)
+    phase = np.angle(np.sum(resampled[middle] * phasor) / np.sum(np.sin(2 * np.pi * TONE * middle / AUDIO_FS) * phasor))
+    assert abs(phase / (2 * np.pi * TONE) * AUDIO_FS) < 1e-3
+
+
+def test_lead_survives_blocks_and_flush():
+    signal = np.random.default_rng(0).standard_normal(100000)
+    resampler = plan_resampling(1.152e6, AUDIO_FS, 5.5e3).resampler()
+
+    whole = np.concatenate((resampler.process(signal), resampler.flush()))
+    blocks = np.concatenate([resampler.process(block) for block in np.array_split(signal, 37)] + [resampler.flush()])
+
+    np.testing.assert_allclose(blocks, whole, rtol=1e-12, atol=1e-12)
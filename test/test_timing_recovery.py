@@ -0,0 +1,99 @@
+"""
+The vectorized symbol timing recovery makes the same bit decisions as the per symbol reference loop.
+"""
+import numpy as np
+import pytest
+
+from am_modulation.demod import am_rectified_async_demodulate
+from precision import Precision
+from src.acars import AcarsMessage, TimingRecovery, _synchronize_and_extract_bits, demod
+from src.synthesis import synthesize_bursts
+
+# Sample rate the audio is demodulated at
+AUDIO_FS = 48000.0
+
+# Number of random track pairs compared
+NUM_TRACKS = 400
+
+# Length of the moving sum that smooths the noise into peaks a symbol or so wide
+SMOOTHING = 15
+
+
+def _sync(fh_signal: np.ndarray, fl_signal: np.ndarray, timing_recovery: TimingRecovery):
+    """
+    Bits and margins of a pair of tracks, or the type of the exception synchronizing them raised
+    """
+    try:
+        return _synchronize_and_extract_bits(fh_signal, fl_signal, timing_recovery=timing_recovery, return_margins=True)
+    except (IndexError, StopIteration, ValueError) as error:
+        return type(error)
+
+
+def test_vectorized_matches_reference_on_smoothed_noise():
+    rng = np.random.default_rng(0)
+    compared = 0
+
+    for _ in range(NUM_TRACKS):
+        num_samples = int(rng.integers(300, 8000))
+        tracks = [
+            np.abs(np.convolve(rng.normal(size=num_samples), np.ones(SMOOTHING), mode="same")) for _ in range(2)
+        ]
+        fh_signal, fl_signal = (track / track.max() for track in tracks)
+
+        reference = _sync(fh_signal, fl_signal, TimingRecovery.REFERENCE)
+        vectorized = _sync(fh_signal, fl_signal, TimingRecovery.VECTORIZED)
+
+        if reference is IndexError:
+            # The loop overran its bits array or read past the end of the signal. The vectorized version drops the
+            # decisions that don't fit in the first case and raises a ValueError in the second
+            assert vectorized is ValueError or not isinstance(vectorized, type)
+            continue
+        if reference is StopIteration:
+            # Never dropped below half the FH peak
+            assert vectorized is ValueError
+            continue
+
+        assert not isinstance(vectorized, type)
+        np.testing.assert_array_equal(vectorized[0], reference[0])
+        np.testing.assert_array_equal(vectorized[1], reference[1])
+        compared += 1
+
+    # Most tracks have to be compared for the test to mean anything
+    assert compared >= NUM_TRACKS // 2
+
+
+@pytest.mark.parametrize("snr_db", [None, 20.0, 10.0])
+def test_vectorized_matches_reference_on_bursts(snr_db):
+    num_messages = 6
+    rng = np.random.default_rng(1)
+    messages = [
+        AcarsMessage(
+            mode="2",
+            registration=f".N{index:05d}",
+            ack="\x15",
+            label="H1",
+            block_id="1",
+            stx=True,
+            sequence=f"M{index:02d}A",
+            flight=f"AB{index:04d}",
+            text=f"TIMING TEST {index}",
+        )
+        for index in range(num_messages)
+    ]
+    bursts, num_samples = synthesize_bursts(
+        messages,
+        AUDIO_FS,
+        amplitude=3000.0,
+        frequency_offset=rng.uniform(-20, 20, num_messages),
+        drift=rng.uniform(-2e-4, 2e-4, num_messages),
+        snr_db=snr_db,
+        rng=rng,
+    )
+
+    for burst, length in zip(bursts, num_samples):
+        audio = am_rectified_async_demodulate(burst[:length], precision=Precision.DOUBLE)
+        reference = demod(audio, AUDIO_FS, timing_recovery=TimingRecovery.REFERENCE, return_confidence=True)
+        vectorized = demod(audio, AUDIO_FS, timing_recovery=TimingRecovery.VECTORIZED, return_confidence=True)
+
+        assert vectorized[0] == reference[0]
+        np.testing.assert_array_equal(vectorized[1], reference[1])